@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/2.0/ref/settings/
 """
 
 import os
+import tempfile
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -49,6 +50,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'planner.middleware.ViewLabelMiddleware',
 ]
 
 ROOT_URLCONF = 'hikeplanner.urls'
@@ -97,3 +99,54 @@ STATICFILES_DIRS = [
 
 LOGIN_REDIRECT_URL = '/'
 LOGOUT_REDIRECT_URL = '/accounts/login/'
+
+# Google Distance Matrix API response cache (planner.DistanceMatrixCache)
+# coordinates are rounded to this many decimals for the cache key (4 ~ 11 m)
+DISTANCE_CACHE_PRECISION = 4
+# cached drive times older than this are evicted and requested again
+DISTANCE_CACHE_TTL_DAYS = 90
+
+# external API requests of detail pages run concurrently on a shared pool
+# (planner.PlannerUtils.concurrentFetch); each waits at most this many seconds
+EXTERNAL_API_TIMEOUT = 5
+EXTERNAL_API_WORKERS = 16
+
+# HTTP requests to external APIs (planner.PlannerUtils.httpClient) reuse
+# pooled keep-alive connections per host; connect/read timeouts in seconds,
+# and retries of failed connections and 502/503/504 responses
+EXTERNAL_API_CONNECT_TIMEOUT = 3.05
+EXTERNAL_API_READ_TIMEOUT = 10
+EXTERNAL_API_RETRIES = 2
+
+# external API calls slower than this many seconds are logged with the view
+# that made them (planner.PlannerUtils.apiMetrics, metrics at /metrics)
+EXTERNAL_API_SLOW_SECONDS = 1
+
+# calls to an external API fail immediately for COOLDOWN seconds after
+# FAILURES failed calls within WINDOW seconds, then one probe call is sent
+# (planner.PlannerUtils.circuitBreaker)
+EXTERNAL_API_BREAKER_FAILURES = 5
+EXTERNAL_API_BREAKER_WINDOW = 60
+EXTERNAL_API_BREAKER_COOLDOWN = 30
+
+# autocomplete views search per-process name indexes
+# (planner.PlannerUtils.nameIndex), rebuilt when the names change and, for
+# changes made without model signals, when older than this many seconds
+NAME_INDEX_MAX_AGE = 300
+
+# NOAA forecasts are cached per forecast grid cell in the "forecast" cache
+# (planner.PlannerUtils.forecastCache). The file backend is shared by all
+# processes on a machine; the lookups run on the concurrentFetch pool, so
+# use a backend without database access.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'forecast': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(tempfile.gettempdir(),
+                                 'hikeplanner_forecast_cache'),
+        'OPTIONS': {'MAX_ENTRIES': 5000},
+    },
+}
+FORECAST_CACHE_ALIAS = 'forecast'
@@ -1,8 +1,10 @@
 """ This module provides access to external web APIs """
-import requests
-from requests.exceptions import HTTPError, SSLError
+from requests.exceptions import RequestException, SSLError
+from . import apiMetrics, circuitBreaker, httpClient
 
 
+@apiMetrics.instrument("google_distance_matrix")
+@circuitBreaker.protect("google_distance_matrix", "Google Distance Matrix API")
 def googleMapsDistanceAPI(requestURL):
     """
     Sends API request to Google Directions Matrix API and returns json results
@@ -11,29 +13,40 @@ def googleMapsDistanceAPI(requestURL):
 
     # make sure the URL call does not throw an error
     try:
-        apiCall = requests.get(requestURL)
-    except HTTPError:
+        apiCall = httpClient.get(requestURL)
+    except SSLError:
         # i.e. CERTIFICATE_VERIFY_FAILED error
         # Create dictionary for view to parse wtih error information
         apiObj = {}
-        apiObj["status"] = "HTTP_ERROR"
-        apiObj["message"] = "HTTP error accessing Google Distance Matrix API."
+        apiObj["status"] = "SSL_ERROR"
+        apiObj["message"] = "SSL error accessing Google Distance Matrix API."
 
         response = apiObj
-    except SSLError:
-        # i.e. CERTIFICATE_VERIFY_FAILED error
+    except RequestException:
+        # i.e. timeout, connection refused
         # Create dictionary for view to parse wtih error information
         apiObj = {}
-        apiObj["status"] = "SSL_ERROR"
-        apiObj["message"] = "SSL error accessing Google Distance Matrix API."
+        apiObj["status"] = "HTTP_ERROR"
+        apiObj["message"] = "HTTP error accessing Google Distance Matrix API."
 
         response = apiObj
     else:
-        response = apiCall.json()
+        try:
+            response = apiCall.json()
+        except ValueError:
+            # i.e. HTML error page of a 5xx response (retries exhausted)
+            apiObj = {}
+            apiObj["status"] = "HTTP_ERROR"
+            apiObj["message"] = "HTTP error accessing Google Distance Matrix API."
+            apiObj["http_status"] = apiCall.status_code
+
+            response = apiObj
 
     return response
 
 
+@apiMetrics.instrument("google_time_zone")
+@circuitBreaker.protect("google_time_zone", "Google Time Zone API")
 def googleTimeZoneAPI(requestURL):
     """
     Sends API request to Google Time Zone API and returns json results
@@ -42,54 +55,87 @@ def googleTimeZoneAPI(requestURL):
 
     # make sure the URL call does not throw an error
     try:
-        apiCall = requests.get(requestURL)
-    except HTTPError:
+        apiCall = httpClient.get(requestURL)
+    except SSLError:
         # i.e. CERTIFICATE_VERIFY_FAILED error
         # Create dictionary for view to parse wtih error information
         apiObj = {}
-        apiObj["status"] = "HTTP_ERROR"
-        apiObj["message"] = "HTTP error accessing Google Time Zone API."
+        apiObj["status"] = "SSL_ERROR"
+        apiObj["message"] = "SSL error accessing Google Time Zone API."
 
         response = apiObj
-    except SSLError:
-        # i.e. CERTIFICATE_VERIFY_FAILED error
+    except RequestException:
+        # i.e. timeout, connection refused
         # Create dictionary for view to parse wtih error information
         apiObj = {}
-        apiObj["status"] = "SSL_ERROR"
-        apiObj["message"] = "SSL error accessing Google Time Zone API."
+        apiObj["status"] = "HTTP_ERROR"
+        apiObj["message"] = "HTTP error accessing Google Time Zone API."
 
         response = apiObj
     else:
-        response = apiCall.json()
+        try:
+            response = apiCall.json()
+        except ValueError:
+            # i.e. HTML error page of a 5xx response (retries exhausted)
+            apiObj = {}
+            apiObj["status"] = "HTTP_ERROR"
+            apiObj["message"] = "HTTP error accessing Google Time Zone API."
+            apiObj["http_status"] = apiCall.status_code
+
+            response = apiObj
 
     return response
 
 
-def NOAA_API(requestURL):
+@apiMetrics.instrument("noaa")
+@circuitBreaker.protect("noaa", "NOAA forecast API")
+def NOAA_API(requestURL, session=None):
     """
     Sends API request to NOAA forecast API and returns json results
-    in python object format
+    in python object format. Uses the shared httpClient session unless a
+    requests.Session is given.
     """
 
     # make sure the URL call does not throw an error
     try:
-        apiCall = requests.get(requestURL)
+        apiCall = httpClient.get(requestURL, session=session)
 
-    except HTTPError:
-        # i.e. CERTIFICATE_VERIFY_FAILED error
+    except RequestException:
+        # i.e. timeout, connection refused, CERTIFICATE_VERIFY_FAILED error
         # Create dictionary for view to parse wtih error information
         apiObj = {}
         apiObj["status"] = "HTTP_ERROR"
         apiObj["message"] = "HTTP error accessing NOAA forecast API."
 
     else:
-        apiObj = apiCall.json()
-        apiObj["status"] = "OK"
-        apiObj["message"] = ""
+        try:
+            apiObj = apiCall.json()
+        except ValueError:
+            # i.e. HTML error page of a 5xx response (retries exhausted)
+            apiObj = {}
+            apiObj["status"] = "HTTP_ERROR"
+            apiObj["message"] = "HTTP error accessing NOAA forecast API."
+            apiObj["http_status"] = apiCall.status_code
+            return apiObj
+
+        if apiCall.ok:
+            apiObj["status"] = "OK"
+            apiObj["message"] = ""
+        else:
+            # NOAA errors are JSON problem details with a "detail" message
+            apiObj["status"] = "HTTP_ERROR"
+            apiObj["message"] = apiObj.get("detail",
+                                "HTTP error accessing NOAA forecast API.")
+            apiObj["http_status"] = apiCall.status_code
+        # caching headers, see forecastCache
+        apiObj["expires"] = apiCall.headers.get("Expires")
+        apiObj["cache_control"] = apiCall.headers.get("Cache-Control")
 
     return apiObj
 
 
+@apiMetrics.instrument("sunrise_sunset")
+@circuitBreaker.protect("sunrise_sunset", "Sunrise/sunset API")
 def sunriseSunset_API(requestURL):
     """
     Sends API request to sunrise-sunset API and returns json results
@@ -98,19 +144,26 @@ def sunriseSunset_API(requestURL):
 
     # make sure the URL call does not throw an error
     try:
-        apiCall = requests.get(requestURL)
+        apiCall = httpClient.get(requestURL)
 
-    except HTTPError:
-        # i.e. CERTIFICATE_VERIFY_FAILED error
+    except RequestException:
+        # i.e. timeout, connection refused, CERTIFICATE_VERIFY_FAILED error
         # Create dictionary for view to parse wtih error information
         apiObj = {}
         apiObj["status"] = "HTTP_ERROR"
         apiObj["message"] = "HTTP error accessing sunrise/sunset API."
 
-        response = apiObj
-
     else:
-        apiObj = apiCall.json()
+        try:
+            apiObj = apiCall.json()
+        except ValueError:
+            # i.e. HTML error page of a 5xx response (retries exhausted)
+            apiObj = {}
+            apiObj["status"] = "HTTP_ERROR"
+            apiObj["message"] = "HTTP error accessing sunrise/sunset API."
+            apiObj["http_status"] = apiCall.status_code
+            return apiObj
+
         # apiObj returns with "status" and "results" properties
         api_status = apiObj.get("status")
 
@@ -122,4 +175,4 @@ def sunriseSunset_API(requestURL):
             # "UNKNOWN ERROR"
             apiObj["message"] = "Sunrise/sunset times unavailable."
 
-        return apiObj
+    return apiObj
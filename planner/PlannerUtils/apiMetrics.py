@@ -0,0 +1,164 @@
+"""
+This module records latency, status and response size of the external API
+calls (accessAPI functions), per upstream, and renders them in the
+Prometheus text format. Calls slower than settings.EXTERNAL_API_SLOW_SECONDS
+are logged with the view that made them.
+
+Metrics are kept in memory per process: each web worker reports its own
+calls since it started.
+"""
+from django.conf import settings
+import contextvars
+import functools
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# latency histogram upper bounds [s]
+BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# default slow call threshold [s], see settings
+DEFAULT_SLOW_SECONDS = 1
+
+# view (URL name) of the current request, set by
+# planner.middleware.ViewLabelMiddleware and copied to concurrentFetch
+# threads; response bytes (decompressed) of the current call on each thread
+current_view = contextvars.ContextVar("current_view", default=None)
+_call_bytes = threading.local()
+
+_lock = threading.Lock()
+_upstreams = {}
+
+
+def instrument(upstream):
+    """
+    Decorator for accessAPI functions: records each call's latency, the
+    "status" of the returned dict, and the response bytes (decompressed,
+    reported by httpClient through addBytes()) under the "upstream" label.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            _call_bytes.count = 0
+            start = time.perf_counter()
+            status = "EXCEPTION"
+            try:
+                response = func(*args, **kwargs)
+                if isinstance(response, dict):
+                    status = response.get("status") or "NO_STATUS"
+                else:
+                    status = "NO_STATUS"
+                return response
+            finally:
+                record(upstream, time.perf_counter() - start, status,
+                       _call_bytes.count)
+                _call_bytes.count = None
+        return wrapper
+    return decorator
+
+
+def addBytes(num_bytes):
+    """
+    Adds to the bytes received by the instrumented call running on this
+    thread (ignored outside of one).
+    """
+    if getattr(_call_bytes, "count", None) is not None:
+        _call_bytes.count += num_bytes
+
+
+def record(upstream, seconds, status, num_bytes=0):
+    """
+    Records one call to "upstream", and logs it if it was slow.
+    """
+    with _lock:
+        stats = _upstreams.get(upstream)
+        if stats is None:
+            stats = {
+                "buckets": [0] * len(BUCKETS),
+                "count": 0,
+                "sum": 0.0,
+                "bytes": 0,
+                "statuses": {},
+            }
+            _upstreams[upstream] = stats
+
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                stats["buckets"][i] += 1
+        stats["count"] += 1
+        stats["sum"] += seconds
+        stats["bytes"] += num_bytes
+        stats["statuses"][status] = stats["statuses"].get(status, 0) + 1
+
+    slow = getattr(settings, "EXTERNAL_API_SLOW_SECONDS",
+                   DEFAULT_SLOW_SECONDS)
+    if seconds > slow:
+        logger.warning("Slow %s call: %.2f s, status %s, view %s", upstream,
+                       seconds, status, current_view.get() or "-")
+
+
+def getStats():
+    """
+    Returns a copy of the recorded metrics: dict of upstream --> dict with
+    'buckets' (cumulative counts per BUCKETS bound), 'count', 'sum' [s],
+    'bytes' and 'statuses' (status --> count).
+    """
+    with _lock:
+        return {upstream: dict(stats, buckets=list(stats["buckets"]),
+                               statuses=dict(stats["statuses"]))
+                for upstream, stats in _upstreams.items()}
+
+
+def resetStats():
+    """
+    Deletes all recorded metrics.
+    """
+    with _lock:
+        _upstreams.clear()
+
+
+def renderPrometheus():
+    """
+    Returns the metrics in the Prometheus text exposition format.
+    """
+    lines = [
+        "# HELP external_api_request_seconds External API call latency.",
+        "# TYPE external_api_request_seconds histogram",
+    ]
+    stats = getStats()
+    for upstream in sorted(stats):
+        s = stats[upstream]
+        for bound, count in zip(BUCKETS, s["buckets"]):
+            lines.append('external_api_request_seconds_bucket'
+                         '{{upstream="{0}",le="{1}"}} {2}'.format(
+                            upstream, bound, count))
+        lines.append('external_api_request_seconds_bucket'
+                     '{{upstream="{0}",le="+Inf"}} {1}'.format(upstream,
+                                                               s["count"]))
+        lines.append('external_api_request_seconds_sum{{upstream="{0}"}} '
+                     '{1:.6f}'.format(upstream, s["sum"]))
+        lines.append('external_api_request_seconds_count{{upstream="{0}"}} '
+                     '{1}'.format(upstream, s["count"]))
+
+    lines += [
+        "# HELP external_api_responses_total External API calls by status.",
+        "# TYPE external_api_responses_total counter",
+    ]
+    for upstream in sorted(stats):
+        for status, count in sorted(stats[upstream]["statuses"].items()):
+            lines.append('external_api_responses_total'
+                         '{{upstream="{0}",status="{1}"}} {2}'.format(
+                            upstream, status, count))
+
+    lines += [
+        "# HELP external_api_received_bytes_total External API response "
+        "body bytes (decompressed).",
+        "# TYPE external_api_received_bytes_total counter",
+    ]
+    for upstream in sorted(stats):
+        lines.append('external_api_received_bytes_total{{upstream="{0}"}} '
+                     '{1}'.format(upstream, stats[upstream]["bytes"]))
+
+    return "\n".join(lines) + "\n"
+
@@ -0,0 +1,158 @@
+"""
+This module provides per-upstream circuit breakers for the external API
+calls. After settings.EXTERNAL_API_BREAKER_FAILURES failed calls within
+EXTERNAL_API_BREAKER_WINDOW seconds, calls to the upstream fail immediately
+for EXTERNAL_API_BREAKER_COOLDOWN seconds (open). Then a single probe call is
+let through (half-open): it closes the breaker if it succeeds, and opens it
+again if it fails.
+
+Breakers are kept in memory per process.
+"""
+from django.conf import settings
+import functools
+import threading
+import time
+
+# default failure threshold, failure window [s] and cool-down [s]
+DEFAULT_FAILURES = 5
+DEFAULT_WINDOW = 60
+DEFAULT_COOLDOWN = 30
+
+CLOSED = "CLOSED"
+OPEN = "OPEN"
+HALF_OPEN = "HALF_OPEN"
+
+# accessAPI statuses that count as failures of the upstream (server errors
+# and connection problems, not rejected requests or missing data)
+FAILURE_STATUSES = ["HTTP_ERROR", "SSL_ERROR"]
+# status of the error dict returned while the breaker is open
+OPEN_STATUS = "CIRCUIT_OPEN"
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+class CircuitBreaker:
+    """
+    Thread-safe circuit breaker of one upstream.
+
+    INPUTS:
+    failures (int): failed calls within "window" that open the breaker
+    window (float): seconds over which failures are counted
+    cooldown (float): seconds the breaker stays open before a probe
+    """
+
+    def __init__(self, failures=DEFAULT_FAILURES, window=DEFAULT_WINDOW,
+                 cooldown=DEFAULT_COOLDOWN):
+        self.failures = failures
+        self.window = window
+        self.cooldown = cooldown
+        self.state = CLOSED
+        self._failure_times = []
+        self._opened_at = None
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """
+        Returns True if a call may be made now. In the half-open state only
+        one caller (the probe) gets True until its result is recorded.
+        """
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if (self.state == OPEN and
+                    time.monotonic() - self._opened_at >= self.cooldown):
+                self.state = HALF_OPEN
+                return True
+            return False
+
+    def recordSuccess(self):
+        with self._lock:
+            self.state = CLOSED
+            self._failure_times = []
+
+    def recordFailure(self):
+        with self._lock:
+            now = time.monotonic()
+            if self.state == HALF_OPEN:
+                # the probe failed
+                self._open(now)
+                return
+
+            self._failure_times = [t for t in self._failure_times
+                                   if now - t < self.window] + [now]
+            if len(self._failure_times) >= self.failures:
+                self._open(now)
+
+    def _open(self, now):
+        self.state = OPEN
+        self._opened_at = now
+        self._failure_times = []
+
+
+def getBreaker(upstream):
+    """
+    Returns the circuit breaker of "upstream", created on first use with the
+    thresholds from the settings.
+    """
+    with _breakers_lock:
+        breaker = _breakers.get(upstream)
+        if breaker is None:
+            breaker = CircuitBreaker(
+                failures=getattr(settings, "EXTERNAL_API_BREAKER_FAILURES",
+                                 DEFAULT_FAILURES),
+                window=getattr(settings, "EXTERNAL_API_BREAKER_WINDOW",
+                               DEFAULT_WINDOW),
+                cooldown=getattr(settings, "EXTERNAL_API_BREAKER_COOLDOWN",
+                                 DEFAULT_COOLDOWN))
+            _breakers[upstream] = breaker
+    return breaker
+
+
+def resetBreakers():
+    """
+    Forgets all breakers (all upstreams start closed).
+    """
+    with _breakers_lock:
+        _breakers.clear()
+
+
+def protect(upstream, name):
+    """
+    Decorator for accessAPI functions: while the upstream's breaker is open,
+    returns {"status": OPEN_STATUS, "message": ...} without calling the API.
+    Returned dicts with a FAILURE_STATUSES status (except HTTP 4xx
+    responses, which are the request's fault) and exceptions count as
+    failures; anything else as a success. "name" is used in the message.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            breaker = getBreaker(upstream)
+            if not breaker.allow():
+                return {
+                    "status": OPEN_STATUS,
+                    "message": name + " is temporarily unavailable.",
+                }
+
+            try:
+                response = func(*args, **kwargs)
+            except Exception:
+                breaker.recordFailure()
+                raise
+
+            if _is_failure(response):
+                breaker.recordFailure()
+            else:
+                breaker.recordSuccess()
+            return response
+        return wrapper
+    return decorator
+
+
+def _is_failure(response):
+    if not isinstance(response, dict):
+        return False
+    if response.get("status") not in FAILURE_STATUSES:
+        return False
+    return not 400 <= response.get("http_status", 500) < 500
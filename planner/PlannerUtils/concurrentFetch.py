@@ -0,0 +1,83 @@
+"""
+This module sends independent external API requests at the same time on a
+shared thread pool, so a page waits for its slowest request instead of the
+sum of all of them.
+"""
+from django.conf import settings
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+import contextvars
+import threading
+import time
+
+# default seconds to wait for each request and pool size, see settings
+DEFAULT_TIMEOUT = 5
+DEFAULT_MAX_WORKERS = 16
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def fetchAll(calls, timeout=None):
+    """
+    Starts all calls at once and waits for their results. A call that does
+    not finish before its deadline, or raises an exception, is replaced by an
+    error response ({"status": "TIMEOUT" or "UNKNOWN_ERROR", "message": ...})
+    that the parseAPI functions treat like any other failed API request, so
+    only the page section using it is affected.
+
+    Calls must not access the database: they run on pool threads, outside
+    the request's database connection.
+
+    INPUT:
+        calls: dict of name --> (function, arg1, arg2, ...)
+        timeout: seconds to wait for each call, as a number or a dict of
+                 name --> seconds (default settings.EXTERNAL_API_TIMEOUT)
+    OUTPUT:
+        dict of name --> function result (or error response)
+    """
+    start = time.monotonic()
+    executor = _get_executor()
+    # each call runs in a copy of the caller's context (apiMetrics view label)
+    futures = {name: executor.submit(contextvars.copy_context().run,
+                                     call[0], *call[1:])
+               for name, call in calls.items()}
+
+    results = {}
+    for name, future in futures.items():
+        # deadlines count from the common start, not from the previous wait
+        remaining = start + _get_call_timeout(timeout, name) - time.monotonic()
+        try:
+            results[name] = future.result(timeout=max(0, remaining))
+        except FutureTimeoutError:
+            # the call keeps running on its thread; its result is discarded
+            results[name] = {
+                "status": "TIMEOUT",
+                "message": "The external service did not respond in time.",
+            }
+        except Exception as e:
+            results[name] = {
+                "status": "UNKNOWN_ERROR",
+                "message": "Error accessing external service: " + str(e),
+            }
+
+    return results
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, "EXTERNAL_API_WORKERS",
+                                    DEFAULT_MAX_WORKERS),
+                thread_name_prefix="external-api")
+    return _executor
+
+
+def _get_call_timeout(timeout, name):
+    if isinstance(timeout, dict):
+        timeout = timeout.get(name)
+    if timeout is None:
+        timeout = getattr(settings, "EXTERNAL_API_TIMEOUT", DEFAULT_TIMEOUT)
+    return timeout
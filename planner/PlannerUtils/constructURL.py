@@ -395,6 +395,28 @@ def buildNOAAapiURL(latitude, longitude):
     return NOAA_API_URL
 
 
+def buildNOAApointsURL(latitude, longitude):
+    """
+    Builds a URL for the NOAA API points endpoint, which resolves a
+    latitude/longitude to its forecast office and grid cell.
+
+    Parameters
+    ----------------
+    latitude : float
+        Latitude of the point
+    longitude : float
+        Longitude of the point
+
+    Returns
+    ----------------
+    string
+        URL for NOAA points API call at given latitude/longitude
+    """
+
+    return ("https://api.weather.gov/points/" + str(latitude) + "," +
+            str(longitude))
+
+
 def sunriseSunsetAPI(latitude, longitude, date=None):
     """
     builds API URL for https://api.sunrise-sunset.org
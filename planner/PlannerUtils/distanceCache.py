@@ -0,0 +1,140 @@
+"""
+This module provides a persistent cache of Google Distance Matrix API
+results, stored per origin --> destination coordinate pair.
+"""
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from planner.models import DistanceMatrixCache
+from datetime import timedelta
+import hashlib
+
+# default key precision and time to live, see settings
+DEFAULT_PRECISION = 4
+DEFAULT_TTL_DAYS = 90
+# keys per "key IN (...)" query, within the SQLite query parameter limit
+LOOKUP_CHUNK_SIZE = 500
+
+
+def quantize(latlon, precision=None):
+    """
+    Rounds a "lat,lon" string to "precision" decimals.
+
+    INPUT:
+        latlon: string, "lat,lon" (e.g. "40.01499,-105.27055")
+        precision: int, decimals to keep (default settings.DISTANCE_CACHE_PRECISION)
+    OUTPUT:
+        string, rounded "lat,lon" (e.g. "40.0150,-105.2706")
+    """
+    if precision is None:
+        precision = _get_precision()
+    lat, lon = [float(x) for x in latlon.split(",")]
+    return "{0:.{2}f},{1:.{2}f}".format(lat, lon, precision)
+
+
+def cacheKey(origin, destination, precision=None):
+    """
+    Returns the content-addressed cache key for an origin --> destination
+    pair of "lat,lon" strings.
+    """
+    pair = quantize(origin, precision) + "|" + quantize(destination, precision)
+    return hashlib.sha1(pair.encode("utf-8")).hexdigest()
+
+
+def lookup(pairs, max_age=None):
+    """
+    Looks up cached results for (origin, destination) "lat,lon" pairs.
+
+    INPUT:
+        pairs: iterable of (origin, destination) tuples
+        max_age: datetime.timedelta, ignore entries older than this (default
+                 settings.DISTANCE_CACHE_TTL_DAYS)
+    OUTPUT:
+        dict of (origin, destination) --> Distance Matrix API element dict
+        ({"status", "distance", "duration"}) for every cache hit
+    """
+    keys = {}
+    for pair in pairs:
+        keys.setdefault(cacheKey(*pair), []).append(pair)
+
+    cutoff = timezone.now() - (max_age or _get_ttl())
+    key_list = list(keys)
+    hits = {}
+    for i_start in range(0, len(key_list), LOOKUP_CHUNK_SIZE):
+        entries = DistanceMatrixCache.objects.filter(
+                    key__in=key_list[i_start:i_start + LOOKUP_CHUNK_SIZE],
+                    date_cached__gte=cutoff)
+        for entry in entries:
+            for pair in keys[entry.key]:
+                hits[pair] = {
+                    "status": "OK",
+                    "distance": {"value": entry.drive_distance, "text": ""},
+                    "duration": {"value": entry.drive_time, "text": ""},
+                }
+
+    return hits
+
+
+def store(origins, destinations, apiOutput):
+    """
+    Splits a Distance Matrix API response into per-pair cache entries. Only
+    elements with valid drive data are stored.
+
+    INPUT:
+        origins: [string], "lat,lon" origins of the request
+        destinations: [string], "lat,lon" destinations of the request
+        apiOutput: dict, accessAPI.googleMapsDistanceAPI() output
+    OUTPUT:
+        int, number of entries stored
+    """
+    if apiOutput.get("status") != "OK":
+        return 0
+
+    now = timezone.now()
+    entries = {}
+    for i_origin, origin in enumerate(origins):
+        elements = apiOutput["rows"][i_origin]["elements"]
+        for i_dest, destination in enumerate(destinations):
+            element = elements[i_dest]
+            if element.get("status") != "OK":
+                continue
+            key = cacheKey(origin, destination)
+            entries[key] = DistanceMatrixCache(
+                key=key,
+                origin=quantize(origin),
+                destination=quantize(destination),
+                drive_distance=element["distance"]["value"],
+                drive_time=element["duration"]["value"],
+                date_cached=now)
+
+    if entries:
+        try:
+            with transaction.atomic():
+                # replace older entries for the same pairs
+                DistanceMatrixCache.objects.filter(
+                    key__in=list(entries)).delete()
+                DistanceMatrixCache.objects.bulk_create(entries.values())
+        except IntegrityError:
+            # another process cached the same pairs first, keep its entries
+            return 0
+
+    return len(entries)
+
+
+def evictExpired():
+    """
+    Deletes cache entries older than settings.DISTANCE_CACHE_TTL_DAYS.
+    Returns the number of entries deleted.
+    """
+    deleted, by_model = DistanceMatrixCache.objects.filter(
+                date_cached__lt=timezone.now() - _get_ttl()).delete()
+    return deleted
+
+
+def _get_precision():
+    return getattr(settings, "DISTANCE_CACHE_PRECISION", DEFAULT_PRECISION)
+
+
+def _get_ttl():
+    return timedelta(days=getattr(settings, "DISTANCE_CACHE_TTL_DAYS",
+                                  DEFAULT_TTL_DAYS))
@@ -0,0 +1,384 @@
+"""
+This module provides a shared cache of NOAA forecasts, stored per forecast
+grid cell (office/gridX/gridY) so nearby points reuse the same forecast.
+
+Expired forecasts are kept for STALE_TTL more seconds and served while one
+background refresh per grid cell fetches the new forecast
+(stale-while-revalidate).
+"""
+from django.conf import settings
+from django.core.cache import caches
+from . import constructURL, accessAPI, httpClient, parseAPI, rateLimit
+from concurrent.futures import Future, ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+import re
+import threading
+import time
+
+# default cache alias (settings.CACHES) and forecast time to live [s], used
+# when the response has no usable caching headers
+DEFAULT_CACHE_ALIAS = "forecast"
+DEFAULT_TTL = 3600
+# bounds on the time to live taken from the response headers [s]
+MIN_TTL = 60
+MAX_TTL = 6 * 3600
+# seconds an expired forecast is still served while it is refreshed (its
+# days are labeled again when served, see parseAPI.NOAA_label_days());
+# seconds a refresh may take before another process may start one; refresh
+# threads
+STALE_TTL = 6 * 3600
+REFRESH_LOCK_TTL = 60
+REFRESH_WORKERS = 4
+# point --> grid cell lookups rarely change
+GRID_CELL_TTL = 30 * 24 * 3600
+# decimals of the point coordinates in grid cell lookup keys (4 ~ 11 m)
+POINT_PRECISION = 4
+
+# prefetchForecasts() defaults: concurrent requests, NOAA API requests per
+# second, and seconds before expiry at which a forecast is refreshed
+DEFAULT_PREFETCH_WORKERS = 4
+DEFAULT_PREFETCH_RATE = 5
+DEFAULT_REFRESH_MARGIN = 600
+
+KEY_PREFIX = "noaa"
+STATS_KEYS = ["hits", "misses", "stale"]
+
+_executor = None
+_executor_lock = threading.Lock()
+# grid cell forecast key --> Future of the request in flight in this process
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+
+def getForecast(latitude, longitude):
+    """
+    Returns the NOAA forecast for a point, from the cache if the point's
+    grid cell forecast is stored, as a dict with keys:
+        "status", "message": as accessAPI.NOAA_API()
+        "by_day": parseAPI.NOAA_by_day() periods (missing if not "OK")
+        "fetched_at": time.time() at which the forecast was requested
+        "expires_at": time.time() at which the cached forecast is stale
+        "stale": True if the forecast has expired and is being refreshed
+
+    Cached forecasts expire as given by the response's Cache-Control max-age
+    or Expires header, within MIN_TTL and MAX_TTL. An expired forecast is
+    returned at once and refreshed in the background. Concurrent requests
+    for the same grid cell share one NOAA API request. Failed requests are
+    not cached.
+    """
+    cache = _get_cache()
+
+    grid = _get_grid_cell(cache, latitude, longitude)
+    if grid["status"] != "OK":
+        return grid
+
+    forecast = cache.get(_forecast_key(grid))
+    if forecast is not None and "by_day" in forecast:
+        _count(cache, "hits")
+        # the day labels of a forecast cached before midnight are out of date
+        forecast = dict(forecast,
+                        by_day=parseAPI.NOAA_label_days(forecast["by_day"]))
+        if forecast["expires_at"] <= time.time():
+            _count(cache, "stale")
+            _refresh_in_background(cache, grid)
+            forecast = dict(forecast, stale=True)
+        return forecast
+
+    _count(cache, "misses")
+    return _fetch_single_flight(cache, grid)
+
+
+def prefetchForecasts(locations, workers=DEFAULT_PREFETCH_WORKERS,
+                      requests_per_second=DEFAULT_PREFETCH_RATE,
+                      refresh_margin=DEFAULT_REFRESH_MARGIN, force=False):
+    """
+    Fetches the forecasts of the unique grid cells of the locations into the
+    cache, concurrently on "workers" threads sharing one HTTP connection pool
+    and one rate limit. Only cells that are not cached, or that go stale
+    within "refresh_margin" seconds, are fetched (all cells with "force").
+
+    INPUTS:
+    locations ([(lat, lon)]): points to prefetch
+    workers (int): number of concurrent requests
+    requests_per_second (float): NOAA API request rate limit (None: no limit)
+    refresh_margin (float): seconds before expiry at which a cached forecast
+                        is fetched again
+    force (bool): fetch every cell
+
+    OUTPUT:
+    dict with keys:
+        'num_cells' (int): unique grid cells of the locations
+        'num_fetched' (int): forecasts fetched and stored
+        'num_fresh' (int): cells skipped because their forecast is fresh
+        'num_failed' (int): points or cells that could not be fetched
+        'print_output' ([str]): optional console strings to print
+    """
+    output_strings = []
+    cache = _get_cache()
+    limiter = rateLimit.RateLimiter(requests_per_second)
+    session = httpClient.newSession(pool_size=max(1, workers))
+
+    def resolve(point):
+        return _get_grid_cell(cache, point[0], point[1], limiter, session)
+
+    def fetch(grid):
+        return _fetch_forecast(cache, grid, limiter, session)
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        # resolve points to grid cells (cached lookups make no request)
+        points = list(dict.fromkeys((lat, lon) for lat, lon in locations))
+        cells = {}
+        num_failed = 0
+        for point, grid in zip(points, executor.map(resolve, points)):
+            if grid["status"] != "OK":
+                num_failed += 1
+                output_strings.append("Grid cell lookup failed for {0}: {1}"
+                                      .format(point, grid["message"]))
+                continue
+            cells[_forecast_key(grid)] = grid
+
+        # fetch the missing or stale cells
+        deadline = time.time() + refresh_margin
+        stale = []
+        for key, grid in cells.items():
+            forecast = cache.get(key)
+            if (force or forecast is None or
+                    forecast.get("expires_at", 0) < deadline):
+                stale.append(grid)
+
+        num_fetched = 0
+        for grid, forecast in zip(stale, executor.map(fetch, stale)):
+            if forecast["status"] == "OK":
+                num_fetched += 1
+            else:
+                num_failed += 1
+                output_strings.append("Forecast failed for {0}: {1}".format(
+                                        _forecast_key(grid),
+                                        forecast["message"]))
+
+    session.close()
+    output_strings.append("Grid cells: {0}, fetched: {1}, fresh: {2}, "
+                          "failed: {3}".format(len(cells), num_fetched,
+                                               len(cells) - len(stale),
+                                               num_failed))
+
+    return {'num_cells': len(cells), 'num_fetched': num_fetched,
+            'num_fresh': len(cells) - len(stale), 'num_failed': num_failed,
+            'print_output': output_strings}
+
+
+def getTTL(apiObj, now=None):
+    """
+    Returns the time to live [s] of an accessAPI.NOAA_API() response, from
+    its Cache-Control max-age or Expires header (DEFAULT_TTL if neither is
+    usable), limited to MIN_TTL..MAX_TTL.
+    """
+    ttl = DEFAULT_TTL
+
+    max_age = re.search(r"max-age=(\d+)", apiObj.get("cache_control") or "")
+    if max_age:
+        ttl = int(max_age.group(1))
+    elif apiObj.get("expires"):
+        try:
+            expires = parsedate_to_datetime(apiObj["expires"])
+        except (TypeError, ValueError):
+            pass
+        else:
+            now = now or datetime.now(timezone.utc)
+            ttl = (expires - now).total_seconds()
+
+    return int(min(max(ttl, MIN_TTL), MAX_TTL))
+
+
+def getStats():
+    """
+    Returns the cache statistics since the last reset: 'hits', 'misses',
+    'stale' (hits on expired forecasts, served while refreshed), 'hit_ratio'
+    (None before the first lookup), and the number of stored 'forecasts'
+    (including expired ones still served) and 'grid_cells' (point lookups).
+    """
+    cache = _get_cache()
+    stats = {name: cache.get(_stats_key(name), 0) for name in STATS_KEYS}
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_ratio"] = stats["hits"] / lookups if lookups else None
+
+    now = time.time()
+    registry = cache.get(_registry_key(), {})
+    stats["forecasts"] = sum(1 for key, expiry in registry.items()
+                             if expiry > now and ":forecast:" in key)
+    stats["grid_cells"] = sum(1 for key, expiry in registry.items()
+                              if expiry > now and ":point:" in key)
+    return stats
+
+
+def resetStats():
+    """
+    Sets the hit and miss counters to zero.
+    """
+    cache = _get_cache()
+    cache.delete_many([_stats_key(name) for name in STATS_KEYS])
+
+
+def clear():
+    """
+    Deletes all stored forecasts and grid cell lookups.
+    """
+    cache = _get_cache()
+    registry = cache.get(_registry_key(), {})
+    cache.delete_many(list(registry) + [_registry_key()])
+
+
+def _fetch_forecast(cache, grid, limiter=None, session=None):
+    """
+    Requests the forecast of a grid cell, and stores it parsed by day if
+    the request succeeded. Returns the getForecast() dict.
+    """
+    if limiter is not None:
+        limiter.acquire()
+    apiObj = accessAPI.NOAA_API(grid["forecast"], session=session)
+    if apiObj["status"] != "OK":
+        return apiObj
+
+    ttl = getTTL(apiObj)
+    now = time.time()
+    forecast = {
+        "status": "OK",
+        "message": "",
+        "by_day": parseAPI.NOAA_by_day(apiObj),
+        "fetched_at": now,
+        "expires_at": now + ttl,
+        "stale": False,
+    }
+    key = _forecast_key(grid)
+    cache.set(key, forecast, ttl + STALE_TTL)
+    _register(cache, key, ttl + STALE_TTL)
+    return forecast
+
+
+def _fetch_single_flight(cache, grid):
+    """
+    _fetch_forecast(), except that concurrent calls for the same grid cell
+    in this process wait for the first call's result instead of sending
+    their own request.
+    """
+    key = _forecast_key(grid)
+    with _inflight_lock:
+        future = _inflight.get(key)
+        owner = future is None
+        if owner:
+            future = Future()
+            _inflight[key] = future
+
+    if not owner:
+        return future.result()
+
+    try:
+        forecast = _fetch_forecast(cache, grid)
+    except Exception as e:
+        future.set_exception(e)
+        raise
+    else:
+        future.set_result(forecast)
+    finally:
+        with _inflight_lock:
+            del _inflight[key]
+    return forecast
+
+
+def _refresh_in_background(cache, grid):
+    # the lock entry lets one refresh per grid cell run across processes;
+    # it expires in case the refreshing process dies
+    lock_key = _forecast_key(grid) + ":refreshing"
+    if not cache.add(lock_key, True, REFRESH_LOCK_TTL):
+        return
+
+    def refresh():
+        try:
+            _fetch_single_flight(cache, grid)
+        finally:
+            cache.delete(lock_key)
+
+    _get_executor().submit(refresh)
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=REFRESH_WORKERS,
+                                           thread_name_prefix="forecast")
+    return _executor
+
+
+def _get_grid_cell(cache, latitude, longitude, limiter=None, session=None):
+    """
+    Returns the NOAA points API properties of a point (gridId, gridX, gridY,
+    forecast URL) plus "status"/"message", using the cache.
+    """
+    key = "{0}:point:{1:.{3}f},{2:.{3}f}".format(KEY_PREFIX, latitude,
+                                                 longitude, POINT_PRECISION)
+    grid = cache.get(key)
+    if grid is not None:
+        return grid
+
+    if limiter is not None:
+        limiter.acquire()
+    apiObj = accessAPI.NOAA_API(constructURL.buildNOAApointsURL(latitude,
+                                                                longitude),
+                                session=session)
+    if apiObj["status"] != "OK":
+        return apiObj
+
+    properties = apiObj["properties"]
+    grid = {
+        "status": "OK",
+        "message": "",
+        "gridId": properties["gridId"],
+        "gridX": properties["gridX"],
+        "gridY": properties["gridY"],
+        "forecast": properties["forecast"],
+    }
+    cache.set(key, grid, GRID_CELL_TTL)
+    _register(cache, key, GRID_CELL_TTL)
+    return grid
+
+
+def _forecast_key(grid):
+    return "{0}:forecast:{1}:{2},{3}".format(KEY_PREFIX, grid["gridId"],
+                                             grid["gridX"], grid["gridY"])
+
+
+def _count(cache, name):
+    key = _stats_key(name)
+    cache.add(key, 0, None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # evicted between add() and incr()
+        cache.set(key, 1, None)
+
+
+def _register(cache, key, ttl):
+    # the cache API can't list keys; keep key --> expiry time for the stats.
+    # Concurrent writers may drop an entry, which only affects the counts.
+    registry = cache.get(_registry_key(), {})
+    now = time.time()
+    registry = {k: expiry for k, expiry in registry.items() if expiry > now}
+    registry[key] = now + ttl
+    cache.set(_registry_key(), registry, None)
+
+
+def _stats_key(name):
+    return "{0}:stats:{1}".format(KEY_PREFIX, name)
+
+
+def _registry_key():
+    return KEY_PREFIX + ":registry"
+
+
+def _get_cache():
+    alias = getattr(settings, "FORECAST_CACHE_ALIAS", DEFAULT_CACHE_ALIAS)
+    if alias not in settings.CACHES:
+        alias = "default"
+    return caches[alias]
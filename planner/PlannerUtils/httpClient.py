@@ -0,0 +1,119 @@
+"""
+This module provides the HTTP client used for all external API requests:
+one pooled requests.Session per upstream host, so repeated requests reuse
+kept-alive connections instead of opening a new TCP + TLS connection, with
+connect/read timeouts and retries of failed connections and 502/503/504
+responses.
+"""
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from urllib.parse import urlsplit
+from . import apiMetrics
+import requests
+import threading
+
+# default connect and read timeouts [s] and retries, see settings
+DEFAULT_CONNECT_TIMEOUT = 3.05
+DEFAULT_READ_TIMEOUT = 10
+DEFAULT_RETRIES = 2
+# seconds between retries: RETRY_BACKOFF_FACTOR * 2 ** (retry - 1)
+RETRY_BACKOFF_FACTOR = 0.3
+RETRY_STATUSES = (502, 503, 504)
+# default connection pool size per host, see settings.EXTERNAL_API_WORKERS
+DEFAULT_POOL_SIZE = 16
+
+HEADERS = {
+    "Accept-Encoding": "gzip, deflate",
+    # the NOAA API rejects requests without a User-Agent identifying the app
+    "User-Agent": "hikeplanner",
+}
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def get(url, timeout=None, session=None):
+    """
+    Sends a GET request through the pooled session of the URL's host (or
+    the given session) and returns the requests.Response. Raises the
+    requests exceptions, including requests.exceptions.Timeout.
+
+    INPUT:
+        url: request URL
+        timeout: (connect, read) seconds or one number for both (default
+                 settings.EXTERNAL_API_CONNECT_TIMEOUT and
+                 EXTERNAL_API_READ_TIMEOUT)
+        session: requests.Session to use instead of the shared one
+    OUTPUT:
+        requests.Response
+    """
+    if session is None:
+        session = getSession(url)
+    if timeout is None:
+        timeout = getTimeout()
+    response = session.get(url, timeout=timeout)
+    apiMetrics.addBytes(len(response.content))
+    return response
+
+
+def getSession(url):
+    """
+    Returns the shared requests.Session of the URL's scheme and host,
+    creating it on first use. Sessions are safe to share between threads.
+    """
+    parts = urlsplit(url)
+    key = (parts.scheme, parts.netloc)
+    with _sessions_lock:
+        session = _sessions.get(key)
+        if session is None:
+            session = newSession()
+            _sessions[key] = session
+    return session
+
+
+def newSession(pool_size=None):
+    """
+    Returns a new requests.Session with the default headers, a connection
+    pool of "pool_size" connections (default settings.EXTERNAL_API_WORKERS,
+    the number of threads that may share it) and the retry policy.
+    """
+    if pool_size is None:
+        pool_size = getattr(settings, "EXTERNAL_API_WORKERS",
+                            DEFAULT_POOL_SIZE)
+    retries = getattr(settings, "EXTERNAL_API_RETRIES", DEFAULT_RETRIES)
+
+    # read errors are not retried: the request may have been processed (and
+    # billed), and the caller is usually waiting on a deadline
+    retry = Retry(total=retries, connect=retries, read=False, status=retries,
+                  status_forcelist=RETRY_STATUSES,
+                  backoff_factor=RETRY_BACKOFF_FACTOR, raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size,
+                          max_retries=retry)
+
+    session = requests.Session()
+    session.headers.update(HEADERS)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def getTimeout():
+    """
+    Returns the default (connect, read) timeout [s].
+    """
+    return (getattr(settings, "EXTERNAL_API_CONNECT_TIMEOUT",
+                    DEFAULT_CONNECT_TIMEOUT),
+            getattr(settings, "EXTERNAL_API_READ_TIMEOUT",
+                    DEFAULT_READ_TIMEOUT))
+
+
+def closeSessions():
+    """
+    Closes and forgets all shared sessions (their connections are closed).
+    """
+    with _sessions_lock:
+        sessions = list(_sessions.values())
+        _sessions.clear()
+    for session in sessions:
+        session.close()
@@ -0,0 +1,159 @@
+"""This module processes the queued DriveTimeJob background jobs"""
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from planner.models import DriveTimeJob
+from planner.PlannerUtils import updateTable
+from datetime import timedelta
+
+# number of times a failing job is run before it is left as FAILED
+MAX_JOB_ATTEMPTS = 3
+# delay before the first retry of a failed job, doubled on each further retry
+RETRY_DELAY = timedelta(minutes=5)
+# a job RUNNING for longer than this is taken as abandoned by a stopped
+# worker, and counted as a failed attempt
+JOB_TIMEOUT = timedelta(hours=1)
+
+
+def runPendingJobs(max_jobs=None):
+    """
+    Claims and runs pending DriveTimeJob entries, oldest first, until the
+    queue is empty or "max_jobs" jobs have run. Several pending jobs for the
+    same trailhead or major city are claimed and completed together.
+
+    INPUTS:
+    max_jobs (int): maximum number of jobs to run (None: no limit)
+
+    OUTPUT:
+    dict with keys:
+        'num_run' (int): number of jobs run
+        'num_failed' (int): number of jobs that raised an error
+        'print_output' ([str]): optional console strings to print
+    """
+    num_run = 0
+    num_failed = 0
+    output_strings = []
+
+    while max_jobs is None or num_run < max_jobs:
+        claimed = _claim_next_job()
+        if claimed is None:
+            break
+
+        job, job_ids = claimed
+        num_run += 1
+        output_strings.append("Running drive time job: " + str(job))
+        try:
+            _run_job(job)
+        except Exception as e:
+            num_failed += 1
+            output_strings.append("Job failed: " + str(e))
+            _finish_jobs(job_ids, error=e)
+        else:
+            _finish_jobs(job_ids)
+
+    return {'num_run': num_run, 'num_failed': num_failed,
+            'print_output': output_strings}
+
+
+def _claim_next_job():
+    """
+    Marks the oldest pending job, and any other pending job for the same
+    trailhead/major city, as RUNNING. Rows locked by another worker and jobs
+    waiting for their retry time are skipped. Abandoned RUNNING jobs are
+    queued again first.
+    Returns (job, [claimed job ids]), or None if no job is ready to run.
+    """
+    _release_stale_jobs()
+
+    ready = (Q(run_after__isnull=True) | Q(run_after__lte=timezone.now()))
+    with transaction.atomic():
+        # lock only the job row: the trailhead/major city joins are outer
+        # joins (nullable keys), which PostgreSQL cannot lock
+        job = (DriveTimeJob.objects.select_for_update(skip_locked=True,
+                                                      of=('self',))
+               .filter(ready, status=DriveTimeJob.PENDING)
+               .select_related('trailhead', 'majorcity')
+               .order_by('date_created').first())
+        if job is None:
+            return None
+
+        job_ids = list(DriveTimeJob.objects.select_for_update(
+                        skip_locked=True).filter(
+                        ready,
+                        status=DriveTimeJob.PENDING,
+                        trailhead=job.trailhead_id,
+                        majorcity=job.majorcity_id).values_list('pk',
+                                                                flat=True))
+        DriveTimeJob.objects.filter(pk__in=job_ids).update(
+                                                status=DriveTimeJob.RUNNING,
+                                                date_claimed=timezone.now())
+
+    return job, job_ids
+
+
+def _release_stale_jobs():
+    """
+    Fails the attempt of jobs left RUNNING for longer than JOB_TIMEOUT (the
+    worker running them was stopped), which queues them again. Jobs without
+    a claim time were claimed before it was recorded and are released too.
+    """
+    with transaction.atomic():
+        job_ids = list(DriveTimeJob.objects.select_for_update(
+                        skip_locked=True).filter(
+                        Q(date_claimed__isnull=True) |
+                        Q(date_claimed__lt=timezone.now() - JOB_TIMEOUT),
+                        status=DriveTimeJob.RUNNING).values_list('pk',
+                                                                 flat=True))
+        if job_ids:
+            _finish_jobs(job_ids, error="Job was not finished within " +
+                                        str(JOB_TIMEOUT))
+
+
+def _run_job(job):
+    """
+    Recalculates the drive times for the trailhead or major city of the job.
+    Only the rows of that trailhead/city are created and requested.
+    """
+    if job.trailhead_id is not None:
+        scope = {'trailhead_ids': [job.trailhead_id]}
+        # single trailhead: one origin to all major city destinations
+        origin_type = "trailhead"
+    else:
+        scope = {'majorcity_ids': [job.majorcity_id]}
+        origin_type = "majorcity"
+
+    # create any missing rows for the trailhead/city
+    updateTable.createNewDriveTimeEntries(
+                trailheads=scope.get('trailhead_ids'),
+                cities=scope.get('majorcity_ids'))
+    # calculate new drive times into database
+    updateTable.updateDriveTimeEntries(origin_type=origin_type, **scope)
+
+
+def _finish_jobs(job_ids, error=None):
+    """
+    Marks claimed jobs as DONE, or records the error (exception or message).
+    Failed jobs are queued again, after RETRY_DELAY doubled for each earlier
+    attempt, until they have been attempted MAX_JOB_ATTEMPTS times; a failed
+    job whose trailhead/major city already has a pending job is merged into it.
+    """
+    for job in DriveTimeJob.objects.filter(pk__in=job_ids):
+        job.attempts += 1
+        if error is None:
+            job.status = DriveTimeJob.DONE
+            job.error_message = ""
+        else:
+            job.error_message = str(error)[:1000]
+            if job.attempts < MAX_JOB_ATTEMPTS:
+                if DriveTimeJob.objects.filter(
+                        trailhead=job.trailhead_id, majorcity=job.majorcity_id,
+                        status=DriveTimeJob.PENDING).exists():
+                    # the pending job recalculates the same drive times
+                    job.delete()
+                    continue
+                job.status = DriveTimeJob.PENDING
+                job.run_after = (timezone.now() +
+                                 RETRY_DELAY * 2 ** (job.attempts - 1))
+            else:
+                job.status = DriveTimeJob.FAILED
+        job.save()
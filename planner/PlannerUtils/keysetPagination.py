@@ -0,0 +1,105 @@
+"""
+This module provides keyset (cursor) pagination of querysets: a page is
+selected with a WHERE clause on the ordering fields of the last row shown,
+instead of OFFSET, so every page costs the same index range scan however
+deep it is. Cursors are opaque signed tokens.
+"""
+from django.core import signing
+from django.db.models import Q
+
+NEXT = "n"
+PREVIOUS = "p"
+SIGNING_SALT = "planner.keysetPagination"
+
+
+def paginateKeyset(queryset, fields, page_size, cursor=None):
+    """
+    Returns one page of "queryset" ordered by "fields", starting after (or,
+    for a "previous" cursor, ending before) the row the cursor points to.
+
+    INPUTS:
+    queryset (QuerySet): rows to paginate
+    fields ([str]): ascending ordering fields; the last one must be unique
+                    (e.g. ["name", "id"])
+    page_size (int): rows per page
+    cursor (str): token from a previous page, None (or invalid) for the
+                  first page
+
+    OUTPUT:
+    dict with keys:
+        'object_list' (list): rows of the page
+        'next_cursor' (str): token of the next page, None on the last page
+        'previous_cursor' (str): token of the previous page, None on the
+                                 first page
+    """
+    direction, key = decodeCursor(cursor)
+    if key is not None and len(key) != len(fields):
+        direction, key = NEXT, None
+
+    backwards = direction == PREVIOUS
+    if key is not None:
+        queryset = queryset.filter(_after_key(fields, key, backwards))
+    if backwards:
+        queryset = queryset.order_by(*["-" + field for field in fields])
+    else:
+        queryset = queryset.order_by(*fields)
+
+    # one extra row tells whether there is a page beyond this one
+    rows = list(queryset[:page_size + 1])
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    if backwards:
+        rows.reverse()
+
+    next_cursor = None
+    previous_cursor = None
+    if rows:
+        # coming back from a later page, that page still exists
+        if has_more or backwards:
+            next_cursor = encodeCursor(NEXT, _row_key(rows[-1], fields))
+        if (has_more and backwards) or (key is not None and not backwards):
+            previous_cursor = encodeCursor(PREVIOUS,
+                                           _row_key(rows[0], fields))
+
+    return {'object_list': rows, 'next_cursor': next_cursor,
+            'previous_cursor': previous_cursor}
+
+
+def encodeCursor(direction, key):
+    """
+    Returns the token of a page that starts after (NEXT) or ends before
+    (PREVIOUS) the row with ordering field values "key".
+    """
+    return signing.dumps([direction, list(key)], salt=SIGNING_SALT,
+                         compress=True)
+
+
+def decodeCursor(cursor):
+    """
+    Returns (direction, key) of a token, or (NEXT, None) for the first page
+    if the token is missing or invalid.
+    """
+    if not cursor:
+        return NEXT, None
+    try:
+        direction, key = signing.loads(cursor, salt=SIGNING_SALT)
+    except (signing.BadSignature, TypeError, ValueError):
+        return NEXT, None
+    if direction not in (NEXT, PREVIOUS) or not isinstance(key, list):
+        return NEXT, None
+    return direction, key
+
+
+def _after_key(fields, key, backwards=False):
+    # (f1, f2, ...) > (v1, v2, ...) as
+    # f1 > v1 OR (f1 = v1 AND f2 > v2) OR ...
+    lookup = "__lt" if backwards else "__gt"
+    condition = Q()
+    for i, field in enumerate(fields):
+        equal = {fields[j]: key[j] for j in range(i)}
+        condition |= Q(**equal, **{field + lookup: key[i]})
+    return condition
+
+
+def _row_key(row, fields):
+    return [getattr(row, field) for field in fields]
@@ -0,0 +1,182 @@
+"""
+This module provides per-process in-memory name indexes of the autocomplete
+models (Destination, Route, Trailhead), so autocomplete requests are
+answered with one primary key lookup instead of a name search query.
+
+An index holds the lowercased names in sorted arrays, searched by bisection:
+one of the whole names and one of the word starts within them. It is built
+lazily from values_list("id", "name") and rebuilt when the model's
+NameIndexVersion changes. The version is bumped by the post_save/post_delete
+signals of the models (see models.py) in the transaction of the change, so
+every web worker sees it once the change is committed. Changes that bypass
+the signals (QuerySet.update, bulk_create) are picked up when the index is
+older than settings.NAME_INDEX_MAX_AGE seconds.
+
+Results are ranked: the whole name, then names starting with the query,
+then names with a word starting with it, then the rest; ties by name.
+"""
+from django.conf import settings
+from planner.models import NameIndexVersion
+from bisect import bisect_left, bisect_right
+import heapq
+import threading
+import time
+
+# default index max age [s]
+DEFAULT_MAX_AGE = 300
+
+# ranks of a match
+RANK_EXACT = 0
+RANK_PREFIX = 1
+RANK_WORD_PREFIX = 2
+RANK_SUBSTRING = 3
+
+_indexes = {}
+_build_locks = {}
+_lock = threading.Lock()
+
+
+class NameIndex:
+    """
+    Immutable name index of one model.
+
+    INPUTS:
+    rows (iterable): (id, name) tuples
+    version (int): version counter of the model the rows were read at
+    """
+
+    def __init__(self, rows, version=None):
+        self.version = version
+        self.built_at = time.monotonic()
+
+        # (lowercased name, name, id), sorted
+        self._names = sorted((name.lower(), name, pk) for pk, name in rows)
+        self._name_keys = [entry[0] for entry in self._names]
+        # the names joined by newlines, with the offset of each, for
+        # substring scans at str.find speed
+        self._blob = "\n".join(self._name_keys)
+        self._offsets = []
+        offset = 0
+        for key in self._name_keys:
+            self._offsets.append(offset)
+            offset += len(key) + 1
+
+        # (lowercased name from a word start on, index in self._names) of
+        # every word but the first
+        words = []
+        for i, (key, name, pk) in enumerate(self._names):
+            for start in range(1, len(key)):
+                if key[start - 1] == " " and key[start] != " ":
+                    words.append((key[start:], i))
+        words.sort()
+        self._words = words
+        self._word_keys = [entry[0] for entry in words]
+
+    def __len__(self):
+        return len(self._names)
+
+    def search(self, q, limit):
+        """
+        Returns up to "limit" best matches of "q" (case-insensitive
+        substring of the name) as dicts with keys 'id', 'name' and
+        'name_rank' (RANK_* values). An empty "q" returns the first names.
+        """
+        q = q.strip().lower()
+        results = []
+        taken = set()
+
+        def take(i, rank):
+            if i not in taken:
+                taken.add(i)
+                _, name, pk = self._names[i]
+                results.append({"id": pk, "name": name, "name_rank": rank})
+
+        # names starting with q are a contiguous range of self._names,
+        # already in name order (the exact match first)
+        i = bisect_left(self._name_keys, q)
+        while (len(results) < limit and i < len(self._names) and
+               self._name_keys[i].startswith(q)):
+            take(i, RANK_EXACT if self._name_keys[i] == q else RANK_PREFIX)
+            i += 1
+        if not q or len(results) >= limit:
+            return results
+
+        # words starting with q are a contiguous range of self._words, in
+        # word order: the first ones in name order are selected
+        start = bisect_left(self._word_keys, q)
+        end = start
+        while (end < len(self._words) and
+               self._word_keys[end].startswith(q)):
+            end += 1
+        matches = {self._words[j][1] for j in range(start, end)} - taken
+        for i in heapq.nsmallest(limit - len(results), matches):
+            take(i, RANK_WORD_PREFIX)
+        if len(results) >= limit:
+            return results
+
+        # q within a word: scan the names in order (only reached when there
+        # are few better matches)
+        if "\n" in q:
+            return results
+        position = self._blob.find(q)
+        while position >= 0 and len(results) < limit:
+            i = bisect_right(self._offsets, position) - 1
+            take(i, RANK_SUBSTRING)
+            # on to the next name
+            position = self._blob.find(q, self._offsets[i] +
+                                       len(self._name_keys[i]) + 1)
+        return results
+
+
+def searchNames(model, q, limit):
+    """
+    Returns up to "limit" best name matches of "q" among the rows of
+    "model", from the model's index.
+
+    INPUTS:
+    model (Model class): model with a "name" field
+    q (str): text to search for
+    limit (int): maximum number of results
+
+    OUTPUT:
+    list of dicts with keys 'id', 'name' and 'name_rank'
+    """
+    return getIndex(model).search(q, limit)
+
+
+def getIndex(model):
+    """
+    Returns the current index of "model", building it if there is none yet,
+    its NameIndexVersion changed, or it is older than NAME_INDEX_MAX_AGE.
+    Concurrent requests wait for a single rebuild.
+    """
+    key = model._meta.label
+    version = NameIndexVersion.current(model)
+    index = _indexes.get(key)
+    if _is_current(index, version):
+        return index
+
+    with _lock:
+        build_lock = _build_locks.setdefault(key, threading.Lock())
+    with build_lock:
+        index = _indexes.get(key)
+        if not _is_current(index, version):
+            index = NameIndex(model.objects.values_list("id", "name"),
+                              version)
+            _indexes[key] = index
+    return index
+
+
+def resetIndexes():
+    """
+    Forgets all indexes of this process.
+    """
+    with _lock:
+        _indexes.clear()
+
+
+def _is_current(index, version):
+    if index is None or index.version != version:
+        return False
+    max_age = getattr(settings, "NAME_INDEX_MAX_AGE", DEFAULT_MAX_AGE)
+    return time.monotonic() - index.built_at < max_age
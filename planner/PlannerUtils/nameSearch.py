@@ -0,0 +1,74 @@
+"""
+This module provides the indexed name search of the list views (substring
+match of the "name" field, case-insensitive).
+
+In PostgreSQL the name__icontains filter is kept: it compiles to
+UPPER(name::text) LIKE UPPER('%q%'), which the pg_trgm GIN indexes of
+migration 0021 serve. In SQLite (local and test runs) the indexed tables
+have an FTS5 trigram table, <table>_name_fts, kept in sync by triggers;
+substrings of at least 3 characters are looked up there. Shorter queries,
+and databases without the FTS5 tables, fall back to name__icontains.
+"""
+from django.db import connections
+import threading
+
+# models (db tables) with a name search index, see migration 0021
+INDEXED_TABLES = ["planner_destination", "planner_route", "planner_trailhead"]
+# the trigram tokenizer only matches queries of at least 3 characters
+FTS_MIN_LENGTH = 3
+
+_fts_tables = {}
+_fts_tables_lock = threading.Lock()
+
+
+def filterNames(queryset, q):
+    """
+    Returns "queryset" filtered to the rows whose name contains "q"
+    (case-insensitive), through the name search index when there is one.
+    The ordering of "queryset" is kept.
+
+    INPUTS:
+    queryset (QuerySet): rows of a model with a "name" field
+    q (str): text to search for; empty returns "queryset" unchanged
+    """
+    q = q.strip()
+    if not q:
+        return queryset
+
+    table = _fts_table(queryset)
+    if table is None or len(q) < FTS_MIN_LENGTH:
+        return queryset.filter(name__icontains=q)
+
+    # the query is matched as one phrase (the substring), not as FTS syntax.
+    # Written as a WHERE clause: a RawSQL subquery in pk__in is wrapped in
+    # two parentheses, which SQLite reads as a scalar (first row) subquery.
+    phrase = '"' + q.replace('"', '""') + '"'
+    quote = connections[queryset.db].ops.quote_name
+    pk_column = (quote(queryset.model._meta.db_table) + "." +
+                 quote(queryset.model._meta.pk.column))
+    return queryset.extra(
+        where=[pk_column + " IN (SELECT rowid FROM " + table + " WHERE " +
+               table + " MATCH %s)"],
+        params=[phrase])
+
+
+def _fts_table(queryset):
+    # name of the FTS5 table of the queryset's model, None if there is none
+    connection = connections[queryset.db]
+    if connection.vendor != "sqlite":
+        return None
+    table = queryset.model._meta.db_table
+    if table not in INDEXED_TABLES:
+        return None
+
+    key = (connection.alias, connection.settings_dict["NAME"])
+    with _fts_tables_lock:
+        existing = _fts_tables.get(key)
+    if existing is None:
+        with connection.cursor() as cursor:
+            existing = set(connection.introspection.table_names(cursor))
+        with _fts_tables_lock:
+            _fts_tables[key] = existing
+
+    fts_table = table + "_name_fts"
+    return fts_table if fts_table in existing else None
@@ -1,12 +1,31 @@
 """This module provides utility functions to parse API outputs."""
 from . import date_utils
-from datetime import datetime,  timedelta
+from datetime import datetime,  timedelta, timezone
 import calendar
 
+# error classes of unpackDriveProperties() results ("errorClass")
+# temporary server or network failure, worth retrying the request soon
+TRANSIENT_ERROR = "TRANSIENT"
+# no drive data exists for this origin/destination pair, retrying won't help
+PERMANENT_ERROR = "PERMANENT"
+# the request or account was rejected, unrelated to the origin/destination
+REQUEST_ERROR = "REQUEST"
+
+# Distance Matrix API request statuses caused by temporary failures
+# (CIRCUIT_OPEN: not sent, see circuitBreaker)
+TRANSIENT_API_STATUSES = ["UNKNOWN_ERROR", "HTTP_ERROR", "URL_ERROR",
+                          "SSL_ERROR", "TIMEOUT", "OVER_QUERY_LIMIT",
+                          "CIRCUIT_OPEN"]
+# Distance Matrix API element statuses that are final for the pair
+PERMANENT_DATA_STATUSES = ["NOT_FOUND", "ZERO_RESULTS",
+                           "MAX_ROUTE_LENGTH_EXCEEDED"]
+
 
 def unpackDriveProperties(apiObj, origin_index=0, destination_index=0):
     """
-    Returns a simplified object with the drive properties to display for the given origin/destination combo, specified by index numbers in the upstream URL request
+    Returns a simplified object with the drive properties to display for the given origin/destination combo, specified by index numbers in the upstream URL request.
+    Non-OK results are classified in "errorClass" as TRANSIENT_ERROR,
+    PERMANENT_ERROR or REQUEST_ERROR (empty string for valid data).
     """
 
     returnDict = {
@@ -14,6 +33,7 @@ def unpackDriveProperties(apiObj, origin_index=0, destination_index=0):
         "APIMessage": "",
         "dataStatus": "",
         "dataMessage": "",
+        "errorClass": "",
         "duration": {
             "value": None,
             "text": "Not Available",
@@ -52,6 +72,17 @@ def unpackDriveProperties(apiObj, origin_index=0, destination_index=0):
             returnDict["dataMessage"] = ("Unhandled Distance Matrix API " +
                      "route error encountered.")
 
+        if drive_data["status"] in PERMANENT_DATA_STATUSES:
+            returnDict["errorClass"] = PERMANENT_ERROR
+        elif drive_data["status"] != "OK":
+            returnDict["errorClass"] = TRANSIENT_ERROR
+
+        return returnDict
+
+    elif apiObj["status"] == "HTTP_ERROR":
+        returnDict["APIMessage"] = apiObj.get("message",
+                    "HTTP error accessing Google Distance API.")
+
     elif apiObj["status"] == "URL_ERROR":
         returnDict["APIMessage"] = apiObj.get("message",
                     "HTTP error accessing Google Distance API.")
@@ -82,17 +113,25 @@ def unpackDriveProperties(apiObj, origin_index=0, destination_index=0):
                     "Unknown Distance Matrix API server error.")
 
     else:
-        returnDict["APIMessage"] = "No data processed, unhandled API status."
+        returnDict["APIMessage"] = apiObj.get("message",
+                    "No data processed, unhandled API status.")
+
+    # the whole request failed
+    if apiObj["status"] in TRANSIENT_API_STATUSES:
+        returnDict["errorClass"] = TRANSIENT_ERROR
+    else:
+        returnDict["errorClass"] = REQUEST_ERROR
 
     return returnDict
 
 
-def NOAA_by_day(NOAAdict):
+def NOAA_by_day(NOAAdict, now=None):
     """
     Takes the accessAPI.NOAA_API() output and organizes the
     period data by calendar days, returned in array format. Each
     array entry is a dictionary with data about the day, and all
-    weather period data that pertains to that day.
+    weather period data that pertains to that day. Days are labeled
+    as of "now", see NOAA_label_days().
     """
     return_array = []
 
@@ -113,16 +152,10 @@ def NOAA_by_day(NOAAdict):
 
             # if the day of the period isn't in the array already, add the day
             if period_datetime.day != i_day:
-                # initialize dict corresponding to day
-                if i == 0:
-                    day_name = "Today"
-                elif i == 1:
-                    day_name = "Tomorrow"
-                else:
-                    day_name = calendar.day_name[period_datetime.weekday()]
-
+                # initialize dict corresponding to day, named by
+                # NOAA_label_days()
                 day_dict = {
-                    'dayOfWeek': day_name,
+                    'dayOfWeek': None,
                     'month': period_datetime.month,
                     'day': period_datetime.day,
                     'periodData': [],
@@ -139,6 +172,40 @@ def NOAA_by_day(NOAAdict):
             return_array[-1]['periodData'].append(period)
 
     # return data
+    return NOAA_label_days(return_array, now)
+
+
+def NOAA_label_days(by_day, now=None):
+    """
+    Returns a copy of NOAA_by_day() output with the days before today at the
+    forecast location left out, and each day named "Today", "Tomorrow" or
+    its weekday. Cached forecasts are labeled again when they are served, as
+    their names go out of date at midnight.
+
+    INPUTS:
+        by_day: NOAA_by_day() output
+        now: aware datetime.datetime (default: current time)
+    """
+    if now is None:
+        now = datetime.now(timezone.utc)
+
+    return_array = []
+    for day_dict in by_day:
+        # the period start time carries the location's UTC offset
+        start = datetime.strptime(day_dict['periodData'][0]["startTime"],
+                                  "%Y-%m-%dT%H:%M:%S%z")
+        days_ahead = (start.date() - now.astimezone(start.tzinfo).date()).days
+        if days_ahead < 0:
+            continue
+
+        if days_ahead == 0:
+            day_name = "Today"
+        elif days_ahead == 1:
+            day_name = "Tomorrow"
+        else:
+            day_name = calendar.day_name[start.weekday()]
+        return_array.append(dict(day_dict, dayOfWeek=day_name))
+
     return return_array
 
 
@@ -1,28 +1,40 @@
 # Single functions for quickly accessing and parsing data from external APIs
-from . import constructURL, accessAPI, parseAPI
+from . import constructURL, accessAPI, parseAPI, solarCalc, timezones
 
-def sunTimeData(lat, lon, date=None):
+def sunTimeData(lat, lon, date=None, tz_name=None):
     """
     Access sunrise, sunset, first light, last light, and day length for
-    a given lat/lon. Accesses both the sunrise/sunset API and Google Time Zone
-    API.
+    a given lat/lon. Sun times are calculated locally (solarCalc) and shown
+    in the local time zone, resolved offline (timezones). The Google Time
+    Zone API is only used if the time zone can't be resolved offline.
 
     INPUTS:
     lat: latitude (float)
     lon: longitude (float)
     date: retrieve data for this date (datetime.datetime object)
+    tz_name: IANA time zone of the point, if known (e.g. Trailhead.timezone)
     """
+    if not tz_name:
+        tz_name = timezones.lookupTimezone(lat, lon)
 
-    # access sunrise/sunset API
-    sunDataURL = constructURL.sunriseSunsetAPI(lat, lon, date)
-    sunAPIdata_raw = accessAPI.sunriseSunset_API(sunDataURL)
-    sunAPIdata = parseAPI.sunrise_sunset_properties(sunAPIdata_raw)
+    if tz_name:
+        tzAPIdata = timezones.timezoneProperties(tz_name, date)
+    else:
+        # access time zone API
+        tzURL = constructURL.googleTimeZoneAPI(lat, lon, date)
+        tzAPIdata_raw = accessAPI.googleTimeZoneAPI(tzURL)
+        tzAPIdata = parseAPI.googleTimeZoneProperties(tzAPIdata_raw)
 
-    # access time zone API
-    tzURL = constructURL.googleTimeZoneAPI(lat, lon, date)
-    tzAPIdata_raw = accessAPI.googleTimeZoneAPI(tzURL)
-    tzAPIdata = parseAPI.googleTimeZoneProperties(tzAPIdata_raw)
+    return combineSunTimeData(solarCalc.sunTimes(lat, lon, date), tzAPIdata)
 
+
+def combineSunTimeData(sunAPIdata, tzAPIdata):
+    """
+    Combines sun times in UTC (solarCalc.sunTimes() or
+    parseAPI.sunrise_sunset_properties() output) and time zone offsets
+    (timezones.timezoneProperties() or parseAPI.googleTimeZoneProperties()
+    output) into the sunTimeData() return value.
+    """
     # combine data from both sources
     if sunAPIdata["status"] == "OK" and tzAPIdata["status"] == "OK":
         # the base return values are the same as sunAPIdata
@@ -32,7 +44,9 @@ def sunTimeData(lat, lon, date=None):
         adj_list = ["sunrise", "sunset", "first_light", "last_light"]
 
         for key in adj_list:
-            returnObj[key] += (tzAPIdata["dstOffset"] + tzAPIdata["utcOffset"])
+            # no sunrise/sunset during polar day/night
+            if returnObj[key] is not None:
+                returnObj[key] += (tzAPIdata["dstOffset"] + tzAPIdata["utcOffset"])
 
         # add time zone string to object
         returnObj ["timezone"] = tzAPIdata["timezone"]
@@ -41,7 +55,7 @@ def sunTimeData(lat, lon, date=None):
 
     else:  # return error for the first API that provides a non-OK status code
         if sunAPIdata["status"] != "OK":
-            # Sunrise-Sunset API
+            # sun times
             return sunAPIdata
         else:  # Time Zone API
             return tzAPIdata
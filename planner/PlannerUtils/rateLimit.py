@@ -0,0 +1,72 @@
+"""This module provides thread-safe rate limiters for external API calls"""
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    Token bucket shared between threads. Tokens refill continuously at
+    "rate" per second up to "capacity". A caller asking for more tokens than
+    are available reserves them anyway (the bucket goes negative) and sleeps
+    until its reservation is covered, so waiting callers are served in the
+    order they arrived.
+
+    INPUTS:
+    rate (float): tokens added per second
+    capacity (float): maximum burst size, defaults to one second of tokens
+    """
+
+    def __init__(self, rate, capacity=None):
+        if rate <= 0:
+            raise ValueError("rate must be greater than 0")
+        self.rate = float(rate)
+        self.capacity = float(capacity) if capacity else max(self.rate, 1.0)
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens=1):
+        """
+        Blocks until "tokens" tokens are available and consumes them.
+        Returns the number of seconds spent waiting.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity,
+                               self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            self._tokens -= tokens
+            wait = max(0.0, -self._tokens / self.rate)
+
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+
+class RateLimiter:
+    """
+    Combined requests/second and elements/second limiter for batched API
+    calls. Either limit may be None for no limit.
+
+    INPUTS:
+    requests_per_second (float): maximum HTTP requests per second
+    elements_per_second (float): maximum billed elements per second
+    """
+
+    def __init__(self, requests_per_second=None, elements_per_second=None):
+        self.requests = (TokenBucket(requests_per_second)
+                         if requests_per_second else None)
+        self.elements = (TokenBucket(elements_per_second)
+                         if elements_per_second else None)
+
+    def acquire(self, elements=1):
+        """
+        Blocks until one request carrying "elements" elements is allowed.
+        Returns the number of seconds spent waiting.
+        """
+        wait = 0.0
+        if self.requests is not None:
+            wait += self.requests.acquire(1)
+        if self.elements is not None:
+            wait += self.elements.acquire(elements)
+        return wait
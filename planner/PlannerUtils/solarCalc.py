@@ -0,0 +1,177 @@
+"""
+This module calculates sunrise, sunset and civil twilight times locally with
+the NOAA solar position equations, in place of the sunrise-sunset API.
+https://gml.noaa.gov/grad/solcalc/calcdetails.html
+"""
+from datetime import date as date_type, datetime, timedelta
+import math
+
+# solar zenith angle [deg] of each event: sunrise/sunset include refraction
+# and the solar disk radius, civil twilight is the sun 6 deg below horizon
+SUNRISE_ZENITH = 90.833
+CIVIL_TWILIGHT_ZENITH = 96.0
+
+
+def sunTimes(latitude, longitude, date=None):
+    """
+    Returns the sunrise, sunset, first light (civil twilight begin) and last
+    light (civil twilight end) of a point, in the same format as
+    parseAPI.sunrise_sunset_properties():
+        "status": "OK"
+        "message": ""
+        "first_light", "sunrise", "sunset", "last_light": naive UTC
+                datetime.datetime (None if the sun doesn't cross the
+                horizon/twilight angle that day)
+        "day_length": seconds from sunrise to sunset (int)
+
+    INPUTS:
+    latitude: float, decimal degrees
+    longitude: float, decimal degrees
+    date: datetime.date or datetime.datetime (optional). Defaults to today.
+    """
+    return sunTimesMany(latitude, longitude, date)[0]
+
+
+def sunTimesMany(latitudes, longitudes, dates=None):
+    """
+    sunTimes() for many points and/or dates in one call, e.g. one point over
+    a season or every result of a search for one date. Each input is a
+    single value or a list; single values (and 1-element lists) are used for
+    every entry of the other lists, which must have the same length.
+
+    Returns a list of sunTimes() dicts, one per entry.
+    """
+    latitudes, longitudes, dates = _broadcast(latitudes, longitudes, dates)
+
+    results = []
+    # solar declination and equation of time only depend on the date (and,
+    # weakly, on the time of solar noon); reuse them for points on one date
+    solar_cache = {}
+    for latitude, longitude, day in zip(latitudes, longitudes, dates):
+        if day is None:
+            day = date_type.today()
+        elif isinstance(day, datetime):
+            day = day.date()
+
+        # evaluate the sun's position at the approximate local solar noon
+        noon_hour = round(12 - longitude / 15)
+        if (day, noon_hour) not in solar_cache:
+            solar_cache[(day, noon_hour)] = _solar_position(
+                _julian_day(day) + noon_hour / 24)
+        declination, eq_time = solar_cache[(day, noon_hour)]
+
+        results.append(_sun_events(latitude, longitude, day, declination,
+                                   eq_time))
+
+    return results
+
+
+def _broadcast(*inputs):
+    """
+    Turns single values into lists and repeats 1-element lists to the length
+    of the longest input.
+    """
+    lists = [list(x) if isinstance(x, (list, tuple)) else [x] for x in inputs]
+    length = max(len(x) for x in lists)
+    for x in lists:
+        if len(x) not in (1, length):
+            raise ValueError("inputs must be single values or lists of the " +
+                             "same length, got lengths {0}".format(
+                                [len(x) for x in lists]))
+    return [x * length if len(x) == 1 else x for x in lists]
+
+
+def _julian_day(day):
+    """
+    Returns the Julian day number at 0:00 UTC of a datetime.date.
+    """
+    return day.toordinal() + 1721424.5
+
+
+def _solar_position(julian_day):
+    """
+    Returns the solar declination [deg] and the equation of time [min] at a
+    Julian day, following the NOAA solar calculator.
+    """
+    jc = (julian_day - 2451545) / 36525  # Julian century
+
+    mean_long = (280.46646 + jc * (36000.76983 + jc * 0.0003032)) % 360
+    mean_anom = 357.52911 + jc * (35999.05029 - 0.0001537 * jc)
+    eccent = 0.016708634 - jc * (0.000042037 + 0.0000001267 * jc)
+    eq_center = (math.sin(math.radians(mean_anom)) *
+                 (1.914602 - jc * (0.004817 + 0.000014 * jc)) +
+                 math.sin(math.radians(2 * mean_anom)) *
+                 (0.019993 - 0.000101 * jc) +
+                 math.sin(math.radians(3 * mean_anom)) * 0.000289)
+    true_long = mean_long + eq_center
+    omega = math.radians(125.04 - 1934.136 * jc)
+    app_long = true_long - 0.00569 - 0.00478 * math.sin(omega)
+
+    mean_obliq = 23 + (26 + (21.448 - jc * (46.815 + jc *
+                                            (0.00059 - jc * 0.001813))) / 60) / 60
+    obliq = mean_obliq + 0.00256 * math.cos(omega)
+
+    declination = math.degrees(math.asin(math.sin(math.radians(obliq)) *
+                                         math.sin(math.radians(app_long))))
+
+    var_y = math.tan(math.radians(obliq / 2)) ** 2
+    L0 = math.radians(mean_long)
+    M = math.radians(mean_anom)
+    eq_time = 4 * math.degrees(var_y * math.sin(2 * L0) -
+                               2 * eccent * math.sin(M) +
+                               4 * eccent * var_y * math.sin(M) *
+                               math.cos(2 * L0) -
+                               0.5 * var_y ** 2 * math.sin(4 * L0) -
+                               1.25 * eccent ** 2 * math.sin(2 * M))
+
+    return declination, eq_time
+
+
+def _hour_angle(latitude, declination, zenith):
+    """
+    Returns the hour angle [deg] at which the sun is at "zenith", or None if
+    it never gets there that day (polar day/night).
+    """
+    lat = math.radians(latitude)
+    dec = math.radians(declination)
+    cos_ha = (math.cos(math.radians(zenith)) / (math.cos(lat) * math.cos(dec))
+              - math.tan(lat) * math.tan(dec))
+    if cos_ha < -1 or cos_ha > 1:
+        return None
+    return math.degrees(math.acos(cos_ha))
+
+
+def _sun_events(latitude, longitude, day, declination, eq_time):
+    """
+    Returns the sunTimes() dict of a point on a date.
+    """
+    # solar noon [min from 0:00 UTC]
+    solar_noon = 720 - 4 * longitude - eq_time
+    midnight = datetime(day.year, day.month, day.day)
+
+    def event(hour_angle, sign):
+        if hour_angle is None:
+            return None
+        minutes = solar_noon + sign * 4 * hour_angle
+        return midnight + timedelta(seconds=round(minutes * 60))
+
+    sun_ha = _hour_angle(latitude, declination, SUNRISE_ZENITH)
+    twilight_ha = _hour_angle(latitude, declination, CIVIL_TWILIGHT_ZENITH)
+
+    if sun_ha is not None:
+        day_length = round(8 * sun_ha * 60)
+    elif latitude * declination > 0:
+        # sun above the horizon all day (same hemisphere as the sun)
+        day_length = 24 * 3600
+    else:
+        day_length = 0
+
+    return {
+        "status": "OK",
+        "message": "",
+        "first_light": event(twilight_ha, -1),
+        "sunrise": event(sun_ha, -1),
+        "sunset": event(sun_ha, 1),
+        "last_light": event(twilight_ha, 1),
+        "day_length": day_length,
+    }
@@ -0,0 +1,166 @@
+"""
+This module maintains the SunTimes table: the sun times of every Trailhead
+and Destination for the upcoming days, computed ahead of time so pages read
+a single row.
+"""
+from django.contrib.contenttypes.models import ContentType
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from planner.models import SunTimes, Trailhead, Destination
+from . import solarCalc, timezones, quickAPI
+from datetime import datetime, timedelta
+import pytz
+
+# days to fill ahead (including today), and past days to keep when pruning
+DEFAULT_DAYS = 14
+DEFAULT_KEEP_DAYS = 1
+BULK_CREATE_BATCH_SIZE = 500
+
+
+def fillSunTimes(days=DEFAULT_DAYS, start=None, locations=None):
+    """
+    Adds the missing SunTimes rows of each location for "days" days from
+    "start". Locations without a resolved time zone are skipped.
+
+    INPUTS:
+    days (int): number of dates to fill
+    start (datetime.date): first date (default: today)
+    locations ([Trailhead or Destination]): locations to fill (default: all
+                        trailheads and destinations)
+
+    OUTPUT:
+    dict with keys:
+        'num_added' (int): number of new rows
+        'num_skipped' (int): locations without a time zone
+        'print_output' ([str]): optional console strings to print
+    """
+    if start is None:
+        start = timezone.localdate()
+    if locations is None:
+        locations = (list(Trailhead.objects.all()) +
+                     list(Destination.objects.all()))
+    dates = [start + timedelta(days=i) for i in range(days)]
+
+    try:
+        return _create_missing_rows(locations, dates)
+    except IntegrityError:
+        # a concurrent fill added some of the same rows; diff again
+        return _create_missing_rows(locations, dates)
+
+
+def pruneSunTimes(keep_days=DEFAULT_KEEP_DAYS):
+    """
+    Deletes SunTimes rows more than "keep_days" days in the past. Returns
+    the number of deleted rows.
+    """
+    cutoff = timezone.localdate() - timedelta(days=keep_days)
+    deleted, _ = SunTimes.objects.filter(date__lt=cutoff).delete()
+    return deleted
+
+
+def getSunData(location, date=None):
+    """
+    Returns the sun times of a Trailhead or Destination on a date (default:
+    today at the location) in quickAPI.sunTimeData() format, from its
+    SunTimes row. A missing row is computed and added; locations without a
+    resolved time zone fall back to quickAPI.sunTimeData().
+    """
+    if date is None:
+        date = _local_today(location)
+
+    row = location.sun_times.filter(date=date).first()
+    if row is None and location.timezone:
+        fillSunTimes(days=1, start=date, locations=[location])
+        row = location.sun_times.filter(date=date).first()
+    if row is None:
+        return quickAPI.sunTimeData(location.latitude, location.longitude,
+                                    datetime(date.year, date.month, date.day))
+
+    return row.sun_data
+
+
+def _create_missing_rows(locations, dates):
+    """
+    Computes and inserts the rows missing for the locations and dates, in
+    one transaction. Raises IntegrityError if another process added one of
+    them first.
+    """
+    output_strings = []
+    content_types = ContentType.objects.get_for_models(Trailhead, Destination)
+    existing = _existing_keys(locations, dates, content_types)
+
+    new_rows = []
+    num_skipped = 0
+    for location in locations:
+        if not location.timezone:
+            num_skipped += 1
+            output_strings.append("No time zone, skipped: " + str(location))
+            continue
+
+        content_type = content_types[type(location)]
+        missing = [day for day in dates
+                   if (content_type.pk, location.pk, day) not in existing]
+        if not missing:
+            continue
+
+        results = solarCalc.sunTimesMany(location.latitude,
+                                         location.longitude, missing)
+        for day, result in zip(missing, results):
+            new_rows.append(_build_row(content_type, location, day, result))
+        output_strings.append("Sun times added for {0}: {1}".format(
+                                location, len(missing)))
+
+    with transaction.atomic():
+        SunTimes.objects.bulk_create(new_rows,
+                                     batch_size=BULK_CREATE_BATCH_SIZE)
+    output_strings.append("Number added: " + str(len(new_rows)))
+
+    return {'num_added': len(new_rows), 'num_skipped': num_skipped,
+            'print_output': output_strings}
+
+
+def _existing_keys(locations, dates, content_types):
+    """
+    Returns the (content_type_id, object_id, date) keys of the SunTimes rows
+    of the locations within the dates, in batches of
+    BULK_CREATE_BATCH_SIZE locations.
+    """
+    ids_by_type = {}
+    for location in locations:
+        content_type = content_types[type(location)]
+        ids_by_type.setdefault(content_type.pk, []).append(location.pk)
+
+    existing = set()
+    in_dates = SunTimes.objects.filter(date__gte=min(dates),
+                                       date__lte=max(dates))
+    for content_type_id, object_ids in ids_by_type.items():
+        for start in range(0, len(object_ids), BULK_CREATE_BATCH_SIZE):
+            existing.update(in_dates.filter(
+                content_type_id=content_type_id,
+                object_id__in=object_ids[start:start +
+                                         BULK_CREATE_BATCH_SIZE])
+                .values_list('content_type_id', 'object_id', 'date'))
+    return existing
+
+
+def _build_row(content_type, location, day, result):
+    """
+    Returns an unsaved SunTimes row from a solarCalc.sunTimes() result,
+    with each UTC time converted to the location's local time.
+    """
+    keys = ["first_light", "sunrise", "sunset", "last_light"]
+    local = timezones.localizeMany(location.timezone,
+                                   [result[key] for key in keys])
+    row = SunTimes(content_type=content_type, object_id=location.pk,
+                   date=day, day_length=result["day_length"],
+                   timezone=timezones.timezoneProperties(location.timezone,
+                                                         day)["timezone"])
+    for key, value in zip(keys, local):
+        setattr(row, key, None if value is None else value.time())
+    return row
+
+
+def _local_today(location):
+    if location.timezone:
+        return datetime.now(pytz.timezone(location.timezone)).date()
+    return timezone.localdate()
@@ -0,0 +1,72 @@
+import unittest
+from unittest import mock
+from django.test import override_settings
+import time
+from . import accessAPI, apiMetrics, circuitBreaker, concurrentFetch
+
+class FakeResponse:
+    ok = True
+    headers = {}
+    content = b'{"status": "OK"}'
+
+    def json(self):
+        return {"status": "OK"}
+
+def fake_session_get(url, timeout):
+    return FakeResponse()
+
+class test_apiMetrics(unittest.TestCase):
+
+    def setUp(self):
+        apiMetrics.resetStats()
+        circuitBreaker.resetBreakers()
+
+    def test_histogram_buckets_are_cumulative(self):
+        apiMetrics.record("noaa", 0.2, "OK")
+        apiMetrics.record("noaa", 0.7, "OK")
+        stats = apiMetrics.getStats()["noaa"]
+        self.assertEqual(stats["count"], 2)
+        self.assertAlmostEqual(stats["sum"], 0.9)
+        self.assertEqual(stats["buckets"][apiMetrics.BUCKETS.index(0.25)], 1)
+        self.assertEqual(stats["buckets"][apiMetrics.BUCKETS.index(1)], 2)
+
+    @mock.patch("requests.Session.get", side_effect=fake_session_get)
+    def test_accessAPI_calls_recorded(self, get):
+        accessAPI.NOAA_API("https://api.weather.gov/points/40,-105")
+        with mock.patch("requests.Session.get",
+                        side_effect=OSError("refused")):
+            with self.assertRaises(OSError):
+                accessAPI.googleTimeZoneAPI("https://maps.googleapis.com/")
+
+        stats = apiMetrics.getStats()
+        self.assertEqual(stats["noaa"]["statuses"], {"OK": 1})
+        self.assertEqual(stats["noaa"]["bytes"],
+                         len(FakeResponse.content))
+        self.assertEqual(stats["google_time_zone"]["statuses"],
+                         {"EXCEPTION": 1})
+
+    def test_slow_call_logged_with_view(self):
+        @apiMetrics.instrument("sunrise_sunset")
+        def slow_api():
+            time.sleep(0.1)
+            return {"status": "OK"}
+
+        token = apiMetrics.current_view.set("route-detail")
+        try:
+            with override_settings(EXTERNAL_API_SLOW_SECONDS=0.05):
+                with self.assertLogs(apiMetrics.logger, "WARNING") as logs:
+                    # runs on a pool thread
+                    concurrentFetch.fetchAll({"sun": (slow_api,)})
+        finally:
+            apiMetrics.current_view.reset(token)
+        self.assertIn("route-detail", logs.output[0])
+
+    def test_prometheus_format(self):
+        apiMetrics.record("noaa", 0.2, "HTTP_ERROR", 100)
+        text = apiMetrics.renderPrometheus()
+        self.assertIn('external_api_request_seconds_bucket'
+                      '{upstream="noaa",le="+Inf"} 1', text)
+        self.assertIn('external_api_responses_total'
+                      '{upstream="noaa",status="HTTP_ERROR"} 1', text)
+        self.assertIn('external_api_received_bytes_total'
+                      '{upstream="noaa"} 100', text)
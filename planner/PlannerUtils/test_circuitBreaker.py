@@ -0,0 +1,97 @@
+import unittest
+from unittest import mock
+import requests
+from . import accessAPI, circuitBreaker
+
+class test_CircuitBreaker(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = mock.patch("time.monotonic", return_value=1000.0)
+        self.now = self.clock.start()
+        self.breaker = circuitBreaker.CircuitBreaker(failures=3, window=10,
+                                                     cooldown=30)
+
+    def tearDown(self):
+        self.clock.stop()
+
+    def fail(self, times):
+        for _ in range(times):
+            self.assertTrue(self.breaker.allow())
+            self.breaker.recordFailure()
+
+    def test_opens_after_failures_in_window(self):
+        self.fail(2)
+        self.assertEqual(self.breaker.state, circuitBreaker.CLOSED)
+        self.fail(1)
+        self.assertEqual(self.breaker.state, circuitBreaker.OPEN)
+        self.assertFalse(self.breaker.allow())
+
+    def test_old_failures_expire(self):
+        self.fail(2)
+        self.now.return_value += 11
+        self.fail(2)
+        self.assertEqual(self.breaker.state, circuitBreaker.CLOSED)
+
+    def test_single_probe_after_cooldown(self):
+        self.fail(3)
+        self.now.return_value += 30
+        self.assertTrue(self.breaker.allow())
+        self.assertFalse(self.breaker.allow())
+
+        # failed probe: open for another cool-down
+        self.breaker.recordFailure()
+        self.assertFalse(self.breaker.allow())
+        self.now.return_value += 30
+        self.assertTrue(self.breaker.allow())
+        self.breaker.recordSuccess()
+        self.assertEqual(self.breaker.state, circuitBreaker.CLOSED)
+        self.assertTrue(self.breaker.allow())
+
+class test_protect(unittest.TestCase):
+
+    def setUp(self):
+        circuitBreaker.resetBreakers()
+
+    def tearDown(self):
+        circuitBreaker.resetBreakers()
+
+    @mock.patch("planner.PlannerUtils.httpClient.get",
+                side_effect=requests.exceptions.Timeout())
+    def test_fails_fast_with_error_dict(self, get):
+        url = "https://api.sunrise-sunset.org/json"
+        for _ in range(circuitBreaker.DEFAULT_FAILURES):
+            self.assertEqual(accessAPI.sunriseSunset_API(url)["status"],
+                             "HTTP_ERROR")
+        response = accessAPI.sunriseSunset_API(url)
+        self.assertEqual(response["status"], circuitBreaker.OPEN_STATUS)
+        self.assertIn("message", response)
+        self.assertEqual(get.call_count, circuitBreaker.DEFAULT_FAILURES)
+
+        # other upstreams are not affected
+        accessAPI.NOAA_API("https://api.weather.gov/points/40,-105")
+        self.assertEqual(get.call_count,
+                         circuitBreaker.DEFAULT_FAILURES + 1)
+
+    def test_client_errors_do_not_count(self):
+        breaker = circuitBreaker.getBreaker("test")
+        not_found = {"status": "HTTP_ERROR", "http_status": 404}
+        api = circuitBreaker.protect("test", "Test API")(lambda: not_found)
+        for _ in range(circuitBreaker.DEFAULT_FAILURES + 1):
+            self.assertIs(api(), not_found)
+        self.assertEqual(breaker.state, circuitBreaker.CLOSED)
+
+    def test_html_error_page_is_a_failure(self):
+        page = requests.Response()
+        page.status_code = 503
+        page._content = b"<html><body>Service Unavailable</body></html>"
+        url = "https://example.com/api"
+        with mock.patch("planner.PlannerUtils.httpClient.get",
+                        return_value=page):
+            for api in [accessAPI.googleMapsDistanceAPI,
+                        accessAPI.googleTimeZoneAPI, accessAPI.NOAA_API,
+                        accessAPI.sunriseSunset_API]:
+                response = api(url)
+                self.assertEqual(response["status"], "HTTP_ERROR")
+                self.assertEqual(response["http_status"], 503)
+        self.assertEqual(len(circuitBreaker.getBreaker("noaa")._failure_times),
+                         1)
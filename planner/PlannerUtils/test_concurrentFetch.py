@@ -0,0 +1,37 @@
+import unittest
+import time
+from . import concurrentFetch
+
+def slow_call(seconds, value):
+    time.sleep(seconds)
+    return value
+
+def failing_call():
+    raise ValueError("bad response")
+
+class test_fetchAll(unittest.TestCase):
+
+    def test_calls_run_concurrently(self):
+        calls = {name: (slow_call, 0.2, name) for name in ["a", "b", "c"]}
+        start = time.monotonic()
+        results = concurrentFetch.fetchAll(calls, timeout=2)
+        elapsed = time.monotonic() - start
+
+        self.assertEqual(results, {"a": "a", "b": "b", "c": "c"})
+        # the slowest call, not the sum of all calls
+        self.assertLess(elapsed, 0.5)
+
+    def test_timeout_only_affects_slow_call(self):
+        calls = {"fast": (slow_call, 0, "fast"),
+                 "slow": (slow_call, 1, "slow")}
+        start = time.monotonic()
+        results = concurrentFetch.fetchAll(calls, timeout={"fast": 2,
+                                                           "slow": 0.1})
+        self.assertLess(time.monotonic() - start, 0.5)
+        self.assertEqual(results["fast"], "fast")
+        self.assertEqual(results["slow"]["status"], "TIMEOUT")
+
+    def test_exception_returns_error_response(self):
+        results = concurrentFetch.fetchAll({"bad": (failing_call,)})
+        self.assertEqual(results["bad"]["status"], "UNKNOWN_ERROR")
+        self.assertIn("bad response", results["bad"]["message"])
@@ -0,0 +1,25 @@
+import unittest
+from . import distanceCache
+
+
+class test_quantize(unittest.TestCase):
+
+    def test_rounds_to_precision(self):
+        self.assertEqual(distanceCache.quantize("40.014986,-105.270546", 4),
+                         "40.0150,-105.2705")
+
+    def test_pads_to_precision(self):
+        self.assertEqual(distanceCache.quantize("40,-105", 2),
+                         "40.00,-105.00")
+
+
+class test_cacheKey(unittest.TestCase):
+
+    def test_nearby_points_share_key(self):
+        self.assertEqual(
+            distanceCache.cacheKey("40.000001,-105", "39,-104.999999", 4),
+            distanceCache.cacheKey("40,-105", "39,-105", 4))
+
+    def test_key_is_directional(self):
+        self.assertNotEqual(distanceCache.cacheKey("40,-105", "39,-105", 4),
+                            distanceCache.cacheKey("39,-105", "40,-105", 4))
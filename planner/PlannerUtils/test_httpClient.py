@@ -0,0 +1,71 @@
+import unittest
+from unittest import mock
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+import threading
+import time
+import requests
+from . import accessAPI, circuitBreaker, httpClient
+
+class CountingServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # clients that timed out close the connection before the response
+        pass
+
+class CountingHandler(BaseHTTPRequestHandler):
+    # keep-alive, records the client port of each request
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.server.client_ports.add(self.client_address[1])
+        if self.path == "/slow":
+            time.sleep(0.5)
+        body = b'{"status": "OK"}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+class test_httpClient(unittest.TestCase):
+
+    def setUp(self):
+        self.server = CountingServer(("127.0.0.1", 0), CountingHandler)
+        self.server.client_ports = set()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = "http://127.0.0.1:{0}/".format(self.server.server_port)
+
+    def tearDown(self):
+        httpClient.closeSessions()
+        circuitBreaker.resetBreakers()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_repeated_calls_reuse_connection(self):
+        for _ in range(5):
+            self.assertEqual(httpClient.get(self.url).json()["status"], "OK")
+        self.assertEqual(len(self.server.client_ports), 1)
+
+    def test_one_session_per_host(self):
+        session = httpClient.getSession("https://api.weather.gov/points/1,2")
+        self.assertIs(session,
+                      httpClient.getSession("https://api.weather.gov/other"))
+        self.assertIsNot(session,
+                         httpClient.getSession("https://maps.googleapis.com/"))
+
+    def test_read_timeout(self):
+        with self.assertRaises(requests.exceptions.Timeout):
+            httpClient.get(self.url + "slow", timeout=(1, 0.1))
+
+    def test_accessAPI_keeps_error_contract(self):
+        with mock.patch.object(httpClient, "get",
+                               side_effect=requests.exceptions.Timeout()):
+            for api in [accessAPI.googleMapsDistanceAPI,
+                        accessAPI.googleTimeZoneAPI, accessAPI.NOAA_API,
+                        accessAPI.sunriseSunset_API]:
+                self.assertEqual(api(self.url)["status"], "HTTP_ERROR")
@@ -0,0 +1,44 @@
+import unittest
+from . import nameIndex
+
+class test_NameIndex(unittest.TestCase):
+
+    def setUp(self):
+        names = ["Mount Elbert", "Elbert", "Elbert Ridge", "Mount Massive",
+                 "Gelberta Peak", "Little Elbert Lake", "Mount Elbert"]
+        self.index = nameIndex.NameIndex(enumerate(names, 1), version=3)
+
+    def search(self, q, limit=10):
+        return [(row["name"], row["id"]) for row in self.index.search(q, limit)]
+
+    def test_ranking(self):
+        self.assertEqual(self.search("ELBERT"),
+                         [("Elbert", 2), ("Elbert Ridge", 3),
+                          ("Little Elbert Lake", 6), ("Mount Elbert", 1),
+                          ("Mount Elbert", 7), ("Gelberta Peak", 5)])
+        ranks = [row["name_rank"] for row in self.index.search("elbert", 10)]
+        self.assertEqual(ranks, [nameIndex.RANK_EXACT, nameIndex.RANK_PREFIX,
+                                 nameIndex.RANK_WORD_PREFIX,
+                                 nameIndex.RANK_WORD_PREFIX,
+                                 nameIndex.RANK_WORD_PREFIX,
+                                 nameIndex.RANK_SUBSTRING])
+
+    def test_limit(self):
+        self.assertEqual(self.search("elbert", limit=3),
+                         [("Elbert", 2), ("Elbert Ridge", 3),
+                          ("Little Elbert Lake", 6)])
+        self.assertEqual(len(self.search("", limit=4)), 4)
+
+    def test_word_prefixes_and_substrings(self):
+        self.assertEqual(self.search("mas"), [("Mount Massive", 4)])
+        self.assertEqual(self.search("ssiv"), [("Mount Massive", 4)])
+        self.assertEqual(self.search("ridge lake"), [])
+        self.assertEqual(self.search("  peak "), [("Gelberta Peak", 5)])
+
+    def test_empty_query_returns_names_in_order(self):
+        self.assertEqual([name for name, _ in self.search("", limit=3)],
+                         ["Elbert", "Elbert Ridge", "Gelberta Peak"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import unittest
+from datetime import datetime, timezone
+from . import parseAPI
+
+class test_unpackDriveProperties_errorClass(unittest.TestCase):
+
+    def element_response(self, status):
+        return {"status": "OK", "rows": [{"elements": [{"status": status}]}]}
+
+    def test_valid_data(self):
+        apiObj = {"status": "OK", "rows": [{"elements": [{
+                    "status": "OK",
+                    "distance": {"value": 1, "text": ""},
+                    "duration": {"value": 1, "text": ""}}]}]}
+        result = parseAPI.unpackDriveProperties(apiObj)
+        self.assertEqual(result["errorClass"], "")
+
+    def test_no_route_is_permanent(self):
+        for status in ["NOT_FOUND", "ZERO_RESULTS"]:
+            result = parseAPI.unpackDriveProperties(
+                        self.element_response(status))
+            self.assertEqual(result["errorClass"], parseAPI.PERMANENT_ERROR)
+
+    def test_server_errors_are_transient(self):
+        for status in ["UNKNOWN_ERROR", "HTTP_ERROR", "OVER_QUERY_LIMIT"]:
+            result = parseAPI.unpackDriveProperties({"status": status})
+            self.assertEqual(result["errorClass"], parseAPI.TRANSIENT_ERROR)
+
+    def test_rejected_request(self):
+        for status in ["REQUEST_DENIED", "INVALID_REQUEST"]:
+            result = parseAPI.unpackDriveProperties({"status": status})
+            self.assertEqual(result["errorClass"], parseAPI.REQUEST_ERROR)
+
+
+class test_NOAA_label_days(unittest.TestCase):
+
+    def setUp(self):
+        # Denver forecast fetched on the evening of Friday 2018-07-06
+        starts = ["2018-07-06T18:00:00-06:00", "2018-07-07T06:00:00-06:00",
+                  "2018-07-07T18:00:00-06:00", "2018-07-08T06:00:00-06:00",
+                  "2018-07-09T06:00:00-06:00"]
+        self.by_day = parseAPI.NOAA_by_day({
+            "status": "OK",
+            "properties": {"periods": [{"startTime": start}
+                                       for start in starts]}},
+            now=datetime(2018, 7, 7, 1, tzinfo=timezone.utc))
+
+    def labels(self, now):
+        return [day["dayOfWeek"]
+                for day in parseAPI.NOAA_label_days(self.by_day, now)]
+
+    def test_labels_in_local_time(self):
+        # 11 PM in Denver is already the next day in UTC
+        now = datetime(2018, 7, 7, 5, tzinfo=timezone.utc)
+        self.assertEqual(self.labels(now),
+                         ["Today", "Tomorrow", "Sunday", "Monday"])
+
+    def test_past_days_dropped_after_midnight(self):
+        now = datetime(2018, 7, 7, 7, tzinfo=timezone.utc)
+        self.assertEqual(self.labels(now), ["Today", "Tomorrow", "Monday"])
+        self.assertEqual(parseAPI.NOAA_label_days(self.by_day, now)[0]["day"],
+                         7)
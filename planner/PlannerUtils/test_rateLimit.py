@@ -0,0 +1,35 @@
+import unittest
+import time
+from .rateLimit import TokenBucket, RateLimiter
+
+
+class test_TokenBucket(unittest.TestCase):
+
+    def test_invalid_rate(self):
+        self.assertRaises(ValueError, TokenBucket, 0)
+
+    def test_burst_within_capacity_does_not_wait(self):
+        bucket = TokenBucket(rate=100, capacity=5)
+        for i in range(5):
+            self.assertEqual(bucket.acquire(), 0)
+
+    def test_waits_when_empty(self):
+        bucket = TokenBucket(rate=50, capacity=1)
+        bucket.acquire()
+        t_start = time.monotonic()
+        bucket.acquire()
+        self.assertGreaterEqual(time.monotonic() - t_start, 0.015)
+
+
+class test_RateLimiter(unittest.TestCase):
+
+    def test_unlimited(self):
+        limiter = RateLimiter()
+        self.assertEqual(limiter.acquire(elements=1000), 0)
+
+    def test_element_limit(self):
+        limiter = RateLimiter(elements_per_second=1000)
+        limiter.acquire(elements=1000)
+        t_start = time.monotonic()
+        limiter.acquire(elements=20)
+        self.assertGreaterEqual(time.monotonic() - t_start, 0.015)
@@ -0,0 +1,80 @@
+import unittest
+from datetime import date, datetime, timedelta
+from . import solarCalc, parseAPI
+
+# api.sunrise-sunset.org response (formatted=0) for lat=36.7201600,
+# lng=-4.4203400, date=2015-05-21, from the API documentation
+MALAGA_2015_05_21 = {
+    "results": {
+        "sunrise": "2015-05-21T05:05:35+00:00",
+        "sunset": "2015-05-21T19:22:59+00:00",
+        "solar_noon": "2015-05-21T12:14:17+00:00",
+        "day_length": 51444,
+        "civil_twilight_begin": "2015-05-21T04:36:17+00:00",
+        "civil_twilight_end": "2015-05-21T19:52:17+00:00",
+    },
+    "status": "OK",
+    "message": "",
+}
+
+TOLERANCE = timedelta(minutes=1)
+
+class test_sunTimes(unittest.TestCase):
+
+    def assertClose(self, first, second, tolerance=TOLERANCE):
+        self.assertLessEqual(abs(first - second), tolerance,
+                             "{0} != {1}".format(first, second))
+
+    def test_matches_api_fixture(self):
+        expected = parseAPI.sunrise_sunset_properties(MALAGA_2015_05_21)
+        result = solarCalc.sunTimes(36.72016, -4.42034, date(2015, 5, 21))
+
+        self.assertEqual(set(result), set(expected))
+        self.assertEqual(result["status"], "OK")
+        for key in ["first_light", "sunrise", "sunset", "last_light"]:
+            self.assertClose(result[key], expected[key])
+        self.assertAlmostEqual(result["day_length"], expected["day_length"],
+                               delta=TOLERANCE.total_seconds())
+
+    def test_accepts_datetime(self):
+        self.assertEqual(
+            solarCalc.sunTimes(40, -105, datetime(2018, 6, 2, 18, 30)),
+            solarCalc.sunTimes(40, -105, date(2018, 6, 2)))
+
+    def test_equinox_equator_twelve_hours(self):
+        result = solarCalc.sunTimes(0, 0, date(2018, 3, 20))
+        # refraction adds a few minutes to the geometric 12 hours
+        self.assertAlmostEqual(result["day_length"], 12 * 3600, delta=600)
+        self.assertClose(result["sunrise"], datetime(2018, 3, 20, 6, 0),
+                         timedelta(minutes=15))
+
+    def test_polar_night_and_day(self):
+        night = solarCalc.sunTimes(80, 0, date(2018, 12, 21))
+        self.assertIsNone(night["sunrise"])
+        self.assertIsNone(night["last_light"])
+        self.assertEqual(night["day_length"], 0)
+
+        day = solarCalc.sunTimes(80, 0, date(2018, 6, 21))
+        self.assertIsNone(day["sunset"])
+        self.assertEqual(day["day_length"], 24 * 3600)
+
+class test_sunTimesMany(unittest.TestCase):
+
+    def test_season_at_one_point(self):
+        days = [date(2018, 6, 1) + timedelta(days=i) for i in range(90)]
+        results = solarCalc.sunTimesMany(40, -105, days)
+        self.assertEqual(len(results), 90)
+        for day, result in zip(days, results):
+            self.assertEqual(result, solarCalc.sunTimes(40, -105, day))
+
+    def test_many_points_one_date(self):
+        lats = [39.5, 40.0, 40.5]
+        lons = [-105.5, -106.0, -104.9]
+        results = solarCalc.sunTimesMany(lats, lons, date(2018, 6, 2))
+        for lat, lon, result in zip(lats, lons, results):
+            self.assertEqual(result,
+                             solarCalc.sunTimes(lat, lon, date(2018, 6, 2)))
+
+    def test_mismatched_lengths(self):
+        self.assertRaises(ValueError, solarCalc.sunTimesMany,
+                          [40, 41], [-105, -106, -107], date(2018, 6, 2))
@@ -0,0 +1,61 @@
+import unittest
+from unittest import mock
+from datetime import date, datetime, timedelta
+from . import timezones, quickAPI
+
+class FakeFinder:
+    def timezone_at(self, lng, lat):
+        return "America/Denver" if lat > 0 else None
+
+class test_lookupTimezone(unittest.TestCase):
+
+    @mock.patch.object(timezones, "_get_finder", return_value=FakeFinder())
+    def test_resolved_zone(self, finder):
+        self.assertEqual(timezones.lookupTimezone(40, -105), "America/Denver")
+        self.assertIsNone(timezones.lookupTimezone(-40, -105))
+
+    @mock.patch.object(timezones, "_get_finder", return_value=None)
+    def test_without_timezonefinder(self, finder):
+        self.assertIsNone(timezones.lookupTimezone(40, -105))
+
+class test_timezoneProperties(unittest.TestCase):
+
+    def test_summer_offsets(self):
+        result = timezones.timezoneProperties("America/Denver",
+                                              date(2018, 7, 1))
+        self.assertEqual(result["status"], "OK")
+        self.assertEqual(result["utcOffset"], timedelta(hours=-7))
+        self.assertEqual(result["dstOffset"], timedelta(hours=1))
+        self.assertEqual(result["timezone"], "MDT")
+
+    def test_winter_offsets(self):
+        result = timezones.timezoneProperties("America/Denver",
+                                              datetime(2018, 12, 1, 18))
+        self.assertEqual(result["utcOffset"], timedelta(hours=-7))
+        self.assertEqual(result["dstOffset"], timedelta(0))
+        self.assertEqual(result["timezone"], "MST")
+
+    def test_unknown_zone(self):
+        result = timezones.timezoneProperties("Not/A_Zone")
+        self.assertNotEqual(result["status"], "OK")
+
+class test_localizeMany(unittest.TestCase):
+
+    def test_offset_per_instant(self):
+        # before and after the 2018-03-11 US DST switch (09:00 UTC)
+        result = timezones.localizeMany("America/Denver", [
+            datetime(2018, 3, 11, 8, 0), datetime(2018, 3, 11, 10, 0), None])
+        self.assertEqual(result, [datetime(2018, 3, 11, 1, 0),
+                                  datetime(2018, 3, 11, 4, 0), None])
+
+class test_sunTimeData(unittest.TestCase):
+
+    @mock.patch("planner.PlannerUtils.accessAPI.googleTimeZoneAPI")
+    def test_known_zone_needs_no_api_call(self, api):
+        result = quickAPI.sunTimeData(40, -105, datetime(2018, 7, 1),
+                                      tz_name="America/Denver")
+        self.assertFalse(api.called)
+        self.assertEqual(result["status"], "OK")
+        self.assertEqual(result["timezone"], "MDT")
+        # local sunrise in Colorado in July is around 5:30 AM
+        self.assertEqual(result["sunrise"].hour, 5)
@@ -44,3 +44,99 @@ class test_get_slice_indices(unittest.TestCase):
         multiple = 7
         result = updateTable._get_slice_indices(length, multiple)
         self.assertEquals(result, [[0, 7], [7, 14], [14, 21]])
+
+
+class test_plan_tiles(unittest.TestCase):
+
+    def _covered_pairs(self, tiles):
+        return [(o, d) for origins, destinations in tiles
+                for o in origins for d in destinations]
+
+    def test_empty(self):
+        self.assertEqual(updateTable._plan_tiles({}), [])
+
+    def test_single_origin_many_destinations(self):
+        # one new major city: 1 x 60 --> 25 destination limit, 3 requests
+        tiles = updateTable._plan_tiles({'city': list(range(60))})
+        self.assertEqual(len(tiles), 3)
+        self.assertEqual(len(self._covered_pairs(tiles)), 60)
+
+    def test_many_origins_single_destination(self):
+        # one new trailhead seen from 50 cities: 25 origin limit, 2 requests
+        tiles = updateTable._plan_tiles({i: ['th'] for i in range(50)})
+        self.assertEqual(len(tiles), 2)
+        self.assertEqual(len(self._covered_pairs(tiles)), 50)
+
+    def test_full_block_respects_element_limit(self):
+        destinations_by_origin = {i: list(range(30)) for i in range(10)}
+        tiles = updateTable._plan_tiles(destinations_by_origin)
+        for origins, destinations in tiles:
+            self.assertLessEqual(len(origins), 25)
+            self.assertLessEqual(len(destinations), 25)
+            self.assertLessEqual(len(origins) * len(destinations), 100)
+        # 300 elements at 100 per request
+        self.assertEqual(len(tiles), 3)
+        pairs = self._covered_pairs(tiles)
+        self.assertEqual(len(pairs), 300)
+        self.assertEqual(len(set(pairs)), 300)
+
+    def test_only_requested_pairs_are_tiled(self):
+        destinations_by_origin = {'a': [1, 2], 'b': [2], 'c': [1, 2]}
+        tiles = updateTable._plan_tiles(destinations_by_origin)
+        self.assertEqual(sorted(self._covered_pairs(tiles)),
+                         [('a', 1), ('a', 2), ('b', 2), ('c', 1), ('c', 2)])
+        self.assertEqual(len(tiles), 2)
+
+
+class test_get_tile_shape(unittest.TestCase):
+
+    def test_shape_within_limits(self):
+        shape = updateTable._get_tile_shape(40, 40, 25, 25, 100)
+        self.assertLessEqual(shape[0] * shape[1], 100)
+
+    def test_small_matrix_single_block(self):
+        self.assertEqual(updateTable._get_tile_shape(3, 20, 25, 25, 100),
+                         [3, 20])
+
+
+class test_plan_request_budget(unittest.TestCase):
+
+    class Point:
+        def __init__(self, pk):
+            self.pk = pk
+            self.latlon_str = "{0},0".format(pk)
+
+    class Row:
+        def __init__(self, pk, majorcity, trailhead):
+            self.pk = pk
+            self.majorcity = majorcity
+            self.trailhead = trailhead
+
+    def test_highest_priority_tiles_kept(self):
+        cities = [self.Point(i) for i in range(3)]
+        th = [self.Point(10 + i) for i in range(3)]
+        # each city needs a different set of trailheads --> 3 tiles, listed
+        # in priority order city 2, city 0, city 1
+        rows = [self.Row(1, cities[2], th[2]),
+                self.Row(2, cities[0], th[0]),
+                self.Row(3, cities[1], th[1])]
+        plan = updateTable.planDriveTimeRequests(rows, max_requests=2)
+        self.assertEqual([tile['rows'] for tile in plan['tiles']],
+                         [[[1]], [[2]]])
+        self.assertEqual(plan['num_rows_deferred'], 1)
+
+
+class test_backoff(unittest.TestCase):
+
+    def test_retry_delay_doubles_with_jitter(self):
+        for attempt in range(4):
+            delay = updateTable._get_backoff_delay(attempt, base=2)
+            self.assertGreaterEqual(delay, 2 * 2 ** attempt * 0.5)
+            self.assertLessEqual(delay, 2 * 2 ** attempt * 1.5)
+
+    def test_permanent_backoff_days_capped(self):
+        base = updateTable.PERMANENT_ERROR_BACKOFF_DAYS
+        self.assertEqual(updateTable._get_permanent_backoff_days(1), base)
+        self.assertEqual(updateTable._get_permanent_backoff_days(3), 4 * base)
+        self.assertEqual(updateTable._get_permanent_backoff_days(50),
+                         updateTable.PERMANENT_ERROR_MAX_BACKOFF_DAYS)
@@ -0,0 +1,102 @@
+"""
+This module resolves coordinates to IANA time zones offline, with the time
+zone boundary index packaged with timezonefinder, and computes UTC/DST
+offsets with pytz, in place of the Google Time Zone API.
+"""
+from datetime import datetime
+import threading
+import pytz
+
+_finder = None
+_finder_lock = threading.Lock()
+
+
+def lookupTimezone(lat, lon):
+    """
+    Returns the IANA time zone name (e.g. "America/Denver") at a point, or
+    None if it can't be resolved (timezonefinder not installed, or a point
+    outside all zone boundaries).
+
+    INPUTS:
+    lat: latitude (float)
+    lon: longitude (float)
+    """
+    finder = _get_finder()
+    if finder is None:
+        return None
+
+    tz_name = finder.timezone_at(lng=lon, lat=lat)
+    closest_timezone_at = getattr(finder, "closest_timezone_at", None)
+    if tz_name is None and closest_timezone_at is not None:
+        # e.g. just offshore; use the nearest zone within the search radius
+        tz_name = closest_timezone_at(lng=lon, lat=lat)
+    return tz_name
+
+
+def timezoneProperties(tz_name, date=None):
+    """
+    Returns the offsets of a time zone on a date, in the same format as
+    parseAPI.googleTimeZoneProperties():
+        "status": "OK", or "INVALID_REQUEST" for an unknown zone
+        "message": error message ("" if OK)
+        "dstOffset": daylight saving offset (datetime.timedelta)
+        "utcOffset": standard offset from UTC (datetime.timedelta)
+        "timezone": zone abbreviation on that date (e.g. "MDT")
+
+    INPUTS:
+    tz_name: IANA time zone name (string)
+    date: datetime.date or datetime.datetime, UTC (optional). Defaults to now.
+    """
+    returnObj = {"status": "OK", "message": ""}
+
+    try:
+        tz = pytz.timezone(tz_name)
+    except pytz.UnknownTimeZoneError:
+        returnObj["status"] = "INVALID_REQUEST"
+        returnObj["message"] = "Time zone data could not be read."
+        return returnObj
+
+    if date is None:
+        when = datetime.utcnow()
+    elif isinstance(date, datetime):
+        when = date.replace(tzinfo=None)
+    else:
+        # midday UTC, away from the usual overnight DST switch
+        when = datetime(date.year, date.month, date.day, 12)
+
+    local = pytz.utc.localize(when).astimezone(tz)
+    returnObj["dstOffset"] = local.dst()
+    returnObj["utcOffset"] = local.utcoffset() - local.dst()
+    returnObj["timezone"] = local.tzname()
+    return returnObj
+
+
+def localizeMany(tz_name, utc_datetimes):
+    """
+    Converts naive UTC datetimes to naive local times of a time zone, each
+    with the offset in effect at that instant. None entries are kept.
+
+    INPUTS:
+    tz_name: IANA time zone name (string)
+    utc_datetimes: list of naive UTC datetime.datetime (or None)
+    """
+    tz = pytz.timezone(tz_name)
+    return [None if dt is None else
+            pytz.utc.localize(dt).astimezone(tz).replace(tzinfo=None)
+            for dt in utc_datetimes]
+
+
+def _get_finder():
+    """
+    Returns the shared TimezoneFinder instance, created on first use (it
+    loads the boundary index), or None if timezonefinder isn't installed.
+    """
+    global _finder
+    with _finder_lock:
+        if _finder is None:
+            try:
+                from timezonefinder import TimezoneFinder
+            except ImportError:
+                return None
+            _finder = TimezoneFinder()
+    return _finder
@@ -1,201 +1,963 @@
-from django.core.exceptions import ObjectDoesNotExist
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Case, Q, Value, When
+from django.db.models.functions import Cast
 from django.db.models.query import QuerySet
 from planner.models import Trailhead, MajorCity, DriveTimeMajorCity
-from planner.PlannerUtils import constructURL, accessAPI, parseAPI
-from datetime import date
+from planner.models import RouteSearch
+from planner.PlannerUtils import constructURL, accessAPI, parseAPI, rateLimit
+from planner.PlannerUtils import distanceCache
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+import math
+import random
+import threading
+import time
 
 # constant parameters for Google Distance Matrix API query limits
 # see: "https://developers.google.com/maps/documentation/distance-matrix/usage-and-billing", section "Other Usage Limits"
 DISTANCE_MATRIX_API_MAX_ORIGINS = 25
 DISTANCE_MATRIX_API_MAX_DESTINATIONS = 25
+DISTANCE_MATRIX_API_MAX_ELEMENTS = 100
+
+# number of rows inserted per INSERT statement when creating new entries
+BULK_CREATE_BATCH_SIZE = 500
+# number of API results written per UPDATE statement/transaction
+BULK_UPDATE_BATCH_SIZE = 500
+# DriveTimeMajorCity fields written back after an API call
+DRIVE_RESULT_FIELDS = ['drive_distance', 'drive_time', 'date_updated',
+                       'api_call_status', 'error_message', 'attempt_count',
+                       'next_attempt_date']
+
+# retries of transient API errors within one run, and the base delay of the
+# jittered exponential backoff between them [s]
+DEFAULT_MAX_RETRIES = 2
+RETRY_BACKOFF_SECONDS = 2
+# days before a combination with a permanent error (e.g. no route) is
+# requested again, doubled for each consecutive failure up to the maximum
+PERMANENT_ERROR_BACKOFF_DAYS = 7
+PERMANENT_ERROR_MAX_BACKOFF_DAYS = 180
+
+# typical round trip of one Distance Matrix request, used to estimate the
+# duration of a run without a rate limit [s]
+ESTIMATED_REQUEST_SECONDS = 0.5
+
+
+def createNewDriveTimeEntries(trailheads=None, cities=None,
+                              batch_size=BULK_CREATE_BATCH_SIZE):
+    """
+    Adds any missing trailhead-major city combinations in the DriveTimeMajorCity table/intermediate model.
+    The existing combinations are loaded in a single query and compared
+    against the full trailhead x major city cross-product in memory. Missing
+    combinations are inserted with bulk_create() in chunks of "batch_size"
+    rows, all inside one transaction.
 
+    The work can be scoped to the rows of some trailheads and/or major
+    cities, so adding one trailhead or city only touches its own rows.
+
+    INPUTS:
+    trailheads ([Trailhead or int]): only add combinations for these
+                        trailheads (objects or pks). None for all trailheads.
+    cities ([MajorCity or int]): only add combinations for these major
+                        cities (objects or pks). None for all major cities.
+    batch_size (int): number of rows to insert per INSERT statement
 
-def createNewDriveTimeEntries():
+    OUTPUT:
+    dict with keys:
+        'num_added' (int): number of new table entries
+        'print_output' ([str]): optional console strings to print
+        'timing' (dict): elapsed seconds for the 'load', 'diff', 'insert'
+                         and 'total' steps
     """
-    Adds any missing trailhead-major city combinations in the DriveTimeMajorCity table/intermediate model.
+    trailhead_ids = _get_pks(trailheads)
+    majorcity_ids = _get_pks(cities)
+    t_start = time.perf_counter()
+
+    try:
+        result = _create_missing_entries(trailhead_ids, majorcity_ids,
+                                         batch_size)
+    except IntegrityError:
+        # a concurrent run inserted some of the same combinations between
+        # loading the existing pairs and inserting. The unique constraint
+        # rejected the whole transaction, so diff again against the new state.
+        result = _create_missing_entries(trailhead_ids, majorcity_ids,
+                                         batch_size)
+
+    result['timing']['total'] = time.perf_counter() - t_start
+    result['print_output'].append(
+        "Elapsed time: {total:.3f} s (load {load:.3f} s, diff {diff:.3f} s, "
+        "insert {insert:.3f} s)".format(**result['timing']))
+
+    return result
+
+
+def _create_missing_entries(trailhead_ids, majorcity_ids, batch_size):
+    """
+    Set-based diff and bulk insert used by createNewDriveTimeEntries().
+    Raises IntegrityError if another process created one of the missing
+    combinations first.
     """
-    trailheads = Trailhead.objects.all()
-    majorcities = MajorCity.objects.all()
-    tablematrix = DriveTimeMajorCity.objects.all()
-    new_count = 0
+    timing = {}
     output_strings = []  # contains optional console strings to print
 
-    # loop through major cities
-    for majorcity in majorcities:
+    # load ids/names and the existing (trailhead, majorcity) pairs in scope
+    t_step = time.perf_counter()
+    trailhead_qs = Trailhead.objects.all()
+    majorcity_qs = MajorCity.objects.all()
+    existing_qs = DriveTimeMajorCity.objects.all()
+    if trailhead_ids is not None:
+        trailhead_qs = trailhead_qs.filter(pk__in=trailhead_ids)
+        existing_qs = existing_qs.filter(trailhead__in=trailhead_ids)
+    if majorcity_ids is not None:
+        majorcity_qs = majorcity_qs.filter(pk__in=majorcity_ids)
+        existing_qs = existing_qs.filter(majorcity__in=majorcity_ids)
+
+    trailheads = list(trailhead_qs.values_list('id', 'name'))
+    majorcities = list(majorcity_qs.values_list('id', 'name'))
+    existing_pairs = set(existing_qs.values_list('trailhead_id',
+                                                 'majorcity_id'))
+    timing['load'] = time.perf_counter() - t_step
+
+    # compute missing combinations of the cross-product in memory
+    t_step = time.perf_counter()
+    new_entries = []
+    for mc_id, mc_name in majorcities:
         mc_count = 0
-        # loop through trailheads
-        for trailhead in trailheads:
-            # if combination exists, do nothing
-            try:
-                tablematrix.get(trailhead=trailhead, majorcity=majorcity)
-            except ObjectDoesNotExist:
-                # if combination doesn't exist, add it to the database
-                new_entry = DriveTimeMajorCity(trailhead=trailhead,
-                        majorcity=majorcity)
-                new_entry.save()
+        for th_id, th_name in trailheads:
+            if (th_id, mc_id) not in existing_pairs:
+                new_entries.append(DriveTimeMajorCity(trailhead_id=th_id,
+                                                      majorcity_id=mc_id))
                 mc_count += 1
-                new_count += 1
-                output_strings.append("Added {0} - {1}".format(majorcity.name,
-                                        trailhead.name))
+                output_strings.append("Added {0} - {1}".format(mc_name,
+                                                                th_name))
         # write total added for current city
-        output_strings.append("Entries added for {0}: {1}".format(majorcity.name, mc_count))
+        output_strings.append("Entries added for {0}: {1}".format(mc_name,
+                                                                  mc_count))
+    timing['diff'] = time.perf_counter() - t_step
+
+    # insert all missing combinations in a single transaction
+    t_step = time.perf_counter()
+    with transaction.atomic():
+        DriveTimeMajorCity.objects.bulk_create(new_entries,
+                                               batch_size=batch_size)
+    timing['insert'] = time.perf_counter() - t_step
+
     # write total new entries created
-    output_strings.append("Total new entries: {0}".format(new_count))
-    # return optional output
-    return {'num_added': new_count, 'print_output': output_strings}
+    output_strings.append("Total new entries: {0}".format(len(new_entries)))
+
+    return {'num_added': len(new_entries), 'print_output': output_strings,
+            'timing': timing}
 
 
 def updateDriveTimeEntries(run_new=True, run_errors=False,
-                           origin_type="majorcity"):
+                           origin_type="majorcity", workers=1,
+                           requests_per_second=None,
+                           elements_per_second=None, trailhead_ids=None,
+                           majorcity_ids=None, use_cache=True,
+                           stale_after=None, budget=None,
+                           max_retries=DEFAULT_MAX_RETRIES):
     """
     Calls Google Distance Matrix API and adds results to the table.
-    Requests are created and called per single-origin, looped over all
-    available origin points to all available destinations. The origin type is
+    Rows to update are grouped into origin x destination blocks ("tiles"),
+    packed as close to the per-request element limit as possible, and each
+    tile is sent as a single multi-origin request. The origin type is
     defined by the "origin_type" optional input, defaulted to "majorcity"
 
+    Requests are dispatched by a pool of "workers" threads sharing one rate
+    limiter. Results are written to the database from the calling thread in
+    tile order, so the outcome matches a serial run. If the API reports
+    OVER_DAILY_LIMIT, no further requests are started and the remaining rows
+    are left untouched for the next run.
+
+    With "use_cache", combinations whose coordinates are already in the
+    DistanceMatrixCache table are filled in from the cache, only the cache
+    misses are requested, and valid API results are added to the cache.
+
+    With "stale_after", OK combinations last updated more than that many days
+    ago are refreshed as well. Combinations are picked in priority order
+    (errors, then new items, then the oldest OK items) and, with "budget",
+    only the highest priority requests up to that number are sent.
+
+    Combinations with transient errors (server/network failures) are
+    requested again in the same run, up to "max_retries" times with jittered
+    exponential backoff. Combinations with permanent errors (e.g. no route)
+    are not requested again until their "next_attempt_date", which backs off
+    exponentially with each consecutive failure.
+
     INPUTS:
     run_new (bool): run any combinations marked as "NEW_ITEM"
     run_errors (bool): run any combinations marked as "ERROR"
     origin_type (str): Input to set origins in API request. "majorcity"
-                        does loop per MajorCity object, "trailhead" does loop
-                        per Trailhead object
+                        uses MajorCity objects as origins, "trailhead" uses
+                        Trailhead objects as origins
+    workers (int): number of concurrent API requests
+    requests_per_second (float): API request rate limit (None: no limit)
+    elements_per_second (float): API element rate limit (None: no limit)
+    trailhead_ids ([int]): only update combinations for these trailheads
+                        (None: all trailheads)
+    majorcity_ids ([int]): only update combinations for these major cities
+                        (None: all major cities)
+    use_cache (bool): use the DistanceMatrixCache response cache
+    stale_after (int): also refresh OK combinations older than this many
+                        days (None: OK combinations are not refreshed)
+    budget (int): maximum number of API requests, retries included (None:
+                  no limit)
+    max_retries (int): retries of combinations with transient errors
+
+    OUTPUT:
+    dict with keys:
+        'num_updated' (int): number of combinations updated with valid data
+        'num_requests' (int): number of API requests made
+        'num_requests_per_origin' (int): number of API requests the
+                        single-origin plan would have made for the same rows
+        'num_requests_skipped' (int): planned requests not sent because the
+                        daily limit was reached
+        'cache_hits' (int): combinations filled in from the cache
+        'cache_misses' (int): combinations that needed an API request
+        'num_rows_deferred' (int): combinations left for a later run because
+                        the request budget was used up
+        'num_retries' (int): retry requests made for transient errors
+        'print_output' ([str]): optional console strings to print
+    """
+    output_strings = []
+
+    plan = _build_plan(run_new, run_errors, origin_type, trailhead_ids,
+                       majorcity_ids, use_cache, stale_after, budget,
+                       output_strings, dry_run=False)
+    rows_by_id = plan.pop('rows_by_id')
+
+    result = _run_plan_tiles(plan['tiles'], rows_by_id, origin_type, workers,
+                             requests_per_second, elements_per_second,
+                             use_cache, max_retries, output_strings,
+                             budget=budget)
+    num_updated = result['num_updated'] + plan['cache_hits']
+    output_strings.append("Number updated: " + str(num_updated))
+
+    return {'num_updated': num_updated,
+            'num_requests': result['num_requests'],
+            'num_requests_per_origin': plan['num_requests_per_origin'],
+            'num_requests_skipped': result['num_requests_skipped'],
+            'cache_hits': plan['cache_hits'],
+            'cache_misses': plan['num_rows'],
+            'num_rows_deferred': plan['num_rows_deferred'],
+            'num_retries': result['num_retries'],
+            'print_output': output_strings}
+
+
+def planDriveTimeEntries(run_new=True, run_errors=False,
+                         origin_type="majorcity", workers=1,
+                         requests_per_second=None, elements_per_second=None,
+                         trailhead_ids=None, majorcity_ids=None,
+                         use_cache=True, stale_after=None, budget=None):
+    """
+    Dry run of updateDriveTimeEntries(): selects the combinations the same
+    inputs would update and groups them into API request tiles, without
+    making any API requests or writing to the database. Combinations found
+    in the response cache are left out of the plan, as a real run would fill
+    them in from the cache.
+
+    The returned plan can be serialized to JSON and run later with
+    executeDriveTimePlan(), which sends exactly the planned requests.
+
+    INPUTS:
+    same as updateDriveTimeEntries(); "workers", "requests_per_second" and
+    "elements_per_second" are only used to estimate the run time
+
+    OUTPUT:
+    dict with keys:
+        'origin_type' (str): side of the combinations sent as origins
+        'tiles' ([dict]): planned requests, see planDriveTimeRequests()
+        'num_requests' (int): number of API requests
+        'num_elements' (int): number of billed elements (origins x
+                        destinations summed over all requests)
+        'num_rows' (int): combinations to request
+        'estimated_seconds' (float): estimated run time
+        'cache_hits' (int): combinations that would be filled from the cache
+        'num_requests_per_origin' (int): requests of the single-origin plan
+        'num_rows_deferred' (int): combinations left out by the budget
+        'print_output' ([str]): optional console strings to print
     """
-    num_updated = 0
-    # max destinations constant defined at top of this module
-    max_destinations = DISTANCE_MATRIX_API_MAX_DESTINATIONS
     output_strings = []
 
-    # get all origin objects
+    plan = _build_plan(run_new, run_errors, origin_type, trailhead_ids,
+                       majorcity_ids, use_cache, stale_after, budget,
+                       output_strings, dry_run=True)
+    del plan['rows_by_id']
+
+    plan['estimated_seconds'] = estimateRequestTime(plan['tiles'], workers,
+                                                    requests_per_second,
+                                                    elements_per_second)
+    output_strings.append("Billed elements: " + str(plan['num_elements']))
+    output_strings.append("Estimated time: {0:.1f} s".format(
+                            plan['estimated_seconds']))
+    plan['print_output'] = output_strings
+
+    return plan
+
+
+def executeDriveTimePlan(plan, workers=1, requests_per_second=None,
+                         elements_per_second=None, use_cache=True,
+                         max_retries=DEFAULT_MAX_RETRIES, budget=None):
+    """
+    Sends the requests of a plan from planDriveTimeEntries() and writes the
+    results to the table. Each planned request is sent as is; combinations
+    deleted since the plan was made, or whose coordinates have changed, are
+    not written.
+
+    INPUTS:
+    plan (dict): output of planDriveTimeEntries() (or its JSON)
+    workers, requests_per_second, elements_per_second, use_cache,
+    max_retries: see updateDriveTimeEntries()
+    budget (int): maximum number of API requests, retries included (None:
+                  no limit)
+
+    OUTPUT:
+    dict with keys 'num_updated', 'num_requests', 'num_requests_skipped',
+    'num_retries', 'num_rows_changed' (combinations not written because they
+    changed since the plan was made) and 'print_output'
+    """
+    output_strings = []
+    origin_type = plan['origin_type']
+
+    row_ids = [row_id for tile in plan['tiles'] for ids in tile['rows']
+               for row_id in ids]
+    rows_by_id = DriveTimeMajorCity.objects.select_related(
+                    'trailhead', 'majorcity').in_bulk(row_ids)
+
+    # drop combinations that no longer match the planned request
+    tiles = []
+    num_rows_changed = 0
+    for tile in plan['tiles']:
+        tile_rows = []
+        for origin, ids in zip(tile['origins'], tile['rows']):
+            tile_rows.append([])
+            for destination, row_id in zip(tile['destinations'], ids):
+                row = rows_by_id.get(row_id)
+                if (row is None or _get_request_pair(row, origin_type) !=
+                        (origin, destination)):
+                    num_rows_changed += 1
+                    row_id = None
+                tile_rows[-1].append(row_id)
+        tiles.append(dict(tile, rows=tile_rows))
+    output_strings.append("Records to update: " +
+                          str(len(row_ids) - num_rows_changed))
+    if num_rows_changed:
+        output_strings.append("Records changed since the plan was made, " +
+                              "not updated: " + str(num_rows_changed))
+
+    result = _run_plan_tiles(tiles, rows_by_id, origin_type, workers,
+                             requests_per_second, elements_per_second,
+                             use_cache, max_retries, output_strings,
+                             budget=budget)
+    output_strings.append("Number updated: " + str(result['num_updated']))
+
+    result['num_rows_changed'] = num_rows_changed
+    result['print_output'] = output_strings
+    return result
+
+
+def estimateRequestTime(tiles, workers=1, requests_per_second=None,
+                        elements_per_second=None):
+    """
+    Returns the estimated time [s] to send the request tiles: the longest of
+    the time at the request rate limit, at the element rate limit, and of
+    ESTIMATED_REQUEST_SECONDS per request spread over the workers.
+    """
+    num_requests = len(tiles)
+    num_elements = sum(len(tile['origins']) * len(tile['destinations'])
+                       for tile in tiles)
+
+    estimates = [num_requests * ESTIMATED_REQUEST_SECONDS / max(1, workers)]
+    if requests_per_second:
+        estimates.append(num_requests / requests_per_second)
+    if elements_per_second:
+        estimates.append(num_elements / elements_per_second)
+    return max(estimates)
+
+
+def _build_plan(run_new, run_errors, origin_type, trailhead_ids,
+                majorcity_ids, use_cache, stale_after, budget, output_strings,
+                dry_run):
+    """
+    Selects the combinations to update, fills in cache hits (counted only,
+    with "dry_run") and groups the rest into request tiles. Returns the
+    planDriveTimeEntries() dict, less the run time estimate, plus
+    'rows_by_id' (pk --> row instance of the planned rows).
+    """
+    # get combinations to update in priority order, with origin/destination
+    # data loaded. A request carries at most MAX_ELEMENTS combinations.
+    max_rows = None
+    if budget is not None:
+        max_rows = budget * DISTANCE_MATRIX_API_MAX_ELEMENTS
+
+    rows = _select_rows(run_new, run_errors, stale_after, max_rows,
+                        trailhead_ids, majorcity_ids)
+    output_strings.append("Records to update: " + str(len(rows)))
+
+    # fill in combinations already in the response cache
+    cache_hits = 0
+    if use_cache:
+        if not dry_run:
+            distanceCache.evictExpired()
+        # stale entries must not be refreshed from equally stale cache data
+        max_age = timedelta(days=stale_after) if stale_after else None
+        rows, cache_hits = _apply_cached_results(rows, origin_type,
+                                                 output_strings, max_age,
+                                                 dry_run=dry_run)
+        output_strings.append("Cache hits: {0}, misses: {1}".format(
+                                cache_hits, len(rows)))
+
+    # group remaining rows into request tiles
+    plan = planDriveTimeRequests(rows, origin_type, max_requests=budget)
+    output_strings.append("API requests planned: {0} (per-origin plan: {1})"
+                          .format(len(plan['tiles']),
+                                  plan['num_requests_per_origin']))
+    if plan['num_rows_deferred']:
+        output_strings.append("Request budget used up, records deferred: " +
+                              str(plan['num_rows_deferred']))
+
+    num_elements = sum(len(tile['origins']) * len(tile['destinations'])
+                       for tile in plan['tiles'])
+    planned_ids = set(row_id for tile in plan['tiles']
+                      for ids in tile['rows'] for row_id in ids)
+
+    return {'origin_type': origin_type,
+            'tiles': plan['tiles'],
+            'num_requests': len(plan['tiles']),
+            'num_elements': num_elements,
+            'num_rows': len(planned_ids),
+            'cache_hits': cache_hits,
+            'num_requests_per_origin': plan['num_requests_per_origin'],
+            'num_rows_deferred': plan['num_rows_deferred'],
+            'rows_by_id': {row.pk: row for row in rows
+                           if row.pk in planned_ids}}
+
+
+def _run_plan_tiles(tiles, rows_by_id, origin_type, workers,
+                    requests_per_second, elements_per_second, use_cache,
+                    max_retries, output_strings, budget=None):
+    """
+    Sends the request tiles, retrying combinations with transient errors up
+    to "max_retries" times with jittered exponential backoff. Retries count
+    against "budget" (maximum number of requests, None: no limit) like the
+    first requests. Returns a dict with 'num_updated', 'num_requests',
+    'num_requests_skipped' and 'num_retries'.
+    """
+    limiter = rateLimit.RateLimiter(requests_per_second, elements_per_second)
+    num_updated = 0
+    num_requests = 0
+    num_retries = 0
+    num_skipped = 0
+
+    for attempt in range(max_retries + 1):
+        # transient errors are held back for a retry, except on the last try
+        # and when these requests use up the budget
+        retry_transient = (attempt < max_retries and
+                           (budget is None or
+                            num_requests + len(tiles) < budget))
+        result = _execute_tiles(tiles, rows_by_id, workers, limiter,
+                                output_strings, use_cache,
+                                retry_transient=retry_transient)
+        num_updated += result['num_updated']
+        num_requests += result['num_requests']
+        num_skipped += result['num_requests_skipped']
+        if attempt > 0:
+            num_retries += result['num_requests']
+
+        retry_rows = [rows_by_id[row_id] for row_id in result['retry_ids']]
+        if not retry_rows or result['num_requests_skipped']:
+            break
+
+        delay = _get_backoff_delay(attempt)
+        output_strings.append("Retrying {0} records with transient errors "
+                              "in {1:.1f} s".format(len(retry_rows), delay))
+        time.sleep(delay)
+        retry_plan = planDriveTimeRequests(
+                        retry_rows, origin_type,
+                        max_requests=(None if budget is None
+                                      else budget - num_requests))
+        tiles = retry_plan['tiles']
+        if retry_plan['num_rows_deferred']:
+            output_strings.append("Request budget used up, retries "
+                                  "deferred: " +
+                                  str(retry_plan['num_rows_deferred']))
+
+    if num_skipped:
+        output_strings.append("Daily API limit reached, requests skipped: " +
+                              str(num_skipped))
+
+    return {'num_updated': num_updated,
+            'num_requests': num_requests,
+            'num_requests_skipped': num_skipped,
+            'num_retries': num_retries}
+
+
+def _get_backoff_delay(attempt, base=RETRY_BACKOFF_SECONDS):
+    """
+    Returns the delay [s] before retry number "attempt" (0-based):
+    exponential backoff with +/- 50% random jitter, so concurrent runs do not
+    retry in lockstep.
+    """
+    return base * (2 ** attempt) * random.uniform(0.5, 1.5)
+
+
+def _select_rows(run_new, run_errors, stale_after, max_rows, trailhead_ids,
+                 majorcity_ids):
+    """
+    Returns the DriveTimeMajorCity rows to update in priority order: errors,
+    new items, then OK items older than "stale_after" days, each oldest
+    first. At most "max_rows" rows are returned (None: no limit).
+    """
+    today = date.today()
+    base_qs = DriveTimeMajorCity.objects.select_related('trailhead',
+                                                        'majorcity')
+    if trailhead_ids is not None:
+        base_qs = base_qs.filter(trailhead__in=trailhead_ids)
+    if majorcity_ids is not None:
+        base_qs = base_qs.filter(majorcity__in=majorcity_ids)
+
+    # each queryset is an index range scan on (api_call_status, date_updated)
+    querysets = []
+    if run_errors:
+        querysets.append(base_qs.filter(
+                    api_call_status=DriveTimeMajorCity.ERROR))
+    if run_new:
+        querysets.append(base_qs.filter(
+                    api_call_status=DriveTimeMajorCity.NEW_ITEM))
+    if stale_after is not None:
+        querysets.append(base_qs.filter(
+                    api_call_status=DriveTimeMajorCity.OK,
+                    date_updated__lt=today - timedelta(days=stale_after)))
+
+    # skip combinations backing off after a permanent error
+    querysets = [qs.filter(Q(next_attempt_date__isnull=True) |
+                           Q(next_attempt_date__lte=today))
+                 for qs in querysets]
+
+    rows = []
+    for qs in querysets:
+        qs = qs.order_by('date_updated', 'pk')
+        if max_rows is not None:
+            if len(rows) >= max_rows:
+                break
+            qs = qs[:max_rows - len(rows)]
+        rows.extend(qs)
+
+    return rows
+
+
+def _apply_cached_results(rows, origin_type, output_strings, max_age=None,
+                          dry_run=False):
+    """
+    Fills in the rows found in the DistanceMatrixCache table and writes them
+    to the database. Cache entries older than "max_age" (timedelta) are
+    ignored. With "dry_run", cache hits are only counted. Returns the rows
+    that still need an API request, and the number of cache hits.
+    """
+    pairs = {row.pk: _get_request_pair(row, origin_type) for row in rows}
+    cached = distanceCache.lookup(pairs.values(), max_age)
+
+    misses = []
+    hits = []
+    for row in rows:
+        element = cached.get(pairs[row.pk])
+        if element is None:
+            misses.append(row)
+            continue
+        hits.append(row)
+        if dry_run:
+            continue
+
+        # parse the cached element like a single-element API response
+        apiParse = parseAPI.unpackDriveProperties(
+                    {"status": "OK", "rows": [{"elements": [element]}]})
+        output_strings.append("CACHED -- " + row.majorcity.name + " : " +
+                              row.trailhead.name)
+        _apply_drive_result(row, apiParse, output_strings)
+
+    if not dry_run:
+        _bulk_update_rows(hits, DRIVE_RESULT_FIELDS)
+
+    return misses, len(hits)
+
+
+def _get_request_pair(row, origin_type):
+    """
+    Returns the (origin, destination) "lat,lon" strings of a
+    DriveTimeMajorCity row for the given origin type.
+    """
     if origin_type == "trailhead":
-        origins = Trailhead.objects.all()
-    else:
-        origins = MajorCity.objects.all()
-
-    # loop over origins
-    for origin in origins:
-        # get queryset for current origin
-        if origin_type == "trailhead":
-            origin_filter = {'trailhead': origin}
-        else:
-            origin_filter = {'majorcity': origin}
-
-        if run_new:
-            qs_new = DriveTimeMajorCity.objects.filter(**origin_filter,
-                        api_call_status=DriveTimeMajorCity.NEW_ITEM)
-            qs = qs_new
-        if run_errors:
-            qs_error = DriveTimeMajorCity.objects.filter(**origin_filter,
-                        api_call_status=DriveTimeMajorCity.ERROR)
-            qs = qs_error
-
-        # combine both new and error entries if both flags True
-        if run_new and run_errors:
-            qs = qs_new.union(qs_error)
-
-        # create url if values to update
-        if qs.count() > 0:
-            output_strings.append("Records to update for origin {0}: ".format(origin.name) + str(qs.count()))
-
-            # get origin latitude/longitude
-            origin_latlon = origin.latlon_str
-
-            # split queryset into limit on destination calls
-            qs_slice_indices = _get_slice_indices(qs.count(), max_destinations)
-
-            # loop over each queryset slice
-            for slice_ind in qs_slice_indices:
-
-                i_start = slice_ind[0]
-                i_end = slice_ind[1]
-
-                # create sliced queryset
-                if i_start + 1 == i_end:  # don't slice a single element
-                    # single queryset is not iterable, make it one by putting
-                    # it as an item in an array. Otherwise an error will be
-                    # thrown in the "for combo in sliced_qs" statement
-                    sliced_qs = [qs[i_start]]
-                else:
-                    sliced_qs = qs[i_start:i_end]
-
-                # reset destinations array
-                destinations = []
-
-                # add destinations to list for URL
-                for combo in sliced_qs:
+        return (row.trailhead.latlon_str, row.majorcity.latlon_str)
+    return (row.majorcity.latlon_str, row.trailhead.latlon_str)
+
+
+def _execute_tiles(tiles, rows_by_id, workers, limiter, output_strings,
+                   use_cache=False, retry_transient=False):
+    """
+    Sends one API request per tile on a thread pool and writes the results
+    to the DriveTimeMajorCity rows from the calling thread, in tile order.
+    Updated rows are buffered and written with one UPDATE statement per
+    BULK_UPDATE_BATCH_SIZE rows.
+
+    INPUTS:
+    tiles ([dict]): request tiles from planDriveTimeRequests()
+    rows_by_id (dict): DriveTimeMajorCity pk --> row instance (None entries
+                        in a tile's "rows" are requested but not written)
+    workers (int): number of concurrent API requests
+    limiter (rateLimit.RateLimiter): limiter shared by all workers
+    output_strings ([str]): console strings list to append to
+    use_cache (bool): add valid results to the DistanceMatrixCache table
+    retry_transient (bool): leave rows with transient errors unchanged and
+                        return them for a retry instead of marking them ERROR
+
+    OUTPUT:
+    dict with 'num_updated', 'num_requests', 'num_requests_skipped' and
+    'retry_ids' (pks of the rows to retry)
+    """
+    daily_limit_reached = threading.Event()
+
+    def fetch(tile):
+        # runs on a worker thread: network access only, no database access
+        if daily_limit_reached.is_set():
+            return None
+        limiter.acquire(elements=len(tile['origins']) *
+                        len(tile['destinations']))
+        if daily_limit_reached.is_set():
+            return None
+
+        apiURL = constructURL.googleMapsDistanceAPI(tile['origins'],
+                                                    tile['destinations'])
+        apiOutput = accessAPI.googleMapsDistanceAPI(apiURL)
+        if apiOutput.get("status") == "OVER_DAILY_LIMIT":
+            daily_limit_reached.set()
+        return apiURL, apiOutput
+
+    num_updated = 0
+    num_requests = 0
+    num_skipped = 0
+    retry_ids = []
+    write_buffer = []
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = [executor.submit(fetch, tile) for tile in tiles]
+
+        # single writer: apply results in tile order
+        for tile, future in zip(tiles, futures):
+            response = future.result()
+            if response is None:
+                num_skipped += 1
+                continue
+
+            apiURL, apiOutput = response
+            num_requests += 1
+
+            for row_ids in tile['rows']:
+                for row_id in row_ids:
+                    if row_id is None:
+                        continue
+                    combo = rows_by_id[row_id]
                     output_strings.append(combo.api_call_status_expanded +
                         " ----- " + combo.majorcity.name + " : " +
                         combo.trailhead.name)
-
-                    if origin_type == "trailhead":
-                        destinations.append(combo.majorcity.latlon_str)
-                    else:
-                        destinations.append(combo.trailhead.latlon_str)
-
-                # create URL
-                apiURL = constructURL.googleMapsDistanceAPI(origin_latlon,
-                                                            destinations)
-                output_strings.append("API call: " + apiURL)
-                # call API
-                apiOutput = accessAPI.googleMapsDistanceAPI(apiURL)
-                # parse API results
-                for i_dest, dest in enumerate(destinations):
+            output_strings.append("API call: " + apiURL)
+
+            if apiOutput.get("status") == "OVER_DAILY_LIMIT":
+                # not an error of these combinations, leave them as they are
+                output_strings.append("Over daily limit, rows not updated")
+                continue
+
+            if use_cache:
+                distanceCache.store(tile['origins'], tile['destinations'],
+                                    apiOutput)
+
+            # parse API results, mapping rows[i].elements[j] to the table
+            for i_origin, row_ids in enumerate(tile['rows']):
+                for i_dest, row_id in enumerate(row_ids):
+                    if row_id is None:
+                        # combination dropped from an executed plan
+                        continue
                     apiParse = parseAPI.unpackDriveProperties(apiOutput,
+                                            origin_index=i_origin,
                                             destination_index=i_dest)
-                    if apiParse["APIStatus"] != "OK":
-                        # set entry to error, save error message
-                        output_strings.append(
-                            "API error for " + sliced_qs[i_dest].majorcity.name + " : " +
-                            sliced_qs[i_dest].trailhead.name + " -- '" +
-                            apiParse["APIMessage"] + "'")
-
-                        sliced_qs[i_dest].api_call_status = DriveTimeMajorCity.ERROR
-                        sliced_qs[i_dest].error_message = apiParse["APIMessage"]
-                        sliced_qs[i_dest].drive_distance = None
-                        sliced_qs[i_dest].drive_time = None
-                        sliced_qs[i_dest].save()
-
-                    else:  # overall API call returned data
-                        if apiParse["dataStatus"] != "OK":
-                            # set entry to error, save error message
-                            output_strings.append(
-                                "Data error for " + sliced_qs[i_dest].majorcity.name +
-                                " : " + sliced_qs[i_dest].trailhead.name + " -- '" +
-                                apiParse["dataMessage"] + "'")
-
-                            sliced_qs[i_dest].api_call_status = DriveTimeMajorCity.ERROR
-                            sliced_qs[i_dest].error_message = apiParse["dataMessage"]
-                            sliced_qs[i_dest].drive_distance = None
-                            sliced_qs[i_dest].drive_time = None
-                            sliced_qs[i_dest].save()
-
-                        else:
-                            # data is valid, save results
-                            output_strings.append(
-                                "VALID -- " + sliced_qs[i_dest].majorcity.name + " : " +
-                                sliced_qs[i_dest].trailhead.name + " -- '" +
-                                apiParse["dataMessage"] + "'")
-
-                            output_strings.append("     distance: " +
-                                str(apiParse["distance"]["value"]) + ", time: " +
-                                str(apiParse["duration"]["value"]))
-
-                            sliced_qs[i_dest].api_call_status = DriveTimeMajorCity.OK
-                            sliced_qs[i_dest].error_message = ""
-                            sliced_qs[i_dest].drive_distance = apiParse["distance"]["value"]
-                            sliced_qs[i_dest].drive_time = apiParse["duration"]["value"]
-                            sliced_qs[i_dest].date_updated = date.today()
-                            sliced_qs[i_dest].save()
-
-                            num_updated += 1
-
-        else:
-            output_strings.append("No records to update for origin " +
-                                  origin.name)
+                    combo = rows_by_id[row_id]
 
-    output_strings.append("Number updated: " + str(num_updated))
+                    if (retry_transient and apiParse["errorClass"] ==
+                            parseAPI.TRANSIENT_ERROR):
+                        retry_ids.append(row_id)
+                        continue
 
-    return {'num_updated': num_updated,
-            'print_output': output_strings}
+                    if _apply_drive_result(combo, apiParse, output_strings):
+                        num_updated += 1
+                    write_buffer.append(combo)
+
+            if len(write_buffer) >= BULK_UPDATE_BATCH_SIZE:
+                _bulk_update_rows(write_buffer, DRIVE_RESULT_FIELDS)
+                write_buffer = []
+
+    _bulk_update_rows(write_buffer, DRIVE_RESULT_FIELDS)
+
+    return {'num_updated': num_updated, 'num_requests': num_requests,
+            'num_requests_skipped': num_skipped, 'retry_ids': retry_ids}
+
+
+def planDriveTimeRequests(rows, origin_type="majorcity", max_requests=None):
+    """
+    Groups DriveTimeMajorCity rows into Distance Matrix API request tiles.
+    Every origin/destination combination of a tile is one of the input rows,
+    and every input row appears in exactly one tile. Tiles are ordered by
+    the position of their first row in "rows", so listing rows by priority
+    sends the highest priority rows first. With "max_requests", only that
+    many tiles are kept.
+
+    INPUTS:
+    rows ([DriveTimeMajorCity]): combinations to request, with "trailhead"
+                        and "majorcity" loaded
+    origin_type (str): "majorcity" or "trailhead", the side of the
+                        combination sent as the API request origin
+    max_requests (int): maximum number of tiles (None: no limit)
+
+    OUTPUT:
+    dict with keys:
+        'tiles' ([dict]): one entry per API request, with keys
+                'origins' ([str]): origin "lat,lon" strings
+                'destinations' ([str]): destination "lat,lon" strings
+                'rows' ([[int]]): DriveTimeMajorCity pk for
+                        origins[i] x destinations[j] at rows[i][j]
+        'num_requests_per_origin' (int): number of requests needed to
+                        send the same rows one origin at a time
+        'num_rows_deferred' (int): rows left out by "max_requests"
+    """
+    if origin_type == "trailhead":
+        origin_field, destination_field = "trailhead", "majorcity"
+    else:
+        origin_field, destination_field = "majorcity", "trailhead"
+
+    # map origin id --> destination ids to request, and keep track of the
+    # row and coordinates for each id
+    destinations_by_origin = {}
+    row_ids = {}
+    latlon = {origin_field: {}, destination_field: {}}
+    for row in rows:
+        origin = getattr(row, origin_field)
+        destination = getattr(row, destination_field)
+        destinations_by_origin.setdefault(origin.pk, []).append(
+                                                            destination.pk)
+        row_ids[(origin.pk, destination.pk)] = row.pk
+        latlon[origin_field][origin.pk] = origin.latlon_str
+        latlon[destination_field][destination.pk] = destination.latlon_str
+
+    tiles = []
+    for origin_ids, destination_ids in _plan_tiles(destinations_by_origin):
+        tiles.append({
+            'origins': [latlon[origin_field][i] for i in origin_ids],
+            'destinations': [latlon[destination_field][j]
+                             for j in destination_ids],
+            'rows': [[row_ids[(i, j)] for j in destination_ids]
+                     for i in origin_ids],
+        })
+
+    num_requests_per_origin = sum(
+        len(_get_slice_indices(len(dest_ids),
+                               DISTANCE_MATRIX_API_MAX_DESTINATIONS))
+        for dest_ids in destinations_by_origin.values())
+
+    # highest priority (earliest) rows first, then cut to the request budget
+    rank = {row.pk: i for i, row in enumerate(rows)}
+    tiles.sort(key=lambda tile: min(rank[row_id] for row_ids in tile['rows']
+                                    for row_id in row_ids))
+    num_rows_deferred = 0
+    if max_requests is not None:
+        for tile in tiles[max_requests:]:
+            num_rows_deferred += (len(tile['origins']) *
+                                  len(tile['destinations']))
+        tiles = tiles[:max_requests]
+
+    return {'tiles': tiles,
+            'num_requests_per_origin': num_requests_per_origin,
+            'num_rows_deferred': num_rows_deferred}
+
+
+def _apply_drive_result(combo, apiParse, output_strings):
+    """
+    Sets the DriveTimeMajorCity fields from a parseAPI.unpackDriveProperties()
+    result, without saving. Returns True if valid drive data was set.
+    """
+    if apiParse["APIStatus"] != "OK":
+        # set entry to error, save error message
+        output_strings.append(
+            "API error for " + combo.majorcity.name + " : " +
+            combo.trailhead.name + " -- '" +
+            apiParse["APIMessage"] + "'")
+
+        combo.api_call_status = DriveTimeMajorCity.ERROR
+        combo.error_message = apiParse["APIMessage"]
+        combo.drive_distance = None
+        combo.drive_time = None
+        return False
+
+    if apiParse["dataStatus"] != "OK":
+        # overall API call returned data, but not for this combination
+        output_strings.append(
+            "Data error for " + combo.majorcity.name +
+            " : " + combo.trailhead.name + " -- '" +
+            apiParse["dataMessage"] + "'")
+
+        combo.api_call_status = DriveTimeMajorCity.ERROR
+        combo.error_message = apiParse["dataMessage"]
+        combo.drive_distance = None
+        combo.drive_time = None
+
+        if apiParse["errorClass"] == parseAPI.PERMANENT_ERROR:
+            # back off before requesting this combination again
+            combo.attempt_count += 1
+            combo.next_attempt_date = date.today() + timedelta(
+                        days=_get_permanent_backoff_days(combo.attempt_count))
+        return False
+
+    # data is valid, save results
+    output_strings.append(
+        "VALID -- " + combo.majorcity.name + " : " +
+        combo.trailhead.name + " -- '" +
+        apiParse["dataMessage"] + "'")
+
+    output_strings.append("     distance: " +
+        str(apiParse["distance"]["value"]) + ", time: " +
+        str(apiParse["duration"]["value"]))
+
+    combo.api_call_status = DriveTimeMajorCity.OK
+    combo.error_message = ""
+    combo.drive_distance = apiParse["distance"]["value"]
+    combo.drive_time = apiParse["duration"]["value"]
+    combo.date_updated = date.today()
+    combo.attempt_count = 0
+    combo.next_attempt_date = None
+    return True
+
+
+def _get_permanent_backoff_days(attempt_count):
+    """
+    Returns the number of days to wait after the "attempt_count"-th
+    consecutive permanent error of a combination.
+    """
+    return min(PERMANENT_ERROR_BACKOFF_DAYS * 2 ** (attempt_count - 1),
+               PERMANENT_ERROR_MAX_BACKOFF_DAYS)
+
+
+def _bulk_update_rows(rows, fields, batch_size=BULK_UPDATE_BATCH_SIZE):
+    """
+    Writes "fields" of the DriveTimeMajorCity instances in "rows" with one
+    UPDATE ... CASE WHEN statement per batch, each batch in its own
+    transaction. Equivalent to QuerySet.bulk_update() in newer Django versions.
+    The RouteSearch rows of each batch's combinations are refreshed after it.
+
+    INPUTS:
+    rows ([DriveTimeMajorCity]): instances to write
+    fields ([str]): names of the fields to write
+    batch_size (int): maximum number of rows per UPDATE statement
+    """
+    if not rows:
+        return
+
+    # each row uses 2 query parameters per field (pk and value), plus one in
+    # the WHERE pk IN (...) clause; stay within the database parameter limit
+    max_batch_size = connection.ops.bulk_batch_size(
+                        ['pk'] * (2 * len(fields) + 1), rows)
+    batch_size = max(1, min(batch_size, max_batch_size))
+    model_fields = [DriveTimeMajorCity._meta.get_field(name)
+                    for name in fields]
+
+    for i_start, i_end in _get_slice_indices(len(rows), batch_size):
+        batch = rows[i_start:i_end]
+        update_kwargs = {}
+        for field in model_fields:
+            whens = [When(pk=row.pk, then=Value(getattr(row, field.attname),
+                                                output_field=field))
+                     for row in batch]
+            case = Case(*whens, output_field=field)
+            if connection.vendor == 'postgresql':
+                # PostgreSQL types a CASE of only NULLs (e.g. all
+                # next_attempt_date = None) as text, which a date or double
+                # column rejects; Django 2.2's bulk_update() casts it too
+                case = Cast(case, output_field=field)
+            update_kwargs[field.attname] = case
+
+        with transaction.atomic():
+            DriveTimeMajorCity.objects.filter(
+                pk__in=[row.pk for row in batch]).update(**update_kwargs)
+
+        # the UPDATE sends no post_save signals; rebuild the search rows of
+        # the written combinations (2 parameters per row, within the limit)
+        RouteSearch.refresh(pairs=list({(row.trailhead_id, row.majorcity_id)
+                                        for row in batch}))
+
+
+def _plan_tiles(destinations_by_origin,
+                max_origins=DISTANCE_MATRIX_API_MAX_ORIGINS,
+                max_destinations=DISTANCE_MATRIX_API_MAX_DESTINATIONS,
+                max_elements=DISTANCE_MATRIX_API_MAX_ELEMENTS):
+    """
+    Packs origin --> destination requirements into request tiles. Origins
+    that need the exact same set of destinations are grouped together, and
+    each group is cut into origin x destination blocks using the block shape
+    that needs the fewest requests within the API limits.
+
+    INPUTS:
+        destinations_by_origin (dict): origin key --> list of destination keys
+        max_origins (int): origin limit per request
+        max_destinations (int): destination limit per request
+        max_elements (int): origins x destinations limit per request
+    OUTPUT:
+        Array of [origin keys, destination keys] pairs, one per request.
+    """
+    # group origins by their (sorted, unique) destination set
+    groups = {}
+    for origin, destinations in destinations_by_origin.items():
+        destination_set = tuple(sorted(set(destinations)))
+        if destination_set:
+            groups.setdefault(destination_set, []).append(origin)
+
+    tiles = []
+    for destinations, origins in groups.items():
+        n_origins, n_destinations = _get_tile_shape(len(origins),
+                    len(destinations), max_origins, max_destinations,
+                    max_elements)
+
+        for o_start, o_end in _get_slice_indices(len(origins), n_origins):
+            for d_start, d_end in _get_slice_indices(len(destinations),
+                                                     n_destinations):
+                tiles.append([origins[o_start:o_end],
+                              list(destinations[d_start:d_end])])
+
+    return tiles
+
+
+def _get_tile_shape(n_origins, n_destinations, max_origins, max_destinations,
+                    max_elements):
+    """
+    Returns the [origins, destinations] block size that covers an
+    n_origins x n_destinations matrix in the fewest requests without
+    exceeding the per-request API limits.
+    """
+    best = None
+    for block_dest in range(1, min(n_destinations, max_destinations) + 1):
+        block_orig = min(n_origins, max_origins, max_elements // block_dest)
+        if block_orig < 1:
+            break
+        n_requests = (math.ceil(n_origins / block_orig) *
+                      math.ceil(n_destinations / block_dest))
+        if best is None or n_requests < best[0]:
+            best = (n_requests, block_orig, block_dest)
+
+    return [best[1], best[2]]
+
+
+def _get_pks(objects):
+    """
+    Returns the list of primary keys for a list of model instances and/or
+    primary keys, or None if "objects" is None.
+    """
+    if objects is None:
+        return None
+    return [getattr(obj, 'pk', obj) for obj in objects]
 
 
 def _get_slice_indices(length, multiple):
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Destination, Route, Trailhead, County, Jurisdiction, GoverningBody, MajorCity, Profile, DriveTimeMajorCity
+from .models import Destination, Route, Trailhead, County, Jurisdiction, GoverningBody, MajorCity, Profile, DriveTimeMajorCity, DriveTimeJob
 
 # Register your models here.
 admin.site.register(Destination)
@@ -18,3 +18,10 @@ class DriveTimeMajorCityAdmin(admin.ModelAdmin):
         'drive_distance', 'date_updated', 'api_call_status', 'error_message')
     list_filter = ('majorcity', 'trailhead', 'drive_time',
         'drive_distance', 'date_updated', 'api_call_status', 'error_message')
+
+
+@admin.register(DriveTimeJob)
+class DriveTimeJobAdmin(admin.ModelAdmin):
+    list_display = ('trailhead', 'status', 'attempts', 'date_created',
+        'date_updated', 'error_message')
+    list_filter = ('status',)
@@ -0,0 +1,58 @@
+from django.core.management.base import BaseCommand
+from planner.PlannerUtils import constructURL, httpClient
+import requests
+import statistics
+import time
+
+class Command(BaseCommand):
+    help = ('Compares the per-call latency of repeated GET requests to one ' +
+            'host with a new connection per call (bare requests.get) and ' +
+            'with the pooled keep-alive session of httpClient.')
+
+    def add_arguments(self, parser):
+        # Named (optional arguments)
+        parser.add_argument(
+            '--url',
+            type=str,
+            dest='url',
+            default=constructURL.buildNOAApointsURL(39.7392, -104.9903),
+            help='URL to request (default: NOAA points API, Denver)',
+        )
+
+        parser.add_argument(
+            '--calls',
+            type=int,
+            dest='calls',
+            default=10,
+            help='Number of requests per client (default 10)',
+        )
+
+    def handle(self, *args, **options):
+        url = options['url']
+        timeout = httpClient.getTimeout()
+
+        def bare_get():
+            requests.get(url, headers=httpClient.HEADERS, timeout=timeout)
+
+        session = httpClient.newSession()
+
+        def pooled_get():
+            httpClient.get(url, session=session)
+
+        self.stdout.write("GET " + url + " x " + str(options['calls']))
+        for name, call in [("new connection", bare_get),
+                           ("pooled session", pooled_get)]:
+            times = []
+            for _ in range(options['calls']):
+                start = time.perf_counter()
+                call()
+                times.append((time.perf_counter() - start) * 1000)
+
+            # the first pooled call opens the connection the others reuse
+            self.stdout.write(
+                ("{0}: first {1:.0f} ms, then median {2:.0f} ms, " +
+                 "mean {3:.0f} ms").format(
+                    name, times[0], statistics.median(times[1:] or times),
+                    statistics.mean(times[1:] or times)))
+
+        session.close()
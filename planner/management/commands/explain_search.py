@@ -0,0 +1,67 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.http import QueryDict
+from planner.models import MajorCity
+from planner.views import DestinationSearchView
+
+# search form parameter sets covering each filter, as submitted by the
+# destination search page
+SAMPLE_SEARCHES = [
+    "",
+    "max_drive_time=90",
+    "max_drive_time=180&dest_type=m",
+    "min_length=4&max_length=10&max_gain=3000",
+    "min_class=2&max_class=3&max_drive_distance=150",
+    "path_seq=l&dest_type=l&max_drive_time=120",
+    "dest_name=peak",
+]
+
+class Command(BaseCommand):
+    help = ('Prints the database query plan of the destination search for ' +
+            'a sample of search parameter sets, to review index use.')
+
+    def add_arguments(self, parser):
+        # Named (optional arguments)
+        parser.add_argument(
+            '--city',
+            type=int,
+            dest='city',
+            help='MajorCity id to search from (default: the first one)',
+        )
+
+        parser.add_argument(
+            '--params-file',
+            type=str,
+            dest='params_file',
+            help=('File with one search query string per line (e.g. ' +
+                  '"max_drive_time=90&dest_type=m"), instead of the ' +
+                  'built-in sample'),
+        )
+
+        parser.add_argument(
+            '--analyze',
+            action='store_true',
+            dest='analyze',
+            help='Run the queries and show actual times (PostgreSQL only)',
+        )
+
+    def handle(self, *args, **options):
+        if options['city'] is not None:
+            city = MajorCity.objects.filter(pk=options['city']).first()
+        else:
+            city = MajorCity.objects.order_by('pk').first()
+        if city is None:
+            raise CommandError("No major city to search from")
+
+        if options['params_file']:
+            with open(options['params_file']) as f:
+                searches = [line.strip() for line in f]
+        else:
+            searches = SAMPLE_SEARCHES
+
+        explain_options = {'analyze': True} if options['analyze'] else {}
+        for query_string in searches:
+            queryset = DestinationSearchView.search_queryset(
+                                city, QueryDict(query_string))
+            self.stdout.write("=== " + (query_string or "(no filters)"))
+            self.stdout.write(queryset.explain(**explain_options))
+            self.stdout.write("")
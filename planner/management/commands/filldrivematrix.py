@@ -5,9 +5,21 @@ class Command(BaseCommand):
     help = ('Adds any missing trailhead-major city combinations in the ' +
             'DriveTimeMajorCity table/intermediate model.')
 
+    def add_arguments(self, parser):
+        # Named (optional arguments)
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            dest='batch_size',
+            default=updateTable.BULK_CREATE_BATCH_SIZE,
+            help=('Number of rows inserted per INSERT statement (default ' +
+                  str(updateTable.BULK_CREATE_BATCH_SIZE) + ')'),
+        )
+
     def handle(self, *args, **options):
         # create new drive time matrix table entries
-        output = updateTable.createNewDriveTimeEntries()
+        output = updateTable.createNewDriveTimeEntries(
+                    batch_size=options['batch_size'])
         # print output
         for s in output['print_output']:
             self.stdout.write(s)
@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+from planner.PlannerUtils import sunTimesTable
+
+class Command(BaseCommand):
+    help = ('Adds sun times for the upcoming days of every trailhead and ' +
+            'destination to the SunTimes table, and deletes past days. ' +
+            'Run daily.')
+
+    def add_arguments(self, parser):
+        # Named (optional arguments)
+        parser.add_argument(
+            '--days',
+            type=int,
+            dest='days',
+            default=sunTimesTable.DEFAULT_DAYS,
+            help=('Number of days to fill, starting today (default ' +
+                  str(sunTimesTable.DEFAULT_DAYS) + ')'),
+        )
+
+        parser.add_argument(
+            '--keep-days',
+            type=int,
+            dest='keep_days',
+            default=sunTimesTable.DEFAULT_KEEP_DAYS,
+            help=('Past days to keep when pruning (default ' +
+                  str(sunTimesTable.DEFAULT_KEEP_DAYS) + ')'),
+        )
+
+        parser.add_argument(
+            '--no-prune',
+            action='store_false',
+            dest='prune',
+            help='Do not delete past days',
+        )
+
+    def handle(self, *args, **options):
+        output = sunTimesTable.fillSunTimes(days=options['days'])
+
+        # print output
+        for s in output['print_output']:
+            self.stdout.write(s)
+
+        if options['prune']:
+            deleted = sunTimesTable.pruneSunTimes(options['keep_days'])
+            self.stdout.write("Past entries deleted: " + str(deleted))
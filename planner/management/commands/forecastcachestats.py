@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand
+from planner.PlannerUtils import forecastCache
+
+class Command(BaseCommand):
+    help = ('Reports the hit ratio and number of stored entries of the ' +
+            'NOAA forecast cache.')
+
+    def add_arguments(self, parser):
+        # Named (optional arguments)
+        parser.add_argument(
+            '--reset',
+            action='store_true',
+            dest='reset',
+            help='Set the hit and miss counters to zero after reporting',
+        )
+
+        parser.add_argument(
+            '--clear',
+            action='store_true',
+            dest='clear',
+            help='Delete all cached forecasts and grid cell lookups',
+        )
+
+    def handle(self, *args, **options):
+        stats = forecastCache.getStats()
+
+        if stats['hit_ratio'] is None:
+            hit_ratio = "n/a"
+        else:
+            hit_ratio = "{0:.1%}".format(stats['hit_ratio'])
+        self.stdout.write("Hits: {0}, misses: {1}, hit ratio: {2}".format(
+                          stats['hits'], stats['misses'], hit_ratio))
+        self.stdout.write("Stale hits (served while refreshing): " +
+                          str(stats['stale']))
+        self.stdout.write("Stored forecasts (grid cells): " +
+                          str(stats['forecasts']))
+        self.stdout.write("Stored point lookups: " + str(stats['grid_cells']))
+
+        if options['reset']:
+            forecastCache.resetStats()
+            self.stdout.write("Counters reset")
+        if options['clear']:
+            forecastCache.clear()
+            self.stdout.write("Cache cleared")
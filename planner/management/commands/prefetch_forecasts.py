@@ -0,0 +1,63 @@
+from django.core.management.base import BaseCommand
+from planner.models import Destination, Trailhead
+from planner.PlannerUtils import forecastCache
+
+class Command(BaseCommand):
+    help = ('Fetches the NOAA forecasts of every destination and trailhead ' +
+            'into the forecast cache, so detail pages read cached ' +
+            'forecasts. Only missing or stale grid cells are fetched. ' +
+            'Run more often than the forecast time to live.')
+
+    def add_arguments(self, parser):
+        # Named (optional arguments)
+        parser.add_argument(
+            '--workers',
+            type=int,
+            dest='workers',
+            default=forecastCache.DEFAULT_PREFETCH_WORKERS,
+            help=('Number of concurrent requests (default ' +
+                  str(forecastCache.DEFAULT_PREFETCH_WORKERS) + ')'),
+        )
+
+        parser.add_argument(
+            '--rps',
+            type=float,
+            dest='requests_per_second',
+            default=forecastCache.DEFAULT_PREFETCH_RATE,
+            help=('Maximum NOAA API requests per second (default ' +
+                  str(forecastCache.DEFAULT_PREFETCH_RATE) + ')'),
+        )
+
+        parser.add_argument(
+            '--refresh-margin',
+            type=float,
+            dest='refresh_margin',
+            default=forecastCache.DEFAULT_REFRESH_MARGIN,
+            help=('Refetch forecasts that expire within this many seconds ' +
+                  '(default ' + str(forecastCache.DEFAULT_REFRESH_MARGIN) +
+                  ')'),
+        )
+
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            dest='force',
+            help='Fetch every grid cell, including fresh ones',
+        )
+
+    def handle(self, *args, **options):
+        locations = []
+        for model in (Destination, Trailhead):
+            locations += list(model.objects.values_list('latitude',
+                                                        'longitude'))
+
+        output = forecastCache.prefetchForecasts(
+                    locations,
+                    workers=options['workers'],
+                    requests_per_second=options['requests_per_second'],
+                    refresh_margin=options['refresh_margin'],
+                    force=options['force'])
+
+        # print output
+        for s in output['print_output']:
+            self.stdout.write(s)
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from planner.PlannerUtils import jobQueue
+import time
+
+class Command(BaseCommand):
+    help = ('Processes queued background jobs (drive time recalculation ' +
+            'for new or moved trailheads).')
+
+    def add_arguments(self, parser):
+        # Named (optional arguments)
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            dest='once',
+            help='Process the pending jobs, then exit',
+        )
+
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            dest='poll_interval',
+            default=5,
+            help='Seconds to wait between checks of an empty queue (default 5)',
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            output = jobQueue.runPendingJobs()
+            # print output
+            for s in output['print_output']:
+                self.stdout.write(s)
+
+            if options['once']:
+                break
+
+            if output['num_run'] == 0:
+                # drop stale database connections while idle
+                close_old_connections()
+                time.sleep(options['poll_interval'])
@@ -1,5 +1,6 @@
 from django.core.management.base import BaseCommand
 from planner.PlannerUtils import updateTable
+import json
 
 class Command(BaseCommand):
     help = ('Updates trailhead-major city combinations in the ' +
@@ -31,18 +32,153 @@ class Command(BaseCommand):
                   'entries'),
         )
 
+        parser.add_argument(
+            '--workers',
+            type=int,
+            dest='workers',
+            default=1,
+            help='Number of concurrent API requests (default 1)',
+        )
+
+        parser.add_argument(
+            '--rps',
+            type=float,
+            dest='rps',
+            default=None,
+            help='Maximum API requests per second (default: no limit)',
+        )
+
+        parser.add_argument(
+            '--eps',
+            type=float,
+            dest='eps',
+            default=None,
+            help=('Maximum API elements (origins x destinations) per ' +
+                  'second (default: no limit)'),
+        )
+
+        parser.add_argument(
+            '--no-cache',
+            action='store_false',
+            dest='use_cache',
+            help=('Request every entry from the API instead of using ' +
+                  'cached drive times'),
+        )
+
+        parser.add_argument(
+            '--stale-after',
+            type=int,
+            dest='stale_after',
+            default=None,
+            help=('Also refresh OK entries last updated more than DAYS ' +
+                  'days ago, after error and new entries'),
+            metavar='DAYS',
+        )
+
+        parser.add_argument(
+            '--budget',
+            type=int,
+            dest='budget',
+            default=None,
+            help=('Maximum number of API requests, retries included; the ' +
+                  'highest priority entries (errors, new, oldest) are ' +
+                  'sent first'),
+            metavar='N',
+        )
+
+        parser.add_argument(
+            '--max-retries',
+            type=int,
+            dest='max_retries',
+            default=updateTable.DEFAULT_MAX_RETRIES,
+            help=('Retries of entries with transient API errors in the ' +
+                  'same run (default ' +
+                  str(updateTable.DEFAULT_MAX_RETRIES) + ')'),
+        )
+
+        parser.add_argument(
+            '--plan',
+            action='store_true',
+            dest='plan',
+            help=('Dry run: print the API requests, billed elements and ' +
+                  'estimated time of the update without making any ' +
+                  'API requests'),
+        )
+
+        parser.add_argument(
+            '--plan-file',
+            dest='plan_file',
+            default=None,
+            help='With --plan, also write the plan as JSON to FILE',
+            metavar='FILE',
+        )
+
+        parser.add_argument(
+            '--execute-plan',
+            dest='execute_plan',
+            default=None,
+            help=('Send exactly the API requests of a plan written with ' +
+                  '--plan-file'),
+            metavar='FILE',
+        )
+
     def handle(self, *args, **options):
-        # update drive time matrix table entries
-        if options['error_only']:
-            output = updateTable.updateDriveTimeEntries(run_new=False,
-                                                        run_errors=True)
+        # concurrency, rate limit and cache settings
+        rate_kwargs = {
+            'workers': options['workers'],
+            'requests_per_second': options['rps'],
+            'elements_per_second': options['eps'],
+            'use_cache': options['use_cache'],
+        }
+
+        if options['execute_plan']:
+            with open(options['execute_plan']) as f:
+                plan = json.load(f)
+            output = updateTable.executeDriveTimePlan(plan,
+                                    max_retries=options['max_retries'],
+                                    budget=options['budget'],
+                                    **rate_kwargs)
+            for s in output['print_output']:
+                self.stdout.write(s)
+            self.stdout.write("API requests made: {0}".format(
+                              output['num_requests']))
+            return
+
+        # rows to update
+        if options['stale_after'] is not None:
+            # errors, new and stale entries, in that priority order
+            selection_kwargs = {'run_new': True, 'run_errors': True,
+                                'stale_after': options['stale_after']}
+        elif options['error_only']:
+            selection_kwargs = {'run_new': False, 'run_errors': True}
         elif options['allentries']:
-            output = updateTable.updateDriveTimeEntries(run_new=True,
-                                                        run_errors=True)
+            selection_kwargs = {'run_new': True, 'run_errors': True}
         else:
             # default (run new, omit errors)
-            output = updateTable.updateDriveTimeEntries()
+            selection_kwargs = {}
+        selection_kwargs['budget'] = options['budget']
+
+        if options['plan']:
+            plan = updateTable.planDriveTimeEntries(**selection_kwargs,
+                                                    **rate_kwargs)
+            for s in plan.pop('print_output'):
+                self.stdout.write(s)
+            if options['plan_file']:
+                with open(options['plan_file'], 'w') as f:
+                    json.dump(plan, f)
+                self.stdout.write("Plan written to " + options['plan_file'])
+            return
+
+        # update drive time matrix table entries
+        output = updateTable.updateDriveTimeEntries(
+                                    max_retries=options['max_retries'],
+                                    **selection_kwargs, **rate_kwargs)
 
         # print output
         for s in output['print_output']:
             self.stdout.write(s)
+        self.stdout.write("API requests made: {0} (per-origin plan: {1})"
+                          .format(output['num_requests'],
+                                  output['num_requests_per_origin']))
+        self.stdout.write("Cache hits: {0}, misses: {1}".format(
+                          output['cache_hits'], output['cache_misses']))
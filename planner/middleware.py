@@ -0,0 +1,24 @@
+from .PlannerUtils import apiMetrics
+
+
+class ViewLabelMiddleware:
+    """
+    Stores the URL name of the view handling the request in
+    apiMetrics.current_view, so slow external API calls can be logged with
+    the view that made them.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = apiMetrics.current_view.set(None)
+        try:
+            return self.get_response(request)
+        finally:
+            apiMetrics.current_view.reset(token)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        match = request.resolver_match
+        apiMetrics.current_view.set(match.view_name if match
+                                    else view_func.__name__)
@@ -0,0 +1,41 @@
+# Generated by Django 2.1.3 on 2026-10-18 18:45
+
+from django.db import migrations
+
+
+def delete_duplicate_drive_times(apps, schema_editor):
+    # rows created before the constraint may repeat a (trailhead, major
+    # city) pair: keep the most recently updated one (the highest id on
+    # ties)
+    DriveTimeMajorCity = apps.get_model('planner', 'DriveTimeMajorCity')
+    seen = set()
+    duplicates = []
+    for pk, trailhead_id, majorcity_id in (
+            DriveTimeMajorCity.objects
+            .order_by('-date_updated', '-id')
+            .values_list('id', 'trailhead_id', 'majorcity_id')):
+        pair = (trailhead_id, majorcity_id)
+        if pair in seen:
+            duplicates.append(pk)
+        else:
+            seen.add(pair)
+
+    for start in range(0, len(duplicates), 500):
+        DriveTimeMajorCity.objects.filter(
+            pk__in=duplicates[start:start + 500]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('planner', '0010_auto_20181117_1748'),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_duplicate_drive_times,
+                             migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='drivetimemajorcity',
+            unique_together={('trailhead', 'majorcity')},
+        ),
+    ]
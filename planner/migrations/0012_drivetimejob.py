@@ -0,0 +1,33 @@
+# Generated by Django 2.1.3 on 2026-10-18 18:49
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('planner', '0011_auto_20261018_1145'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DriveTimeJob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.IntegerField(choices=[(1, 'Pending'), (2, 'Running'), (3, 'Done'), (4, 'Failed')], default=1)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('error_message', models.CharField(blank=True, default='', max_length=1000)),
+                ('date_created', models.DateTimeField(auto_now_add=True)),
+                ('date_updated', models.DateTimeField(auto_now=True)),
+                ('trailhead', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='drive_jobs', to='planner.Trailhead')),
+            ],
+            options={
+                'ordering': ['date_created'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='drivetimejob',
+            index=models.Index(fields=['status', 'date_created'], name='planner_dri_status_58cc01_idx'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 2.1.3 on 2026-10-18 18:50
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('planner', '0012_drivetimejob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='drivetimejob',
+            name='majorcity',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='drive_jobs', to='planner.MajorCity'),
+        ),
+        migrations.AlterField(
+            model_name='drivetimejob',
+            name='trailhead',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='drive_jobs', to='planner.Trailhead'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 2.1.3 on 2026-10-18 18:51
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('planner', '0013_drivetimejob_majorcity'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DistanceMatrixCache',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=40, unique=True)),
+                ('origin', models.CharField(max_length=50)),
+                ('destination', models.CharField(max_length=50)),
+                ('drive_distance', models.FloatField(validators=[django.core.validators.MinValueValidator(0)])),
+                ('drive_time', models.FloatField(validators=[django.core.validators.MinValueValidator(0)])),
+                ('date_cached', models.DateTimeField(db_index=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 2.1.3 on 2026-10-18 18:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('planner', '0014_distancematrixcache'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='drivetimemajorcity',
+            index=models.Index(fields=['api_call_status', 'date_updated'], name='planner_dri_api_cal_d25d95_idx'),
+        ),
+    ]
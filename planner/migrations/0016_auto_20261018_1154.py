@@ -0,0 +1,23 @@
+# Generated by Django 2.1.3 on 2026-10-18 18:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('planner', '0015_drivetimemajorcity_status_date_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='drivetimemajorcity',
+            name='attempt_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='drivetimemajorcity',
+            name='next_attempt_date',
+            field=models.DateField(blank=True, null=True),
+        ),
+    ]
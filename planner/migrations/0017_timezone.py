@@ -0,0 +1,37 @@
+# Generated by Django 2.1.3 on 2026-10-18 19:03
+
+from django.db import migrations, models
+
+
+def fill_timezones(apps, schema_editor):
+    # resolve the time zone of existing rows (skipped without timezonefinder;
+    # rows are filled on their next save)
+    from planner.PlannerUtils import timezones
+
+    for model_name in ['Trailhead', 'Destination']:
+        model = apps.get_model('planner', model_name)
+        for obj in model.objects.all():
+            tz_name = timezones.lookupTimezone(obj.latitude, obj.longitude)
+            if tz_name:
+                model.objects.filter(pk=obj.pk).update(timezone=tz_name)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('planner', '0016_auto_20261018_1154'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='destination',
+            name='timezone',
+            field=models.CharField(blank=True, editable=False, max_length=50),
+        ),
+        migrations.AddField(
+            model_name='trailhead',
+            name='timezone',
+            field=models.CharField(blank=True, editable=False, max_length=50),
+        ),
+        migrations.RunPython(fill_timezones, migrations.RunPython.noop),
+    ]
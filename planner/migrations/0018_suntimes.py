@@ -0,0 +1,41 @@
+# Generated by Django 2.1.3 on 2026-10-18 19:04
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('planner', '0017_timezone'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SunTimes',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('object_id', models.PositiveIntegerField()),
+                ('date', models.DateField()),
+                ('first_light', models.TimeField(blank=True, null=True)),
+                ('sunrise', models.TimeField(blank=True, null=True)),
+                ('sunset', models.TimeField(blank=True, null=True)),
+                ('last_light', models.TimeField(blank=True, null=True)),
+                ('day_length', models.PositiveIntegerField(help_text='seconds')),
+                ('timezone', models.CharField(max_length=10)),
+                ('content_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='contenttypes.ContentType')),
+            ],
+            options={
+                'verbose_name_plural': 'sun times',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='suntimes',
+            index=models.Index(fields=['date'], name='planner_sun_date_fc0c93_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='suntimes',
+            unique_together={('content_type', 'object_id', 'date')},
+        ),
+    ]
@@ -0,0 +1,76 @@
+# Generated by Django 2.1.3 on 2026-10-18 19:17
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_route_search(apps, schema_editor):
+    # one row per route and major city with an OK drive time, as
+    # RouteSearch.refresh() (historical models have no custom methods)
+    Route = apps.get_model('planner', 'Route')
+    DriveTimeMajorCity = apps.get_model('planner', 'DriveTimeMajorCity')
+    RouteSearch = apps.get_model('planner', 'RouteSearch')
+
+    routes_by_trailhead = {}
+    for route in Route.objects.filter(
+                    trailhead__isnull=False).select_related('destination'):
+        routes_by_trailhead.setdefault(route.trailhead_id, []).append(route)
+
+    rows = []
+    for drive in DriveTimeMajorCity.objects.filter(
+                    api_call_status=2, drive_time__isnull=False,
+                    drive_distance__isnull=False):
+        for route in routes_by_trailhead.get(drive.trailhead_id, []):
+            rows.append(RouteSearch(
+                route_id=route.pk, majorcity_id=drive.majorcity_id,
+                trailhead_id=route.trailhead_id,
+                destination_id=route.destination_id, route_name=route.name,
+                total_distance=route.total_distance, gain=route.gain,
+                class_rating=route.class_rating, path_seq=route.path_seq,
+                destination_name=route.destination.name,
+                dest_type=route.destination.dest_type,
+                drive_time=drive.drive_time,
+                drive_distance=drive.drive_distance))
+    RouteSearch.objects.bulk_create(rows, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('planner', '0018_suntimes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RouteSearch',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('route_name', models.CharField(max_length=100)),
+                ('total_distance', models.FloatField()),
+                ('gain', models.IntegerField()),
+                ('class_rating', models.PositiveSmallIntegerField()),
+                ('path_seq', models.CharField(max_length=3)),
+                ('destination_name', models.CharField(max_length=100)),
+                ('dest_type', models.CharField(max_length=2)),
+                ('drive_time', models.FloatField()),
+                ('drive_distance', models.FloatField()),
+                ('destination', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='planner.Destination')),
+                ('majorcity', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='planner.MajorCity')),
+                ('route', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='planner.Route')),
+                ('trailhead', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='planner.Trailhead')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='routesearch',
+            index=models.Index(fields=['majorcity', 'drive_time'], name='planner_rou_majorci_ffc68b_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='routesearch',
+            index=models.Index(fields=['majorcity', 'dest_type', 'drive_time'], name='planner_rou_majorci_f1b730_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='routesearch',
+            unique_together={('route', 'majorcity')},
+        ),
+        migrations.RunPython(fill_route_search, migrations.RunPython.noop),
+    ]
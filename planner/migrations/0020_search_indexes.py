@@ -0,0 +1,28 @@
+# Generated by Django 2.1.3 on 2026-10-18 19:18
+
+from django.db import migrations, models
+
+# drive times of the OK rows (api_call_status = DriveTimeMajorCity.OK) by
+# major city, for the RouteSearch rebuilds and drive time lookups. Partial
+# indexes are written in SQL: Index has no condition before Django 2.2.
+# The syntax is the same in PostgreSQL and SQLite.
+PARTIAL_INDEX_NAME = 'planner_dtmc_ok_city_time_idx'
+CREATE_PARTIAL_INDEX = (
+    'CREATE INDEX ' + PARTIAL_INDEX_NAME + ' ON planner_drivetimemajorcity '
+    '(majorcity_id, drive_time) WHERE api_call_status = 2')
+DROP_PARTIAL_INDEX = 'DROP INDEX ' + PARTIAL_INDEX_NAME
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('planner', '0019_routesearch'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='route',
+            index=models.Index(fields=['trailhead', 'total_distance', 'gain'], name='planner_rou_trailhe_e7fa4a_idx'),
+        ),
+        migrations.RunSQL([CREATE_PARTIAL_INDEX], [DROP_PARTIAL_INDEX]),
+    ]
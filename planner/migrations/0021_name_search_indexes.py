@@ -0,0 +1,89 @@
+from django.db import migrations, OperationalError
+
+# name search indexes, see PlannerUtils/nameSearch.py.
+# PostgreSQL: trigram GIN indexes on the expression name__icontains filters
+# on, UPPER(name::text), so substring searches do not scan the table.
+# SQLite: FTS5 trigram tables over the names, synced by triggers. SQLite
+# rebuilds a table to alter it, which drops its triggers: a later migration
+# altering one of these tables must recreate them (run these functions).
+TABLES = ['planner_destination', 'planner_route', 'planner_trailhead']
+
+
+def _pg_index(table):
+    return table + '_name_trgm_idx'
+
+
+def _fts(table):
+    return table + '_name_fts'
+
+
+def create_name_search_indexes(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        for table in TABLES:
+            schema_editor.execute(
+                'CREATE INDEX ' + _pg_index(table) + ' ON ' + table +
+                ' USING gin (UPPER(name::text) gin_trgm_ops)')
+    elif vendor == 'sqlite' and _sqlite_has_trigram(schema_editor):
+        for table in TABLES:
+            fts = _fts(table)
+            schema_editor.execute(
+                'CREATE VIRTUAL TABLE ' + fts + ' USING fts5(name, '
+                'content=' + table + ', content_rowid=id, '
+                'tokenize=trigram)')
+            schema_editor.execute(
+                'CREATE TRIGGER ' + fts + '_ai AFTER INSERT ON ' + table +
+                ' BEGIN INSERT INTO ' + fts + '(rowid, name) '
+                'VALUES (new.id, new.name); END')
+            schema_editor.execute(
+                'CREATE TRIGGER ' + fts + '_ad AFTER DELETE ON ' + table +
+                ' BEGIN INSERT INTO ' + fts + '(' + fts + ', rowid, name) '
+                "VALUES ('delete', old.id, old.name); END")
+            schema_editor.execute(
+                'CREATE TRIGGER ' + fts + '_au AFTER UPDATE OF name ON ' +
+                table + ' BEGIN INSERT INTO ' + fts + '(' + fts +
+                ", rowid, name) VALUES ('delete', old.id, old.name); "
+                'INSERT INTO ' + fts + '(rowid, name) '
+                'VALUES (new.id, new.name); END')
+            schema_editor.execute(
+                'INSERT INTO ' + fts + '(' + fts + ") VALUES ('rebuild')")
+
+
+def drop_name_search_indexes(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        for table in TABLES:
+            schema_editor.execute('DROP INDEX IF EXISTS ' + _pg_index(table))
+    elif vendor == 'sqlite':
+        for table in TABLES:
+            fts = _fts(table)
+            for suffix in ('_ai', '_ad', '_au'):
+                schema_editor.execute('DROP TRIGGER IF EXISTS ' + fts +
+                                      suffix)
+            schema_editor.execute('DROP TABLE IF EXISTS ' + fts)
+
+
+def _sqlite_has_trigram(schema_editor):
+    # the FTS5 trigram tokenizer needs SQLite 3.34 built with FTS5; without
+    # it name searches use name__icontains
+    with schema_editor.connection.cursor() as cursor:
+        try:
+            cursor.execute('CREATE VIRTUAL TABLE temp.planner_trigram_check '
+                           'USING fts5(name, tokenize=trigram)')
+        except OperationalError:
+            return False
+        cursor.execute('DROP TABLE temp.planner_trigram_check')
+    return True
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('planner', '0020_search_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_name_search_indexes,
+                             drop_name_search_indexes),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.1.3 on 2026-10-18 19:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('planner', '0022_nameindexversion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='drivetimejob',
+            name='run_after',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
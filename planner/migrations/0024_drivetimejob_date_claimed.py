@@ -0,0 +1,18 @@
+# Generated by Django 2.1.3 on 2026-10-18 19:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('planner', '0023_drivetimejob_run_after'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='drivetimejob',
+            name='date_claimed',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -1,16 +1,18 @@
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import F, Q
 from django.urls import reverse
 from django.core.validators import MinLengthValidator, MaxLengthValidator, MinValueValidator, MaxValueValidator
 from django.contrib.auth.models import User
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.contenttypes.fields import GenericForeignKey, GenericRelation
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save, pre_save
 from django.dispatch import receiver
 from datetime import date
 import math
 
 # from django.contrib.auth.models import User
 from .PlannerUtils import constructURL
+from .PlannerUtils import timezones
 
 # Create your models here.
 class Destination(models.Model):
@@ -41,6 +43,9 @@ class Destination(models.Model):
                                  verbose_name='Destination Type')
     jurisdiction = models.ForeignKey('Jurisdiction',on_delete=models.SET_NULL, null=True)
     description = models.TextField(max_length=5000, blank=True)
+    # IANA time zone, resolved from the coordinates on save
+    timezone = models.CharField(max_length=50, blank=True, editable=False)
+    sun_times = GenericRelation('SunTimes')
 
 
     # ---- METADATA ----------------
@@ -142,6 +147,9 @@ class Route(models.Model):
     # ----- METADATA --------------
     class Meta:
         ordering = ['name']
+        # RouteSearch rebuilds select the routes of trailheads
+        indexes = [models.Index(fields=['trailhead', 'total_distance',
+                                        'gain'])]
 
     # ----- METHODS ----------------
     def get_absolute_url(self):
@@ -261,6 +269,9 @@ class Trailhead(models.Model):
                                      null=True)
     majorcity = models.ManyToManyField('MajorCity',
                                        through='DriveTimeMajorCity')
+    # IANA time zone, resolved from the coordinates on save
+    timezone = models.CharField(max_length=50, blank=True, editable=False)
+    sun_times = GenericRelation('SunTimes')
 
     # ----- METADATA --------------
     class Meta:
@@ -359,6 +370,19 @@ class DriveTimeMajorCity(models.Model):
     api_call_status = models.IntegerField(choices=LAST_API_CALL_STATUS,
                     default=NEW_ITEM)
     error_message = models.CharField(max_length=1000, default="")
+    # consecutive permanent API errors (e.g. no route), and the date before
+    # which the combination is not requested again
+    attempt_count = models.PositiveIntegerField(default=0)
+    next_attempt_date = models.DateField(null=True, blank=True)
+
+    # ----- METADATA --------------------
+    class Meta:
+        # one row per combination, so concurrent table fills cannot duplicate
+        unique_together = (('trailhead', 'majorcity'),)
+        # refresh candidates are picked by status, oldest first. Migration
+        # 0020 adds a partial index on (majorcity, drive_time) of the OK rows
+        # (Index has no condition before Django 2.2)
+        indexes = [models.Index(fields=['api_call_status', 'date_updated'])]
 
     @property
     def api_call_status_expanded(self):
@@ -382,6 +406,306 @@ class DriveTimeMajorCity(models.Model):
         return str(hours) + ' hr ' + str(minutes) + ' min'
 
 
+class DistanceMatrixCache(models.Model):
+    """
+    Google Distance Matrix API result for one origin --> destination
+    coordinate pair. Keyed by a hash of the coordinates rounded to
+    settings.DISTANCE_CACHE_PRECISION decimals, so drive-matrix refreshes
+    only request pairs that are not already known.
+    """
+    key = models.CharField(max_length=40, unique=True)
+    origin = models.CharField(max_length=50)
+    destination = models.CharField(max_length=50)
+    drive_distance = models.FloatField(validators=[MinValueValidator(0)])
+    drive_time = models.FloatField(validators=[MinValueValidator(0)])
+    date_cached = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return "{0} --> {1}".format(self.origin, self.destination)
+
+
+class SunTimes(models.Model):
+    """
+    Model containing the precomputed sun times of a location (Trailhead or
+    Destination) on a date, in the location's local time
+    """
+    # ----- FIELDS --------------------
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+    object_id = models.PositiveIntegerField()
+    location = GenericForeignKey('content_type', 'object_id')
+    date = models.DateField()
+    # None if the sun doesn't rise/set or reach civil twilight that day
+    first_light = models.TimeField(null=True, blank=True)
+    sunrise = models.TimeField(null=True, blank=True)
+    sunset = models.TimeField(null=True, blank=True)
+    last_light = models.TimeField(null=True, blank=True)
+    day_length = models.PositiveIntegerField(help_text='seconds')
+    # zone abbreviation on that date, e.g. "MDT"
+    timezone = models.CharField(max_length=10)
+
+    # ----- METADATA --------------
+    class Meta:
+        # one row per location and date; also the lookup index
+        unique_together = (('content_type', 'object_id', 'date'),)
+        indexes = [models.Index(fields=['date'])]
+        verbose_name_plural = 'sun times'
+
+    # ----- METHODS ----------------
+    @property
+    def sun_data(self):
+        """ sun times in quickAPI.sunTimeData() format """
+        return {
+            "status": "OK",
+            "message": "",
+            "first_light": self.first_light,
+            "sunrise": self.sunrise,
+            "sunset": self.sunset,
+            "last_light": self.last_light,
+            "day_length": self.day_length,
+            "timezone": self.timezone,
+        }
+
+    def __str__(self):
+        return "{0} ({1})".format(self.location, self.date)
+
+
+class RouteSearch(models.Model):
+    """
+    Denormalized destination search table: one row per route and major city
+    with a drive time from the route's trailhead, holding every field the
+    search filters and sorts on. Kept current by the Route, Destination and
+    DriveTimeMajorCity hooks (and by updateTable, whose bulk updates send no
+    signals).
+    """
+    # ----- FIELDS --------------------
+    route = models.ForeignKey(Route, on_delete=models.CASCADE)
+    majorcity = models.ForeignKey(MajorCity, on_delete=models.CASCADE)
+    trailhead = models.ForeignKey(Trailhead, on_delete=models.CASCADE)
+    destination = models.ForeignKey(Destination, on_delete=models.CASCADE)
+    route_name = models.CharField(max_length=100)
+    total_distance = models.FloatField()
+    gain = models.IntegerField()
+    class_rating = models.PositiveSmallIntegerField()
+    path_seq = models.CharField(max_length=3)
+    destination_name = models.CharField(max_length=100)
+    dest_type = models.CharField(max_length=2)
+    drive_time = models.FloatField()
+    drive_distance = models.FloatField()
+
+    # ----- METADATA --------------
+    class Meta:
+        unique_together = (('route', 'majorcity'),)
+        # a search is a range scan of one major city's rows in drive time
+        # order (Django 2.1 has no INCLUDE columns for covering indexes)
+        indexes = [
+            models.Index(fields=['majorcity', 'drive_time']),
+            models.Index(fields=['majorcity', 'dest_type', 'drive_time']),
+        ]
+
+    # ----- METHODS ----------------
+    @classmethod
+    def refresh(cls, routes=None, trailheads=None, majorcities=None,
+                pairs=None):
+        """
+        Rebuilds the rows of the given routes, trailheads, major cities and
+        (trailhead id, major city id) pairs (lists, combined with AND; all
+        rows if none is given) from the Route and DriveTimeMajorCity
+        tables. Returns the number of rows.
+        """
+        if pairs is not None and not pairs:
+            return 0
+        try:
+            return cls._rebuild(routes, trailheads, majorcities, pairs)
+        except IntegrityError:
+            # a concurrent refresh inserted some of the same rows first
+            return cls._rebuild(routes, trailheads, majorcities, pairs)
+
+    @classmethod
+    def _rebuild(cls, routes, trailheads, majorcities, pairs=None):
+        route_qs = Route.objects.filter(trailhead__isnull=False)
+        drive_qs = DriveTimeMajorCity.objects.filter(
+                        api_call_status=DriveTimeMajorCity.OK,
+                        drive_time__isnull=False,
+                        drive_distance__isnull=False)
+        old_rows = cls.objects.all()
+        if pairs is not None:
+            pair_filter = Q()
+            for trailhead_id, majorcity_id in pairs:
+                pair_filter |= Q(trailhead=trailhead_id,
+                                 majorcity=majorcity_id)
+            route_qs = route_qs.filter(
+                            trailhead__in={pair[0] for pair in pairs})
+            drive_qs = drive_qs.filter(pair_filter)
+            old_rows = old_rows.filter(pair_filter)
+        if routes is not None:
+            route_qs = route_qs.filter(pk__in=routes)
+            old_rows = old_rows.filter(route__in=routes)
+        if trailheads is not None:
+            route_qs = route_qs.filter(trailhead__in=trailheads)
+            drive_qs = drive_qs.filter(trailhead__in=trailheads)
+            old_rows = old_rows.filter(trailhead__in=trailheads)
+        if majorcities is not None:
+            drive_qs = drive_qs.filter(majorcity__in=majorcities)
+            old_rows = old_rows.filter(majorcity__in=majorcities)
+
+        routes_by_trailhead = {}
+        for route in route_qs.select_related('destination'):
+            routes_by_trailhead.setdefault(route.trailhead_id,
+                                           []).append(route)
+        if routes is None and not routes_by_trailhead:
+            # no routes start at these trailheads, so there are no rows
+            # (rows of a route are removed by its own refresh when it moves)
+            return 0
+
+        with transaction.atomic():
+            if routes is not None:
+                drive_qs = drive_qs.filter(
+                                trailhead__in=list(routes_by_trailhead))
+
+            new_rows = [cls.from_route(route, drive)
+                        for drive in drive_qs
+                        for route in routes_by_trailhead.get(
+                                                    drive.trailhead_id, [])]
+            old_rows.delete()
+            cls.objects.bulk_create(new_rows, batch_size=500)
+
+        return len(new_rows)
+
+    @classmethod
+    def from_route(cls, route, drive):
+        """
+        Returns the (unsaved) row of a route and one of its trailhead's
+        DriveTimeMajorCity entries.
+        """
+        return cls(route_id=route.pk, majorcity_id=drive.majorcity_id,
+                   trailhead_id=route.trailhead_id,
+                   destination_id=route.destination_id,
+                   route_name=route.name,
+                   total_distance=route.total_distance, gain=route.gain,
+                   class_rating=route.class_rating, path_seq=route.path_seq,
+                   destination_name=route.destination.name,
+                   dest_type=route.destination.dest_type,
+                   drive_time=drive.drive_time,
+                   drive_distance=drive.drive_distance)
+
+    def get_absolute_url(self):
+        return reverse('route-detail', args=[str(self.route_id)])
+
+    def get_destination_url(self):
+        return reverse('destination-detail', args=[str(self.destination_id)])
+
+    def __str__(self):
+        return "{0} ({1})".format(self.route_name, self.majorcity_id)
+
+
+class DriveTimeJob(models.Model):
+    """
+    Queued request to recalculate the DriveTimeMajorCity entries of a
+    trailhead or a major city. Jobs are processed outside of the web request
+    by the "runworker" management command.
+    """
+    PENDING = 1
+    RUNNING = 2
+    DONE = 3
+    FAILED = 4
+
+    JOB_STATUS = (
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+        )
+
+    trailhead = models.ForeignKey(Trailhead, on_delete=models.CASCADE,
+                                  related_name="drive_jobs", null=True)
+    majorcity = models.ForeignKey(MajorCity, on_delete=models.CASCADE,
+                                  related_name="drive_jobs", null=True)
+    status = models.IntegerField(choices=JOB_STATUS, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    error_message = models.CharField(max_length=1000, default="", blank=True)
+    # a retried job is not run before this time (None: run when claimed)
+    run_after = models.DateTimeField(null=True, blank=True)
+    # time the job was last marked RUNNING by a worker
+    date_claimed = models.DateTimeField(null=True, blank=True)
+    date_created = models.DateTimeField(auto_now_add=True)
+    date_updated = models.DateTimeField(auto_now=True)
+
+    # ----- METADATA --------------------
+    class Meta:
+        ordering = ['date_created']
+        indexes = [models.Index(fields=['status', 'date_created'])]
+
+    # ----- METHODS ---------------------
+    @classmethod
+    def enqueue(cls, trailhead=None, majorcity=None):
+        """
+        Queues a drive time recalculation for the trailhead or major city.
+        Requests for a trailhead/city that already has a pending job are
+        coalesced into it (the oldest one, if a retried job was queued next
+        to it).
+        """
+        job = cls.objects.filter(trailhead=trailhead, majorcity=majorcity,
+                                 status=cls.PENDING).first()
+        if job is None:
+            job = cls.objects.create(trailhead=trailhead, majorcity=majorcity)
+        return job
+
+    @classmethod
+    def is_pending(cls, trailhead):
+        """
+        True if a recalculation for the trailhead is queued or running.
+        """
+        return cls.objects.filter(trailhead=trailhead,
+                                  status__in=[cls.PENDING, cls.RUNNING]
+                                  ).exists()
+
+    @property
+    def status_expanded(self):
+        return dict(self.JOB_STATUS)[self.status]
+
+    def __str__(self):
+        target = self.trailhead if self.trailhead_id else self.majorcity
+        return "{0} ({1})".format(target, self.status_expanded)
+
+
+class NameIndexVersion(models.Model):
+    """
+    Version counter of a model's names, bumped on each save and delete of
+    the model. Web workers compare it with the version their in-memory name
+    index was built at (PlannerUtils.nameIndex), so a change made in one
+    worker is seen by all of them.
+    """
+    label = models.CharField(max_length=100, unique=True)
+    version = models.PositiveIntegerField(default=0)
+
+    @classmethod
+    def bump(cls, model):
+        """
+        Increments the version of "model", in the current transaction.
+        """
+        label = model._meta.label
+        if not cls.objects.filter(label=label).update(
+                                        version=F('version') + 1):
+            try:
+                with transaction.atomic():
+                    cls.objects.create(label=label, version=1)
+            except IntegrityError:
+                # created by a concurrent bump
+                cls.objects.filter(label=label).update(
+                                        version=F('version') + 1)
+
+    @classmethod
+    def current(cls, model):
+        """
+        Returns the version of "model" (0 if it was never bumped).
+        """
+        return cls.objects.filter(label=model._meta.label).values_list(
+                                        'version', flat=True).first() or 0
+
+    def __str__(self):
+        return "{0} ({1})".format(self.label, self.version)
+
+
 class Profile(models.Model):
     """
     Model containing data specific to a given user
@@ -432,6 +756,87 @@ def save_user_profile(sender, instance, **kwargs):
     instance.profile.save()
 
 
+# hook for Trailhead and Destination models to their time zone
+@receiver(pre_save, sender=Trailhead)
+@receiver(pre_save, sender=Destination)
+def set_timezone(sender, instance, raw=False, **kwargs):
+    # fixtures keep their stored time zone
+    if not raw:
+        instance.timezone = (timezones.lookupTimezone(instance.latitude,
+                                                      instance.longitude)
+                             or instance.timezone)
+
+
+@receiver(pre_save, sender=Trailhead)
+@receiver(pre_save, sender=Destination)
+def check_moved(sender, instance, raw=False, **kwargs):
+    # compare the coordinates with the stored ones, for reset_sun_times
+    stored = None
+    if instance.pk is not None and not raw:
+        stored = sender.objects.filter(pk=instance.pk).values_list(
+                                        'latitude', 'longitude').first()
+    instance._moved = (stored is not None and
+                       stored != (instance.latitude, instance.longitude))
+
+
+@receiver(post_save, sender=Trailhead)
+@receiver(post_save, sender=Destination)
+def reset_sun_times(sender, instance, created, raw=False, **kwargs):
+    # rows of a moved location are computed again on demand and by the
+    # fillsuntimes command
+    if not created and not raw and getattr(instance, '_moved', False):
+        instance.sun_times.all().delete()
+
+
+# hooks for Route, Destination and DriveTimeMajorCity models to the
+# RouteSearch table
+@receiver(post_save, sender=Route)
+def refresh_route_search(sender, instance, raw=False, **kwargs):
+    if not raw:
+        RouteSearch.refresh(routes=[instance.pk])
+
+
+@receiver(post_save, sender=Destination)
+def update_route_search_destination(sender, instance, created, raw=False,
+                                    **kwargs):
+    if not created and not raw:
+        RouteSearch.objects.filter(destination=instance).update(
+            destination_name=instance.name, dest_type=instance.dest_type)
+
+
+@receiver(post_save, sender=DriveTimeMajorCity)
+def refresh_route_search_drive_time(sender, instance, raw=False, **kwargs):
+    if not raw:
+        RouteSearch.refresh(trailheads=[instance.trailhead_id],
+                            majorcities=[instance.majorcity_id])
+
+
+@receiver(post_delete, sender=DriveTimeMajorCity)
+def delete_route_search_drive_time(sender, instance, **kwargs):
+    RouteSearch.objects.filter(trailhead_id=instance.trailhead_id,
+                               majorcity_id=instance.majorcity_id).delete()
+
+
+# hooks for the autocomplete models to their in-memory name indexes
+@receiver(post_save, sender=Trailhead)
+@receiver(post_save, sender=Route)
+@receiver(post_save, sender=Destination)
+@receiver(post_delete, sender=Trailhead)
+@receiver(post_delete, sender=Route)
+@receiver(post_delete, sender=Destination)
+def invalidate_name_index(sender, **kwargs):
+    NameIndexVersion.bump(sender)
+
+
+# hook for MajorCity model to the drive time table
+@receiver(post_save, sender=MajorCity)
+def queue_major_city_drive_times(sender, instance, created, raw=False,
+                                 **kwargs):
+    # new major city: only its own column of the table needs to be added
+    if created and not raw:
+        DriveTimeJob.enqueue(majorcity=instance)
+
+
 # ---------- Links ------------------------------------
 class Link(models.Model):
     """
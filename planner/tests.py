@@ -1,3 +1,1255 @@
+from django.db import IntegrityError, connection
+from django.db.models.signals import post_save
+from django.contrib.auth.models import User
+from django.core.management import call_command
 from django.test import TestCase
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from datetime import date, datetime, timedelta
+from datetime import timezone as dt_timezone
+from io import StringIO
+import json
+import threading
+import time
+from unittest import mock
+import requests
+from urllib.parse import urlparse, parse_qs
+from .models import Trailhead, MajorCity, DriveTimeMajorCity, DriveTimeJob
+from .models import DistanceMatrixCache, Destination, Route
+from .models import RouteSearch, NameIndexVersion
+from .models import refresh_route_search_drive_time
+from .PlannerUtils import updateTable, jobQueue, forecastCache, apiMetrics
+from .PlannerUtils import sunTimesTable, circuitBreaker, keysetPagination
+from .PlannerUtils import nameSearch, nameIndex
 
-# Create your tests here.
+
+LOCMEM_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'forecast': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                 'LOCATION': 'forecast-tests'},
+}
+
+
+def fake_distance_matrix(requestURL):
+    """
+    Stand-in for accessAPI.googleMapsDistanceAPI. The distance of each
+    element encodes its origin/destination coordinates so results can be
+    checked against the row they were written to.
+    """
+    params = parse_qs(urlparse(requestURL).query)
+    origins = params["origins"][0].split("|")
+    destinations = params["destinations"][0].split("|")
+    return {
+        "status": "OK",
+        "rows": [{"elements": [{
+                    "status": "OK",
+                    "distance": {"value": _fake_value(o, d), "text": ""},
+                    "duration": {"value": _fake_value(o, d), "text": ""},
+                 } for d in destinations]} for o in origins],
+    }
+
+
+def _fake_value(origin, destination):
+    return float(origin.split(",")[0]) * 1000 + float(destination.split(",")[0])
+
+
+class CreateNewDriveTimeEntriesTest(TestCase):
+
+    def setUp(self):
+        self.cities = [MajorCity.objects.create(name="City {0}".format(i),
+                                                latitude=40, longitude=-105)
+                       for i in range(3)]
+        self.trailheads = [Trailhead.objects.create(
+                                name="Trailhead {0}".format(i),
+                                latitude=40, longitude=-105)
+                           for i in range(4)]
+
+    def test_adds_full_cross_product(self):
+        output = updateTable.createNewDriveTimeEntries()
+        self.assertEqual(output['num_added'], 12)
+        self.assertEqual(DriveTimeMajorCity.objects.count(), 12)
+
+    def test_only_adds_missing_combinations(self):
+        DriveTimeMajorCity.objects.create(trailhead=self.trailheads[0],
+                                          majorcity=self.cities[0])
+        output = updateTable.createNewDriveTimeEntries()
+        self.assertEqual(output['num_added'], 11)
+        self.assertEqual(DriveTimeMajorCity.objects.count(), 12)
+
+    def test_second_run_adds_nothing(self):
+        updateTable.createNewDriveTimeEntries()
+        output = updateTable.createNewDriveTimeEntries()
+        self.assertEqual(output['num_added'], 0)
+        self.assertEqual(DriveTimeMajorCity.objects.count(), 12)
+
+    def test_query_count_independent_of_table_size(self):
+        # 3 loads + one INSERT (wrapped in savepoints inside the test
+        # transaction), regardless of the number of cities x trailheads
+        with self.assertNumQueries(6):
+            updateTable.createNewDriveTimeEntries(batch_size=1000)
+
+    def test_retries_after_concurrent_insert(self):
+        real_create = updateTable._create_missing_entries
+        calls = []
+
+        def create_once_conflicting(*args):
+            calls.append(args)
+            if len(calls) == 1:
+                raise IntegrityError("concurrent insert")
+            return real_create(*args)
+
+        with mock.patch.object(updateTable, "_create_missing_entries",
+                               side_effect=create_once_conflicting):
+            output = updateTable.createNewDriveTimeEntries(
+                                            trailheads=[self.trailheads[0]])
+        self.assertEqual(calls[0], calls[1])
+        self.assertEqual(output['num_added'], len(self.cities))
+
+    def test_timing_stats_returned(self):
+        output = updateTable.createNewDriveTimeEntries()
+        for key in ('load', 'diff', 'insert', 'total'):
+            self.assertIn(key, output['timing'])
+
+
+class UpdateDriveTimeEntriesTest(TestCase):
+
+    def setUp(self):
+        for i in range(30):
+            MajorCity.objects.create(name="City {0}".format(i),
+                                     latitude=i, longitude=-105)
+        for i in range(7):
+            Trailhead.objects.create(name="Trailhead {0}".format(i),
+                                     latitude=50 + i, longitude=-105)
+        updateTable.createNewDriveTimeEntries()
+
+    @mock.patch("planner.PlannerUtils.accessAPI.googleMapsDistanceAPI",
+                side_effect=fake_distance_matrix)
+    def test_elements_mapped_to_rows(self, api):
+        output = updateTable.updateDriveTimeEntries()
+        self.assertEqual(output['num_updated'], 210)
+
+        for row in DriveTimeMajorCity.objects.select_related('trailhead',
+                                                             'majorcity'):
+            self.assertEqual(row.api_call_status, DriveTimeMajorCity.OK)
+            self.assertEqual(row.drive_distance,
+                             _fake_value(row.majorcity.latlon_str,
+                                         row.trailhead.latlon_str))
+
+    @mock.patch("planner.PlannerUtils.accessAPI.googleMapsDistanceAPI",
+                side_effect=fake_distance_matrix)
+    def test_fewer_requests_than_per_origin_plan(self, api):
+        output = updateTable.updateDriveTimeEntries()
+        # 30 cities x 7 trailheads = 210 elements --> 3 requests
+        self.assertEqual(output['num_requests'], 3)
+        self.assertEqual(api.call_count, 3)
+        self.assertEqual(output['num_requests_per_origin'], 30)
+
+    @mock.patch("planner.PlannerUtils.accessAPI.googleMapsDistanceAPI",
+                side_effect=fake_distance_matrix)
+    def test_concurrent_run_matches_serial(self, api):
+        updateTable.updateDriveTimeEntries(workers=1)
+        serial = list(DriveTimeMajorCity.objects.order_by('pk').values_list(
+                        'drive_distance', 'drive_time', 'api_call_status'))
+
+        DriveTimeMajorCity.objects.update(
+            api_call_status=DriveTimeMajorCity.NEW_ITEM, drive_distance=None,
+            drive_time=None)
+        updateTable.updateDriveTimeEntries(workers=4,
+                                           requests_per_second=1000)
+        concurrent = list(DriveTimeMajorCity.objects.order_by('pk')
+                          .values_list('drive_distance', 'drive_time',
+                                       'api_call_status'))
+        self.assertEqual(serial, concurrent)
+
+    @mock.patch("planner.PlannerUtils.accessAPI.googleMapsDistanceAPI",
+                return_value={"status": "OVER_DAILY_LIMIT"})
+    def test_stops_on_daily_limit(self, api):
+        output = updateTable.updateDriveTimeEntries(workers=1)
+        self.assertEqual(api.call_count, 1)
+        self.assertEqual(output['num_requests'], 1)
+        self.assertEqual(output['num_requests_skipped'], 2)
+        # rows are left for the next run, not marked as errors
+        self.assertFalse(DriveTimeMajorCity.objects.exclude(
+            api_call_status=DriveTimeMajorCity.NEW_ITEM).exists())
+
+
+class DriveTimePlanTest(TestCase):
+
+    def setUp(self):
+        for i in range(30):
+            MajorCity.objects.create(name="City {0}".format(i),
+                                     latitude=i, longitude=-105)
+        for i in range(7):
+            Trailhead.objects.create(name="Trailhead {0}".format(i),
+                                     latitude=50 + i, longitude=-105)
+        updateTable.createNewDriveTimeEntries()
+
+    @mock.patch("planner.PlannerUtils.accessAPI.googleMapsDistanceAPI")
+    def test_plan_makes_no_requests_or_writes(self, api):
+        plan = updateTable.planDriveTimeEntries(requests_per_second=2)
+        self.assertFalse(api.called)
+        self.assertEqual(plan['num_requests'], 3)
+        self.assertEqual(plan['num_elements'], 210)
+        self.assertEqual(plan['num_rows'], 210)
+        self.assertAlmostEqual(plan['estimated_seconds'], 1.5)
+        self.assertFalse(DriveTimeMajorCity.objects.exclude(
+            api_call_status=DriveTimeMajorCity.NEW_ITEM).exists())
+
+    @mock.patch("planner.PlannerUtils.accessAPI.googleMapsDistanceAPI",
+                side_effect=fake_distance_matrix)
+    def test_execute_json_plan(self, api):
+        plan = json.loads(json.dumps(updateTable.planDriveTimeEntries()))
+        output = updateTable.executeDriveTimePlan(plan, use_cache=False)
+        self.assertEqual(api.call_count, plan['num_requests'])
+        self.assertEqual(output['num_updated'], 210)
+        for row in DriveTimeMajorCity.objects.select_related('trailhead',
+                                                             'majorcity'):
+            self.assertEqual(row.drive_distance,
+                             _fake_value(row.majorcity.latlon_str,
+                                         row.trailhead.latlon_str))
+
+    @mock.patch("planner.PlannerUtils.accessAPI.googleMapsDistanceAPI",
+                side_effect=fake_distance_matrix)
+    def test_execute_skips_changed_rows(self, api):
+        plan = updateTable.planDriveTimeEntries()
+        trailhead = Trailhead.objects.get(name="Trailhead 0")
+        Trailhead.objects.filter(pk=trailhead.pk).update(latitude=10)
+
+        output = updateTable.executeDriveTimePlan(plan, use_cache=False)
+        self.assertEqual(output['num_rows_changed'], 30)
+        self.assertEqual(output['num_updated'], 180)
+        self.assertFalse(DriveTimeMajorCity.objects.filter(
+            trailhead=trailhead).exclude(
+            api_call_status=DriveTimeMajorCity.NEW_ITEM).exists())
+
+
+class DriveTimeRetryTest(TestCase):
+
+    def setUp(self):
+        MajorCity.objects.create(name="Denver", latitude=39.7, longitude=-105)
+        Trailhead.objects.create(name="Trailhead", latitude=40, longitude=-105)
+        updateTable.createNewDriveTimeEntries()
+
+    @mock.patch("planner.PlannerUtils.updateTable.time.sleep")
+    @mock.patch("planner.PlannerUtils.accessAPI.googleMapsDistanceAPI")
+    def test_transient_error_retried(self, api, sleep):
+        responses = [{"status": "UNKNOWN_ERROR"}, {"status": "UNKNOWN_ERROR"}]
+        api.side_effect = lambda url: (responses.pop() if responses
+                                       else fake_distance_matrix(url))
+        output = updateTable.updateDriveTimeEntries(use_cache=False,
+                                                    max_retries=2)
+        self.assertEqual(api.call_count, 3)
+        self.assertEqual(sleep.call_count, 2)
+        self.assertEqual(output['num_retries'], 2)
+        self.assertEqual(DriveTimeMajorCity.objects.get().api_call_status,
+                         DriveTimeMajorCity.OK)
+
+    @mock.patch("planner.PlannerUtils.updateTable.time.sleep")
+    @mock.patch("planner.PlannerUtils.accessAPI.googleMapsDistanceAPI")
+    def test_retries_count_against_budget(self, api, sleep):
+        Trailhead.objects.create(name="Other", latitude=45, longitude=-100)
+        updateTable.createNewDriveTimeEntries()
+        api.return_value = {"status": "UNKNOWN_ERROR"}
+
+        # the requests use up the budget: the errors are not retried
+        output = updateTable.updateDriveTimeEntries(
+                    use_cache=False, max_retries=2, budget=1,
+                    origin_type="trailhead")
+        self.assertEqual(api.call_count, 1)
+        self.assertEqual(output['num_retries'], 0)
+        self.assertFalse(DriveTimeMajorCity.objects.exclude(
+                            api_call_status=DriveTimeMajorCity.ERROR).exists())
+
+        # one request left for retries
+        api.reset_mock()
+        output = updateTable.updateDriveTimeEntries(
+                    run_errors=True, use_cache=False, max_retries=2,
+                    budget=2, origin_type="trailhead")
+        self.assertEqual(api.call_count, 2)
+        self.assertEqual(output['num_retries'], 1)
+
+    @mock.patch("planner.PlannerUtils.updateTable.time.sleep")
+    @mock.patch("planner.PlannerUtils.accessAPI.googleMapsDistanceAPI",
+                return_value={"status": "UNKNOWN_ERROR"})
+    def test_transient_error_marked_after_last_retry(self, api, sleep):
+        updateTable.updateDriveTimeEntries(use_cache=False, max_retries=1)
+        self.assertEqual(api.call_count, 2)
+        row = DriveTimeMajorCity.objects.get()
+        self.assertEqual(row.api_call_status, DriveTimeMajorCity.ERROR)
+        # transient errors do not back off to a later date
+        self.assertIsNone(row.next_attempt_date)
+
+    @mock.patch("planner.PlannerUtils.updateTable.time.sleep")
+    @mock.patch("planner.PlannerUtils.accessAPI.googleMapsDistanceAPI",
+                return_value={"status": "OK", "rows": [{"elements": [
+                                {"status": "ZERO_RESULTS"}]}]})
+    def test_permanent_error_backs_off(self, api, sleep):
+        updateTable.updateDriveTimeEntries(use_cache=False)
+        self.assertEqual(api.call_count, 1)
+        self.assertFalse(sleep.called)
+        row = DriveTimeMajorCity.objects.get()
+        self.assertEqual(row.api_call_status, DriveTimeMajorCity.ERROR)
+        self.assertEqual(row.attempt_count, 1)
+        self.assertEqual(row.next_attempt_date, date.today() + timedelta(
+                            days=updateTable.PERMANENT_ERROR_BACKOFF_DAYS))
+
+        # not requested again before the next attempt date
+        updateTable.updateDriveTimeEntries(run_errors=True, use_cache=False)
+        self.assertEqual(api.call_count, 1)
+
+        DriveTimeMajorCity.objects.update(next_attempt_date=date.today())
+        updateTable.updateDriveTimeEntries(run_errors=True, use_cache=False)
+        self.assertEqual(api.call_count, 2)
+        row = DriveTimeMajorCity.objects.get()
+        self.assertEqual(row.attempt_count, 2)
+        self.assertEqual(row.next_attempt_date, date.today() + timedelta(
+                            days=2 * updateTable.PERMANENT_ERROR_BACKOFF_DAYS))
+
+
+class DistanceMatrixCacheTest(TestCase):
+
+    def setUp(self):
+        for i in range(3):
+            MajorCity.objects.create(name="City {0}".format(i),
+                                     latitude=i, longitude=-105)
+        for i in range(4):
+            Trailhead.objects.create(name="Trailhead {0}".format(i),
+                                     latitude=50 + i, longitude=-105)
+        updateTable.createNewDriveTimeEntries()
+
+    @mock.patch("planner.PlannerUtils.accessAPI.googleMapsDistanceAPI",
+                side_effect=fake_distance_matrix)
+    def test_second_refresh_served_from_cache(self, api):
+        first = updateTable.updateDriveTimeEntries()
+        self.assertEqual(first['cache_misses'], 12)
+        self.assertEqual(DistanceMatrixCache.objects.count(), 12)
+
+        DriveTimeMajorCity.objects.update(
+            api_call_status=DriveTimeMajorCity.NEW_ITEM, drive_distance=None)
+        api.reset_mock()
+        second = updateTable.updateDriveTimeEntries()
+
+        self.assertEqual(api.call_count, 0)
+        self.assertEqual(second['cache_hits'], 12)
+        self.assertEqual(second['num_updated'], 12)
+        for row in DriveTimeMajorCity.objects.select_related('trailhead',
+                                                             'majorcity'):
+            self.assertEqual(row.drive_distance,
+                             _fake_value(row.majorcity.latlon_str,
+                                         row.trailhead.latlon_str))
+
+    @mock.patch("planner.PlannerUtils.accessAPI.googleMapsDistanceAPI",
+                side_effect=fake_distance_matrix)
+    def test_expired_entries_are_requested_again(self, api):
+        updateTable.updateDriveTimeEntries()
+        DistanceMatrixCache.objects.update(
+            date_cached=timezone.now() - timedelta(days=365))
+        DriveTimeMajorCity.objects.update(
+            api_call_status=DriveTimeMajorCity.NEW_ITEM)
+
+        output = updateTable.updateDriveTimeEntries()
+        self.assertEqual(output['cache_hits'], 0)
+        self.assertEqual(output['cache_misses'], 12)
+
+
+class StaleDriveTimeRefreshTest(TestCase):
+
+    def setUp(self):
+        self.city = MajorCity.objects.create(name="City", latitude=1,
+                                             longitude=-105)
+        for i in range(4):
+            Trailhead.objects.create(name="Trailhead {0}".format(i),
+                                     latitude=50 + i, longitude=-105)
+        updateTable.createNewDriveTimeEntries()
+        self.rows = list(DriveTimeMajorCity.objects.order_by('trailhead'))
+        today = date.today()
+        # [0] recent OK, [1] old OK, [2] error, [3] new
+        self._set(self.rows[0], DriveTimeMajorCity.OK, today)
+        self._set(self.rows[1], DriveTimeMajorCity.OK,
+                  today - timedelta(days=100))
+        self._set(self.rows[2], DriveTimeMajorCity.ERROR,
+                  today - timedelta(days=5))
+
+    def _set(self, row, status, date_updated):
+        row.api_call_status = status
+        row.date_updated = date_updated
+        row.save()
+
+    def test_priority_order(self):
+        rows = updateTable._select_rows(True, True, 30, None, None, None)
+        self.assertEqual([row.pk for row in rows],
+                         [self.rows[2].pk, self.rows[3].pk, self.rows[1].pk])
+
+    @mock.patch("planner.PlannerUtils.accessAPI.googleMapsDistanceAPI",
+                side_effect=fake_distance_matrix)
+    def test_refreshes_stale_rows(self, api):
+        output = updateTable.updateDriveTimeEntries(run_errors=True,
+                                                    stale_after=30)
+        self.assertEqual(output['num_updated'], 3)
+        self.rows[1].refresh_from_db()
+        self.assertEqual(self.rows[1].date_updated, date.today())
+
+    def test_row_limit_drops_lowest_priority(self):
+        rows = updateTable._select_rows(True, True, 30, 2, None, None)
+        self.assertEqual([row.pk for row in rows],
+                         [self.rows[2].pk, self.rows[3].pk])
+
+    @mock.patch("planner.PlannerUtils.accessAPI.googleMapsDistanceAPI",
+                side_effect=fake_distance_matrix)
+    def test_budget_limits_requests(self, api):
+        # all candidates share one destination, so they pack in one request
+        output = updateTable.updateDriveTimeEntries(run_errors=True,
+                                                    stale_after=30, budget=1,
+                                                    origin_type="trailhead")
+        self.assertEqual(api.call_count, 1)
+        self.assertEqual(output['num_updated'], 3)
+        self.assertEqual(output['num_rows_deferred'], 0)
+
+
+class DriveTimeWriteBackBenchmark(TestCase):
+    """
+    Counts database queries for refreshing 1,000 DriveTimeMajorCity rows,
+    comparing per-row save() write-back with the bulk write-back.
+    """
+
+    def setUp(self):
+        for i in range(40):
+            MajorCity.objects.create(name="City {0}".format(i),
+                                     latitude=i, longitude=-105)
+        for i in range(25):
+            Trailhead.objects.create(name="Trailhead {0}".format(i),
+                                     latitude=50 + i, longitude=-105)
+        updateTable.createNewDriveTimeEntries()
+
+    def test_queries_per_1000_rows(self):
+        # before: one UPDATE per row. The RouteSearch refresh of each save
+        # is disconnected, so only the write-back itself is counted
+        rows = list(DriveTimeMajorCity.objects.all())
+        self.assertEqual(len(rows), 1000)
+        post_save.disconnect(refresh_route_search_drive_time,
+                             sender=DriveTimeMajorCity)
+        try:
+            with CaptureQueriesContext(connection) as per_row_save:
+                for row in rows:
+                    row.save()
+        finally:
+            post_save.connect(refresh_route_search_drive_time,
+                              sender=DriveTimeMajorCity)
+
+        # after: full refresh with bulk write-back
+        with mock.patch("planner.PlannerUtils.accessAPI.googleMapsDistanceAPI",
+                        side_effect=fake_distance_matrix):
+            with CaptureQueriesContext(connection) as bulk:
+                output = updateTable.updateDriveTimeEntries(use_cache=False)
+
+        self.assertEqual(output['num_updated'], 1000)
+        self.assertEqual(len(per_row_save), 1000)
+        self.assertLess(len(bulk), 100,
+                        "bulk write-back: {0} queries, per-row save(): {1} "
+                        "queries".format(len(bulk), len(per_row_save)))
+
+    def test_batch_of_null_values(self):
+        DriveTimeMajorCity.objects.update(next_attempt_date=date.today(),
+                                          drive_distance=1.5)
+        rows = list(DriveTimeMajorCity.objects.all())
+        for row in rows:
+            row.next_attempt_date = None
+            row.drive_distance = None
+        with CaptureQueriesContext(connection) as queries:
+            updateTable._bulk_update_rows(
+                rows, ["next_attempt_date", "drive_distance"])
+
+        self.assertFalse(DriveTimeMajorCity.objects.filter(
+                            next_attempt_date__isnull=False).exists())
+        self.assertFalse(DriveTimeMajorCity.objects.filter(
+                            drive_distance__isnull=False).exists())
+        if connection.vendor == "postgresql":
+            self.assertTrue(any("::date" in query['sql']
+                                for query in queries))
+
+
+class DriveTimeJobQueueTest(TestCase):
+
+    def setUp(self):
+        self.city = MajorCity.objects.create(name="City", latitude=1,
+                                             longitude=-105)
+        self.trailhead = Trailhead.objects.create(name="Trailhead",
+                                                  latitude=50, longitude=-105)
+        # drop the job queued by adding the major city
+        DriveTimeJob.objects.all().delete()
+
+    def test_enqueue_coalesces_pending_jobs(self):
+        first = DriveTimeJob.enqueue(self.trailhead)
+        second = DriveTimeJob.enqueue(self.trailhead)
+        self.assertEqual(first.pk, second.pk)
+        self.assertTrue(DriveTimeJob.is_pending(self.trailhead))
+
+    @mock.patch("planner.PlannerUtils.accessAPI.googleMapsDistanceAPI",
+                side_effect=fake_distance_matrix)
+    def test_worker_calculates_drive_times(self, api):
+        DriveTimeJob.enqueue(self.trailhead)
+        output = jobQueue.runPendingJobs()
+
+        self.assertEqual(output['num_run'], 1)
+        self.assertFalse(DriveTimeJob.is_pending(self.trailhead))
+        row = DriveTimeMajorCity.objects.get(trailhead=self.trailhead)
+        self.assertEqual(row.api_call_status, DriveTimeMajorCity.OK)
+
+    @mock.patch("planner.PlannerUtils.updateTable.updateDriveTimeEntries",
+                side_effect=RuntimeError("boom"))
+    def test_failed_job_is_retried_then_failed(self, update):
+        job = DriveTimeJob.enqueue(self.trailhead)
+        for i in range(jobQueue.MAX_JOB_ATTEMPTS):
+            output = jobQueue.runPendingJobs()
+            # each attempt waits for its retry time
+            self.assertEqual(output['num_run'], 1)
+            DriveTimeJob.objects.update(run_after=None)
+        job.refresh_from_db()
+        self.assertEqual(job.status, DriveTimeJob.FAILED)
+        self.assertEqual(job.attempts, jobQueue.MAX_JOB_ATTEMPTS)
+        self.assertEqual(job.error_message, "boom")
+
+    @mock.patch("planner.PlannerUtils.updateTable.updateDriveTimeEntries",
+                side_effect=RuntimeError("boom"))
+    def test_failed_job_waits_before_retry(self, update):
+        job = DriveTimeJob.enqueue(self.trailhead)
+        before = timezone.now()
+        jobQueue.runPendingJobs()
+        job.refresh_from_db()
+        self.assertEqual(job.status, DriveTimeJob.PENDING)
+        self.assertGreaterEqual(job.run_after,
+                                before + jobQueue.RETRY_DELAY)
+        self.assertIsNone(jobQueue._claim_next_job())
+
+        # the second retry waits twice as long
+        DriveTimeJob.objects.update(run_after=before)
+        jobQueue.runPendingJobs()
+        job.refresh_from_db()
+        self.assertGreaterEqual(job.run_after,
+                                before + 2 * jobQueue.RETRY_DELAY)
+
+    def test_abandoned_running_job_is_released(self):
+        job = DriveTimeJob.enqueue(self.trailhead)
+        jobQueue._claim_next_job()
+        # a second worker leaves the job to the first one
+        self.assertIsNone(jobQueue._claim_next_job())
+
+        # the first worker was stopped
+        DriveTimeJob.objects.update(
+            date_claimed=timezone.now() - jobQueue.JOB_TIMEOUT -
+            timedelta(seconds=1))
+        self.assertIsNone(jobQueue._claim_next_job())
+        job.refresh_from_db()
+        self.assertEqual(job.status, DriveTimeJob.PENDING)
+        self.assertEqual(job.attempts, 1)
+        self.assertTrue(DriveTimeJob.is_pending(self.trailhead))
+
+        DriveTimeJob.objects.update(run_after=None)
+        claimed = jobQueue._claim_next_job()
+        self.assertEqual(claimed[1], [job.pk])
+
+    def test_enqueue_after_failed_job(self):
+        DriveTimeJob.enqueue(self.trailhead)
+        claimed = jobQueue._claim_next_job()
+        # the trailhead is edited while its job runs
+        queued = DriveTimeJob.enqueue(self.trailhead)
+        jobQueue._finish_jobs(claimed[1], error=RuntimeError("boom"))
+
+        self.assertEqual(DriveTimeJob.enqueue(self.trailhead).pk, queued.pk)
+        self.assertEqual(DriveTimeJob.objects.filter(
+            trailhead=self.trailhead, status=DriveTimeJob.PENDING).count(), 1)
+
+    def test_enqueue_with_duplicate_pending_jobs(self):
+        first = DriveTimeJob.objects.create(trailhead=self.trailhead)
+        DriveTimeJob.objects.create(trailhead=self.trailhead)
+        self.assertEqual(DriveTimeJob.enqueue(self.trailhead).pk, first.pk)
+
+    def test_new_major_city_queues_job(self):
+        city = MajorCity.objects.create(name="New City", latitude=2,
+                                        longitude=-105)
+        self.assertTrue(DriveTimeJob.objects.filter(
+            majorcity=city, status=DriveTimeJob.PENDING).exists())
+
+    @mock.patch("planner.PlannerUtils.accessAPI.googleMapsDistanceAPI",
+                side_effect=fake_distance_matrix)
+    def test_major_city_job_only_touches_its_column(self, api):
+        other = Trailhead.objects.create(name="Other", latitude=51,
+                                         longitude=-105)
+        updateTable.createNewDriveTimeEntries()
+        DriveTimeJob.objects.all().delete()
+
+        city = MajorCity.objects.create(name="New City", latitude=2,
+                                        longitude=-105)
+        jobQueue.runPendingJobs()
+
+        self.assertEqual(DriveTimeMajorCity.objects.filter(
+            majorcity=city, api_call_status=DriveTimeMajorCity.OK).count(), 2)
+        # rows of the other city were not requested
+        self.assertEqual(DriveTimeMajorCity.objects.filter(
+            majorcity=self.city,
+            api_call_status=DriveTimeMajorCity.NEW_ITEM).count(), 2)
+        # the other trailhead only got its row of the new city
+        self.assertEqual(DriveTimeMajorCity.objects.get(
+            trailhead=other, majorcity=city).api_call_status,
+            DriveTimeMajorCity.OK)
+        self.assertEqual(DriveTimeMajorCity.objects.get(
+            trailhead=other, majorcity=self.city).api_call_status,
+            DriveTimeMajorCity.NEW_ITEM)
+
+
+class ScopedDriveTimeEntriesTest(TestCase):
+
+    def setUp(self):
+        self.cities = [MajorCity.objects.create(name="City {0}".format(i),
+                                                latitude=i, longitude=-105)
+                       for i in range(3)]
+        self.trailheads = [Trailhead.objects.create(
+                                name="Trailhead {0}".format(i),
+                                latitude=50 + i, longitude=-105)
+                           for i in range(4)]
+
+    def test_create_scoped_to_trailhead(self):
+        output = updateTable.createNewDriveTimeEntries(
+                                trailheads=[self.trailheads[0]])
+        self.assertEqual(output['num_added'], 3)
+        self.assertEqual(set(DriveTimeMajorCity.objects.values_list(
+            'trailhead', flat=True)), {self.trailheads[0].pk})
+
+    def test_create_scoped_to_city(self):
+        output = updateTable.createNewDriveTimeEntries(
+                                cities=[self.cities[1].pk])
+        self.assertEqual(output['num_added'], 4)
+
+    @mock.patch("planner.PlannerUtils.accessAPI.googleMapsDistanceAPI",
+                side_effect=fake_distance_matrix)
+    def test_update_scoped_to_trailhead(self, api):
+        updateTable.createNewDriveTimeEntries()
+        output = updateTable.updateDriveTimeEntries(
+                    origin_type="trailhead",
+                    trailhead_ids=[self.trailheads[2].pk])
+        self.assertEqual(output['num_updated'], 3)
+        self.assertEqual(output['num_requests'], 1)
+        self.assertEqual(set(DriveTimeMajorCity.objects.filter(
+            api_call_status=DriveTimeMajorCity.OK).values_list(
+            'trailhead', flat=True)), {self.trailheads[2].pk})
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class DetailViewFanOutTest(TestCase):
+
+    def setUp(self):
+        user = User.objects.create_user("hiker", password="pw")
+        self.client.force_login(user)
+        self.trailhead = Trailhead.objects.create(name="Trailhead",
+                                                  latitude=40, longitude=-105)
+        Trailhead.objects.filter(pk=self.trailhead.pk).update(
+                                                    timezone="America/Denver")
+
+    @mock.patch.dict("os.environ",
+                     {"HIKEPLANNER_GOOGLE_MAPS_EMBED_API_KEY": "key"})
+    @mock.patch("planner.PlannerUtils.accessAPI.googleTimeZoneAPI",
+                return_value={"status": "OK", "dstOffset": 0,
+                              "rawOffset": -25200,
+                              "timeZoneName": "Mountain Standard Time"})
+    @mock.patch("planner.PlannerUtils.accessAPI.googleMapsDistanceAPI",
+                return_value={"status": "OK", "rows": [{"elements": [{
+                    "status": "OK",
+                    "distance": {"value": 1000, "text": "1 mi"},
+                    "duration": {"value": 60, "text": "1 min"}}]}]})
+    @mock.patch("planner.PlannerUtils.accessAPI.NOAA_API")
+    def test_slow_call_degrades_its_own_section(self, noaa, api, tz):
+        noaa.side_effect = (lambda url, session=None:
+                            time.sleep(1) or {"status": "OK"})
+        with self.settings(EXTERNAL_API_TIMEOUT=0.2):
+            start = time.monotonic()
+            response = self.client.get(reverse("trailhead-detail",
+                                               args=[self.trailhead.pk]))
+            elapsed = time.monotonic() - start
+
+        self.assertLess(elapsed, 1)
+        self.assertEqual(response.context["weather_by_day"], [])
+        self.assertEqual(response.context["sun_data"]["status"], "OK")
+        # time zone stored on the trailhead, no API call
+        self.assertFalse(tz.called)
+        self.assertEqual(response.context["directions_api_status"], "OK")
+
+
+def fake_noaa(requestURL, session=None):
+    """
+    Stand-in for accessAPI.NOAA_API: points within 0.1 degree share a grid
+    cell, forecasts expire in 10 minutes.
+    """
+    if "/points/" in requestURL:
+        lat, lon = (float(x) for x in requestURL.split("/points/")[1].split(","))
+        grid = "https://api.weather.gov/gridpoints/BOU/{0},{1}/forecast".format(
+                    int(lat * 10), int(-lon * 10))
+        return {"status": "OK", "message": "", "properties": {
+                    "gridId": "BOU", "gridX": int(lat * 10),
+                    "gridY": int(-lon * 10), "forecast": grid}}
+    return {"status": "OK", "message": "", "properties": {"periods": []},
+            "cache_control": "public, max-age=600", "expires": None}
+
+
+class ApiMetricsViewTest(TestCase):
+
+    def setUp(self):
+        circuitBreaker.resetBreakers()
+
+    def test_staff_only(self):
+        User.objects.create_user("hiker", password="pw")
+        self.client.login(username="hiker", password="pw")
+        response = self.client.get(reverse("api-metrics"))
+        self.assertEqual(response.status_code, 302)
+
+        User.objects.create_user("admin", password="pw", is_staff=True)
+        self.client.login(username="admin", password="pw")
+        response = self.client.get(reverse("api-metrics"))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b"external_api_request_seconds", response.content)
+
+    @mock.patch.dict("os.environ",
+                     {"HIKEPLANNER_GOOGLE_MAPS_EMBED_API_KEY": "key"})
+    @mock.patch("planner.PlannerUtils.apiMetrics.record")
+    @mock.patch("planner.PlannerUtils.accessAPI.httpClient.get",
+                side_effect=requests.exceptions.Timeout())
+    def test_calls_labelled_with_view(self, get, record):
+        labels = []
+        record.side_effect = (lambda *args:
+                              labels.append(apiMetrics.current_view.get()))
+        user = User.objects.create_user("hiker", password="pw")
+        self.client.force_login(user)
+        trailhead = Trailhead.objects.create(name="Trailhead", latitude=40,
+                                             longitude=-105)
+        with override_settings(CACHES=LOCMEM_CACHES):
+            self.client.get(reverse("trailhead-detail", args=[trailhead.pk]))
+        # including the directions and forecast calls on pool threads
+        self.assertGreaterEqual(len(labels), 2)
+        self.assertEqual(set(labels), {"trailhead-detail"})
+        self.assertIsNone(apiMetrics.current_view.get())
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ForecastCacheTest(TestCase):
+
+    def setUp(self):
+        forecastCache.clear()
+        forecastCache.resetStats()
+
+    @mock.patch("planner.PlannerUtils.accessAPI.NOAA_API",
+                side_effect=fake_noaa)
+    def test_nearby_points_share_grid_cell(self, api):
+        forecastCache.getForecast(40.01, -105.27)
+        forecastCache.getForecast(40.02, -105.28)
+        forecast_urls = [c[0][0] for c in api.call_args_list
+                         if "/gridpoints/" in c[0][0]]
+        self.assertEqual(len(forecast_urls), 1)
+
+        stats = forecastCache.getStats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+        self.assertEqual(stats['hit_ratio'], 0.5)
+        self.assertEqual(stats['forecasts'], 1)
+        self.assertEqual(stats['grid_cells'], 2)
+
+    @mock.patch("planner.PlannerUtils.accessAPI.NOAA_API",
+                side_effect=fake_noaa)
+    def test_repeat_lookup_served_from_cache(self, api):
+        forecastCache.getForecast(40.01, -105.27)
+        forecastCache.getForecast(40.01, -105.27)
+        # one point lookup and one forecast request
+        self.assertEqual(api.call_count, 2)
+
+    @mock.patch("planner.PlannerUtils.accessAPI.NOAA_API",
+                return_value={"status": "HTTP_ERROR", "message": "down"})
+    def test_errors_not_cached(self, api):
+        forecastCache.getForecast(40.01, -105.27)
+        forecastCache.getForecast(40.01, -105.27)
+        self.assertEqual(api.call_count, 2)
+
+    @mock.patch("planner.PlannerUtils.accessAPI.NOAA_API",
+                side_effect=fake_noaa)
+    def test_stores_forecast_by_day(self, api):
+        forecast = forecastCache.getForecast(40.01, -105.27)
+        self.assertEqual(forecast["status"], "OK")
+        self.assertEqual(forecast["by_day"], [])
+        self.assertAlmostEqual(forecast["expires_at"], time.time() + 600,
+                               delta=5)
+
+    @mock.patch("planner.PlannerUtils.accessAPI.NOAA_API",
+                side_effect=fake_noaa)
+    def test_prefetch_fetches_each_cell_once(self, api):
+        locations = [(40.01, -105.27), (40.02, -105.28), (39.51, -105.27),
+                     (40.01, -105.27)]
+        output = forecastCache.prefetchForecasts(locations, workers=2,
+                                                 requests_per_second=None)
+        self.assertEqual(output['num_cells'], 2)
+        self.assertEqual(output['num_fetched'], 2)
+        self.assertEqual(output['num_failed'], 0)
+
+        # page renders are cache reads
+        api.reset_mock()
+        forecastCache.getForecast(40.02, -105.28)
+        self.assertFalse(api.called)
+
+    @mock.patch("planner.PlannerUtils.accessAPI.NOAA_API",
+                side_effect=fake_noaa)
+    def test_prefetch_refreshes_stale_cells_only(self, api):
+        forecastCache.prefetchForecasts([(40.01, -105.27)],
+                                        requests_per_second=None)
+        output = forecastCache.prefetchForecasts([(40.01, -105.27),
+                                                  (39.51, -105.27)],
+                                                 requests_per_second=None,
+                                                 refresh_margin=60)
+        self.assertEqual((output['num_fetched'], output['num_fresh']), (1, 1))
+
+        # forecasts expire in 600 s, inside a 900 s refresh margin
+        output = forecastCache.prefetchForecasts([(40.01, -105.27)],
+                                                 requests_per_second=None,
+                                                 refresh_margin=900)
+        self.assertEqual((output['num_fetched'], output['num_fresh']), (1, 0))
+
+    @mock.patch("planner.PlannerUtils.accessAPI.NOAA_API",
+                return_value={"status": "HTTP_ERROR", "message": "down"})
+    def test_prefetch_reports_failures(self, api):
+        output = forecastCache.prefetchForecasts([(40.01, -105.27)],
+                                                 requests_per_second=None)
+        self.assertEqual(output['num_cells'], 0)
+        self.assertEqual(output['num_failed'], 1)
+
+    @mock.patch("planner.PlannerUtils.accessAPI.NOAA_API",
+                side_effect=fake_noaa)
+    def test_expired_forecast_served_while_refreshed(self, api):
+        fresh = forecastCache.getForecast(40.01, -105.27)
+        executor = mock.Mock()
+        with mock.patch.object(forecastCache, "_get_executor",
+                               return_value=executor), \
+                mock.patch("time.time", return_value=time.time() + 700):
+            stale = forecastCache.getForecast(40.01, -105.27)
+            forecastCache.getForecast(40.02, -105.28)
+        self.assertTrue(stale["stale"])
+        self.assertEqual(stale["by_day"], fresh["by_day"])
+        self.assertEqual(forecastCache.getStats()["stale"], 2)
+
+        # one refresh for the grid cell, run in the background
+        self.assertEqual(executor.submit.call_count, 1)
+        executor.submit.call_args[0][0]()
+        self.assertFalse(forecastCache.getForecast(40.01, -105.27)["stale"])
+        forecast_urls = [c[0][0] for c in api.call_args_list
+                         if "/gridpoints/" in c[0][0]]
+        self.assertEqual(len(forecast_urls), 2)
+
+    @mock.patch("planner.PlannerUtils.accessAPI.NOAA_API")
+    def test_concurrent_misses_share_one_request(self, api):
+        def slow_noaa(requestURL, session=None):
+            if "/gridpoints/" in requestURL:
+                time.sleep(0.2)
+            return fake_noaa(requestURL)
+        api.side_effect = slow_noaa
+        threads = [threading.Thread(target=forecastCache.getForecast,
+                                    args=(40.01, -105.27))
+                   for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        forecast_urls = [c[0][0] for c in api.call_args_list
+                         if "/gridpoints/" in c[0][0]]
+        self.assertEqual(len(forecast_urls), 1)
+
+    def test_ttl_from_headers(self):
+        now = datetime(2026, 10, 18, 12, 0, tzinfo=dt_timezone.utc)
+        self.assertEqual(forecastCache.getTTL(
+            {"cache_control": "public, max-age=1200"}), 1200)
+        self.assertEqual(forecastCache.getTTL(
+            {"expires": "Sun, 18 Oct 2026 12:30:00 GMT"}, now=now), 1800)
+        self.assertEqual(forecastCache.getTTL({"cache_control": "max-age=0"}),
+                         forecastCache.MIN_TTL)
+        self.assertEqual(forecastCache.getTTL({}), forecastCache.DEFAULT_TTL)
+
+
+class TimezoneFieldTest(TestCase):
+
+    @mock.patch("planner.PlannerUtils.timezones.lookupTimezone",
+                return_value="America/Denver")
+    def test_resolved_on_save(self, lookup):
+        trailhead = Trailhead.objects.create(name="Trailhead", latitude=40,
+                                             longitude=-105)
+        self.assertEqual(trailhead.timezone, "America/Denver")
+        lookup.assert_called_with(40, -105)
+
+    @mock.patch("planner.PlannerUtils.timezones.lookupTimezone",
+                return_value=None)
+    def test_unresolved_keeps_stored_zone(self, lookup):
+        trailhead = Trailhead(name="Trailhead", latitude=40, longitude=-105,
+                              timezone="America/Denver")
+        trailhead.save()
+        self.assertEqual(trailhead.timezone, "America/Denver")
+
+
+class SunTimesTableTest(TestCase):
+
+    def setUp(self):
+        self.trailhead = Trailhead.objects.create(name="Trailhead",
+                                                  latitude=40, longitude=-105)
+        self.no_zone = Trailhead.objects.create(name="Offshore",
+                                                latitude=0, longitude=-140)
+        Trailhead.objects.filter(pk=self.trailhead.pk).update(
+                                                    timezone="America/Denver")
+        Trailhead.objects.filter(pk=self.no_zone.pk).update(timezone="")
+        self.trailhead.refresh_from_db()
+        self.no_zone.refresh_from_db()
+        self.start = date(2018, 7, 1)
+
+    def test_fill_adds_missing_days_once(self):
+        output = sunTimesTable.fillSunTimes(days=7, start=self.start)
+        self.assertEqual(output['num_added'], 7)
+        self.assertEqual(output['num_skipped'], 1)
+
+        output = sunTimesTable.fillSunTimes(days=10, start=self.start)
+        self.assertEqual(output['num_added'], 3)
+        self.assertEqual(self.trailhead.sun_times.count(), 10)
+
+    def test_rows_in_local_time(self):
+        sunTimesTable.fillSunTimes(days=1, start=self.start)
+        row = self.trailhead.sun_times.get()
+        self.assertEqual(row.timezone, "MDT")
+        # local sunrise in Colorado in July is around 5:30 AM
+        self.assertEqual(row.sunrise.hour, 5)
+        self.assertEqual(row.sunset.hour, 20)
+
+    def test_get_sun_data_reads_single_row(self):
+        sunTimesTable.fillSunTimes(days=1, start=self.start)
+        with self.assertNumQueries(1):
+            sun_data = sunTimesTable.getSunData(self.trailhead, self.start)
+        self.assertEqual(sun_data["status"], "OK")
+        self.assertEqual(sun_data["timezone"], "MDT")
+
+    def test_get_sun_data_fills_missing_row(self):
+        sun_data = sunTimesTable.getSunData(self.trailhead, self.start)
+        self.assertEqual(sun_data["status"], "OK")
+        self.assertTrue(self.trailhead.sun_times.filter(
+                            date=self.start).exists())
+
+    def test_prune_past_days(self):
+        today = timezone.localdate()
+        sunTimesTable.fillSunTimes(days=5, start=today - timedelta(days=3))
+        deleted = sunTimesTable.pruneSunTimes(keep_days=1)
+        self.assertEqual(deleted, 2)
+        self.assertEqual(self.trailhead.sun_times.earliest('date').date,
+                         today - timedelta(days=1))
+
+    def test_fill_queries_only_given_locations(self):
+        sunTimesTable.fillSunTimes(days=1, start=self.start)
+        with CaptureQueriesContext(connection) as queries:
+            sunTimesTable.fillSunTimes(days=1, start=self.start,
+                                       locations=[self.trailhead])
+        select = [query['sql'] for query in queries
+                  if "planner_suntimes" in query['sql']][0]
+        self.assertIn('"object_id" IN', select)
+
+    def test_moved_location_rows_reset(self):
+        sunTimesTable.fillSunTimes(days=3, start=self.start)
+        self.trailhead.name = "Renamed"
+        self.trailhead.save()
+        self.assertEqual(self.trailhead.sun_times.count(), 3)
+
+        self.trailhead.latitude = 41
+        self.trailhead.save()
+        self.assertFalse(self.trailhead.sun_times.exists())
+
+
+class RouteSearchTest(TestCase):
+
+    def setUp(self):
+        self.city = MajorCity.objects.create(name="Denver", latitude=39.7,
+                                             longitude=-105)
+        self.trailheads = [Trailhead.objects.create(
+                                name="Trailhead {0}".format(i),
+                                latitude=40 + i, longitude=-105)
+                           for i in range(2)]
+        self.destination = Destination.objects.create(
+                                name="Peak", latitude=40.1, longitude=-105,
+                                elevation=14000,
+                                dest_type=Destination.MOUNTAIN)
+        self.routes = [Route.objects.create(
+                            name="Route {0}".format(i), total_distance=5 + i,
+                            gain=3000, path_seq=Route.OUT_AND_BACK,
+                            class_rating=2, trailhead=trailhead,
+                            destination=self.destination)
+                       for i, trailhead in enumerate(self.trailheads)]
+
+    def set_drive_time(self, trailhead, drive_time):
+        DriveTimeMajorCity.objects.create(
+            trailhead=trailhead, majorcity=self.city, drive_time=drive_time,
+            drive_distance=drive_time * 20,
+            api_call_status=DriveTimeMajorCity.OK)
+
+    def test_rows_follow_drive_times(self):
+        self.assertFalse(RouteSearch.objects.exists())
+        self.set_drive_time(self.trailheads[0], 3600)
+        row = RouteSearch.objects.get()
+        self.assertEqual((row.route, row.majorcity), (self.routes[0],
+                                                      self.city))
+        self.assertEqual(row.destination_name, "Peak")
+        self.assertEqual(row.drive_time, 3600)
+
+        DriveTimeMajorCity.objects.filter(
+            trailhead=self.trailheads[0]).get().delete()
+        self.assertFalse(RouteSearch.objects.exists())
+
+    def test_rows_follow_route_and_destination_edits(self):
+        self.set_drive_time(self.trailheads[0], 3600)
+        self.set_drive_time(self.trailheads[1], 1800)
+
+        route = self.routes[0]
+        route.trailhead = self.trailheads[1]
+        route.gain = 4000
+        route.save()
+        row = RouteSearch.objects.get(route=route)
+        self.assertEqual((row.gain, row.drive_time), (4000, 1800))
+
+        self.destination.name = "Summit"
+        self.destination.save()
+        self.assertEqual(set(RouteSearch.objects.values_list(
+            'destination_name', flat=True)), {"Summit"})
+
+        self.trailheads[1].delete()
+        self.assertFalse(RouteSearch.objects.exists())
+
+    @mock.patch("planner.PlannerUtils.accessAPI.googleMapsDistanceAPI",
+                side_effect=fake_distance_matrix)
+    def test_bulk_drive_time_update_refreshes_rows(self, api):
+        updateTable.createNewDriveTimeEntries()
+        self.assertFalse(RouteSearch.objects.exists())
+        updateTable.updateDriveTimeEntries(use_cache=False)
+        self.assertEqual(RouteSearch.objects.count(), 2)
+
+    def test_refresh_pairs_only(self):
+        self.set_drive_time(self.trailheads[0], 3600)
+        self.set_drive_time(self.trailheads[1], 1800)
+        DriveTimeMajorCity.objects.update(drive_time=60)
+
+        pair = (self.trailheads[0].pk, self.city.pk)
+        self.assertEqual(RouteSearch.refresh(pairs=[pair]), 1)
+        self.assertEqual(dict(RouteSearch.objects.values_list(
+                            'trailhead', 'drive_time')),
+                         {self.trailheads[0].pk: 60,
+                          self.trailheads[1].pk: 1800})
+        self.assertEqual(RouteSearch.refresh(pairs=[]), 0)
+        self.assertEqual(RouteSearch.objects.count(), 2)
+
+    def test_search_view(self):
+        self.set_drive_time(self.trailheads[0], 3600)
+        self.set_drive_time(self.trailheads[1], 1800)
+        user = User.objects.create_user("hiker", password="pw")
+        user.profile.nearest_city = self.city
+        user.profile.save()
+        self.client.force_login(user)
+
+        response = self.client.get(reverse("destination-search"),
+                                   {"max_drive_time": 45, "dest_type": "m"})
+        self.assertEqual([row.route for row in response.context["route_list"]],
+                         [self.routes[1]])
+        self.assertContains(response, self.routes[1].get_absolute_url())
+
+        response = self.client.get(reverse("destination-search"))
+        self.assertEqual([row.route for row in response.context["route_list"]],
+                         [self.routes[1], self.routes[0]])
+
+
+class SearchIndexTest(TestCase):
+
+    def test_partial_drive_time_index(self):
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(
+                            cursor, DriveTimeMajorCity._meta.db_table)
+        self.assertEqual(constraints['planner_dtmc_ok_city_time_idx']
+                         ['columns'], ['majorcity_id', 'drive_time'])
+
+    def test_explain_search_uses_city_index(self):
+        MajorCity.objects.create(name="Denver", latitude=39.7,
+                                 longitude=-105)
+        out = StringIO()
+        call_command("explain_search", stdout=out)
+        plans = out.getvalue()
+        self.assertIn("=== max_drive_time=90", plans)
+        if connection.vendor == "sqlite":
+            self.assertIn("planner_rou_majorci", plans)
+
+
+class KeysetPaginationTest(TestCase):
+
+    def setUp(self):
+        # duplicate names: the id breaks ties
+        self.destinations = [Destination.objects.create(
+                                name="Peak {0}".format(i // 2), latitude=40,
+                                longitude=-105, elevation=14000,
+                                dest_type=Destination.MOUNTAIN)
+                             for i in range(7)]
+        self.fields = ["name", "id"]
+
+    def page(self, cursor=None):
+        return keysetPagination.paginateKeyset(Destination.objects.all(),
+                                               self.fields, 3, cursor)
+
+    def test_pages_forward_and_back(self):
+        pages = [self.page()]
+        while pages[-1]['next_cursor']:
+            pages.append(self.page(pages[-1]['next_cursor']))
+        self.assertEqual([row for page in pages
+                          for row in page['object_list']], self.destinations)
+        self.assertEqual([len(page['object_list']) for page in pages],
+                         [3, 3, 1])
+        self.assertIsNone(pages[0]['previous_cursor'])
+
+        back = self.page(pages[2]['previous_cursor'])
+        self.assertEqual(back['object_list'], pages[1]['object_list'])
+        back = self.page(back['previous_cursor'])
+        self.assertEqual(back['object_list'], pages[0]['object_list'])
+        self.assertIsNone(back['previous_cursor'])
+        self.assertEqual(back['next_cursor'], pages[0]['next_cursor'])
+
+    def test_deep_page_query_has_no_offset(self):
+        cursor = self.page()['next_cursor']
+        with CaptureQueriesContext(connection) as queries:
+            self.page(cursor)
+        self.assertNotIn("OFFSET", queries[0]['sql'].upper())
+
+    def test_invalid_cursor_returns_first_page(self):
+        self.assertEqual(self.page("tampered")['object_list'],
+                         self.destinations[:3])
+
+    def test_list_view_links(self):
+        user = User.objects.create_user("hiker", password="pw")
+        self.client.force_login(user)
+        with mock.patch("planner.views.DestinationListView.paginate_by", 3):
+            response = self.client.get(reverse("destination-list"),
+                                       {"dest_name": "Peak"})
+            self.assertEqual(list(response.context["destination_list"]),
+                             self.destinations[:3])
+            next_url = response.context["next_page_url"]
+            self.assertIn("dest_name=Peak", next_url)
+
+            response = self.client.get(reverse("destination-list") +
+                                       next_url)
+        self.assertEqual(list(response.context["destination_list"]),
+                         self.destinations[3:6])
+        self.assertIsNotNone(response.context["previous_page_url"])
+
+
+class NameSearchTest(TestCase):
+
+    def setUp(self):
+        nameIndex.resetIndexes()
+        self.names = ["Mount Elbert", "Elbert", "Elbert Ridge",
+                      "Mount Massive", "Gelberta Peak"]
+        for name in self.names:
+            Destination.objects.create(name=name, latitude=40,
+                                       longitude=-105, elevation=14000,
+                                       dest_type=Destination.MOUNTAIN)
+
+    def search(self, q):
+        return [dest.name for dest in nameSearch.filterNames(
+                    Destination.objects.order_by("name"), q)]
+
+    def test_filter_matches_icontains(self):
+        for q in ["elb", "ELBERT", "t M", "ou", "ridge", "xyz", 'a"b']:
+            self.assertEqual(
+                set(nameSearch.filterNames(Destination.objects.all(), q)),
+                set(Destination.objects.filter(name__icontains=q)), q)
+
+    def test_sync_with_renames_and_deletes(self):
+        dest = Destination.objects.get(name="Mount Massive")
+        dest.name = "Massive Mountain"
+        dest.save()
+        self.assertEqual(self.search("massive"), ["Massive Mountain"])
+        dest.delete()
+        self.assertEqual(self.search("massive"), [])
+
+    def test_sqlite_uses_fts_index(self):
+        if connection.vendor != "sqlite":
+            self.skipTest("FTS5 index is the SQLite backend")
+        with CaptureQueriesContext(connection) as queries:
+            self.search("elbert")
+        self.assertIn("planner_destination_name_fts MATCH",
+                      queries[-1]['sql'])
+
+    def test_autocomplete_ranks_matches(self):
+        user = User.objects.create_user("hiker", password="pw")
+        self.client.force_login(user)
+        response = self.client.get(reverse("destination-autocomplete"),
+                                   {"q": "elbert"})
+        self.assertEqual([result["text"] for result in
+                          response.json()["results"]][:2],
+                         ["Elbert", "Elbert Ridge"])
+
+
+class NameIndexTest(TestCase):
+
+    def setUp(self):
+        nameIndex.resetIndexes()
+        self.destinations = [Destination.objects.create(
+                                name="Peak {0:02d}".format(i), latitude=40,
+                                longitude=-105, elevation=14000,
+                                dest_type=Destination.MOUNTAIN)
+                             for i in range(25)]
+        user = User.objects.create_user("hiker", password="pw")
+        self.client.force_login(user)
+
+    def autocomplete(self, **params):
+        response = self.client.get(reverse("destination-autocomplete"),
+                                   params)
+        return response.json()
+
+    def test_no_query_once_built(self):
+        self.autocomplete(q="peak")
+        with CaptureQueriesContext(connection) as queries:
+            data = self.autocomplete(q="peak 1")
+        self.assertFalse([query for query in queries
+                          if "planner_destination" in query['sql']])
+        self.assertEqual([result["text"] for result in data["results"]],
+                         ["Peak {0:02d}".format(i) for i in range(10, 20)])
+        self.assertEqual(data["results"][0]["id"],
+                         str(self.destinations[10].pk))
+
+    def test_saves_and_deletes_invalidate(self):
+        self.assertEqual(self.autocomplete(q="summit")["results"], [])
+        self.destinations[0].name = "Summit"
+        self.destinations[0].save()
+        self.assertEqual([result["text"] for result in
+                          self.autocomplete(q="summit")["results"]],
+                         ["Summit"])
+        self.destinations[0].delete()
+        self.assertEqual(self.autocomplete(q="summit")["results"], [])
+
+    def test_pages(self):
+        first = self.autocomplete(q="peak")
+        self.assertTrue(first["pagination"]["more"])
+        last = self.autocomplete(q="peak", page=3)
+        self.assertFalse(last["pagination"]["more"])
+        self.assertEqual([result["text"] for result in last["results"]],
+                         ["Peak {0:02d}".format(i) for i in range(20, 25)])
+
+    def test_max_age(self):
+        self.autocomplete(q="peak")
+        Destination.objects.filter(pk=self.destinations[0].pk).update(
+            name="Summit")
+        self.assertEqual(self.autocomplete(q="summit")["results"], [])
+        with override_settings(NAME_INDEX_MAX_AGE=0):
+            self.assertEqual(len(self.autocomplete(q="summit")["results"]),
+                             1)
+
+    def test_version_shared_through_database(self):
+        self.autocomplete(q="peak")
+        version = NameIndexVersion.current(Destination)
+        # a save in another worker: only the database row changes
+        NameIndexVersion.objects.filter(label="planner.Destination").update(
+            version=version + 1)
+        Destination.objects.filter(pk=self.destinations[0].pk).update(
+            name="Summit")
+        self.assertEqual(len(self.autocomplete(q="summit")["results"]), 1)
+
+    def test_anonymous_gets_no_results(self):
+        self.client.logout()
+        self.assertEqual(self.autocomplete(q="peak")["results"], [])
@@ -104,4 +104,7 @@ urlpatterns = [
 
     # Permission denied view
     path('permission_denied', views.perm_denied, name='permission-denied'),
+
+    # External API call metrics (staff only)
+    path('metrics/', views.api_metrics, name='api-metrics'),
 ]
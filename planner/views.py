@@ -1,15 +1,22 @@
 from django.shortcuts import render, redirect
+from django.http import HttpResponse
 from django.views import generic
 from django.urls import reverse, reverse_lazy
 from django.contrib.auth.decorators import login_required, permission_required
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.mixins import LoginRequiredMixin, PermissionRequiredMixin
 from django.contrib.auth.models import User
 from django.views.generic.edit import CreateView, DeleteView, UpdateView
 from dal import autocomplete
 from .models import Destination, Route, Trailhead, Profile, GoverningBody
 from .models import Link, DestinationLink, RouteLink
-from django.db.models import F
-from .models import Jurisdiction, DriveTimeMajorCity
+from django.db.models import OuterRef, Subquery
+from django.contrib.contenttypes.models import ContentType
+from django.utils import timezone
+from datetime import datetime
+from datetime import timezone as dt_timezone
+from .models import Jurisdiction, DriveTimeMajorCity, DriveTimeJob, SunTimes
+from .models import RouteSearch
 from .forms import UserForm, ProfileForm, TrailheadForm, DestinationSearchForm
 from .forms import DestinationForm
 from .forms import RouteForm, RouteInDestComboForm, RouteMainComboForm
@@ -18,9 +25,14 @@ from .forms import LinkBaseForm
 from .PlannerUtils import constructURL
 from .PlannerUtils import accessAPI
 from .PlannerUtils import parseAPI
-from .PlannerUtils import updateTable
 from .PlannerUtils import conversions
-from .PlannerUtils import quickAPI
+from .PlannerUtils import concurrentFetch
+from .PlannerUtils import forecastCache
+from .PlannerUtils import sunTimesTable
+from .PlannerUtils import apiMetrics
+from .PlannerUtils import keysetPagination
+from .PlannerUtils import nameSearch
+from .PlannerUtils import nameIndex
 
 
 # Create your views here.
@@ -32,91 +44,170 @@ def home_view(request):
 def perm_denied(request):
     return render(request, 'planner/denied_permission.html')
 
+
+@staff_member_required
+def api_metrics(request):
+    # external API call metrics of this process, Prometheus text format
+    return HttpResponse(apiMetrics.renderPrometheus(),
+                        content_type="text/plain; version=0.0.4")
+
+def _weather_freshness(forecast):
+    """
+    Returns the context for the "updated ... ago" note of a forecastCache
+    forecast: 'weather_updated' (aware datetime, None if unknown) and
+    'weather_stale' (True while an expired forecast is being refreshed).
+    """
+    fetched_at = forecast.get('fetched_at')
+    if fetched_at is not None:
+        fetched_at = datetime.fromtimestamp(fetched_at, tz=dt_timezone.utc)
+    return {'weather_updated': fetched_at,
+            'weather_stale': forecast.get('stale', False)}
+
+# -------- Keyset pagination for list views ---------------
+class KeysetPaginationMixin:
+    """
+    Paginates a ListView by keyset (keysetPagination) instead of OFFSET.
+    Inheriting views set "keyset_fields", the ordering of the list ending
+    with a unique field. The context gets "next_page_url" and
+    "previous_page_url" (None at the ends of the list), which keep the
+    other GET parameters.
+    """
+    paginate_by = 25
+    keyset_fields = ('name', 'id')
+    cursor_param = 'cursor'
+
+    def paginate_queryset(self, queryset, page_size):
+        page = keysetPagination.paginateKeyset(
+                    queryset, self.keyset_fields, page_size,
+                    self.request.GET.get(self.cursor_param))
+        self.next_cursor = page['next_cursor']
+        self.previous_cursor = page['previous_cursor']
+        is_paginated = (self.next_cursor is not None or
+                        self.previous_cursor is not None)
+        return (None, None, page['object_list'], is_paginated)
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['next_page_url'] = self._page_url(self.next_cursor)
+        context['previous_page_url'] = self._page_url(self.previous_cursor)
+        return context
+
+    def _page_url(self, cursor):
+        if cursor is None:
+            return None
+        params = self.request.GET.copy()
+        params[self.cursor_param] = cursor
+        return "?" + params.urlencode()
+
 # -------- Parent Autocomplete class ---------------
 class BaseSelectAutocomplete(autocomplete.Select2QuerySetView):
     """
     Base class to create 'select' autocomplete views.
     Inheriting models MUST implement an instance attribute "self.model", which
     is a Model class defined in "models.py".
+
+    Results are {'id', 'name'} dicts from the model's in-memory name index
+    (PlannerUtils.nameIndex), best matches first.
     """
 
     def get_queryset(self):
         if not self.request.user.is_authenticated:
             # do not return results for non-logged in visitors
-            return self.model.objects.none()
+            return []
+
+        # the matches up to the requested page, and one more to tell
+        # whether there is a next page
+        try:
+            page = max(int(self.request.GET.get(self.page_kwarg, 1)), 1)
+        except ValueError:
+            page = 1
+        limit = page * self.paginate_by + 1
 
-        # get all objects first
-        qs = self.model.objects.all()
+        return nameIndex.searchNames(self.model, self.q, limit)
 
-        # filter if values are present
-        if self.q:
-            qs = qs.filter(name__icontains=self.q)
+    def get_result_value(self, result):
+        return str(result["id"])
 
-        return qs
+    def get_result_label(self, result):
+        return result["name"]
 
 
 # -------- Destination views ------------------------
-class DestinationListView(LoginRequiredMixin, generic.ListView):
+class DestinationListView(LoginRequiredMixin, KeysetPaginationMixin,
+                          generic.ListView):
     model = Destination
 
     def get_queryset(self):
         dest_name = self.request.GET.get("dest_name", "")
         if dest_name:
-            return Destination.objects.filter(name__icontains=dest_name)
+            return nameSearch.filterNames(Destination.objects.all(),
+                                          dest_name)
         else:
             return Destination.objects.all()
 
 
 
-class DestinationSearchView(LoginRequiredMixin, generic.ListView):
+class DestinationSearchView(LoginRequiredMixin, KeysetPaginationMixin,
+                            generic.ListView):
     """
     This is the main destination search view. It finds destinations based on
     the location of the starting trailhead.
-    It starts from the DTMC model, searching through foreign keys:
-    DTMC --> Trailhead --> Route --> Destination
+    It searches the denormalized RouteSearch table (one row per route and
+    major city), so a search reads a single table in drive time order.
     """
-    model = Route
+    model = RouteSearch
+    context_object_name = 'route_list'
+    keyset_fields = ('drive_time', 'route_id')
     search_form_class = DestinationSearchForm
     template_name = 'planner/destination_search_list.html'
 
     def get_queryset(self):
+        return self.search_queryset(self.request.user.profile.nearest_city,
+                                    self.request.GET)
 
+    @classmethod
+    def search_queryset(cls, majorcity, params):
+        """
+        Returns the search results for drive times from "majorcity" filtered
+        by the search form GET parameters "params" (also used by the
+        explain_search command).
+        """
         # Get base set of routes before user filters (routes with valid
         # drive times from the user's selected closest major city)
-
-        # set up base query for Route object
         base_query = {
-            "trailhead__drive_data__api_call_status": DriveTimeMajorCity.OK,
-            "trailhead__drive_data__majorcity": self.request.user.profile.nearest_city,
+            "majorcity": majorcity,
             }
 
         # compile all query filters based on user input
-        all_query = self._get_all_filter_kwargs(base_query)
+        all_query = cls._get_all_filter_kwargs(params, base_query)
 
-        # get queryset in single filter request to ensure ManyToMany are
-        # occuring at the same time as "AND" requests:
-        # https://docs.djangoproject.com/en/2.1/topics/db/queries/#spanning-multi-valued-relationships
-        valid_routes = Route.objects.filter(**all_query)
+        valid_routes = RouteSearch.objects.filter(**all_query)
 
         # # ----- Order data by increasing drive time ---------
-        valid_routes = valid_routes.order_by("trailhead__drive_data__drive_time")
-        # select related (prefetch) destination data, and annotate data
-        valid_routes = valid_routes.select_related("destination").annotate(
-                trailhead_drive_time=F("trailhead__drive_data__drive_time"),
-                trailhead_drive_distance=F("trailhead__drive_data__drive_distance")
-                )
+        # (route_id breaks ties for keyset pagination)
+        valid_routes = valid_routes.order_by("drive_time", "route_id")
+
+        # add today's daylight at the destination from the SunTimes table
+        daylight = SunTimes.objects.filter(
+                content_type=ContentType.objects.get_for_model(Destination),
+                object_id=OuterRef("destination_id"),
+                date=timezone.localdate()).values("day_length")[:1]
+        valid_routes = valid_routes.annotate(
+                destination_day_length=Subquery(daylight))
 
         # return final queryset
         queryset = valid_routes
 
         return queryset
 
-    def _get_all_filter_kwargs(self, base_kwargs=None):
+    @staticmethod
+    def _get_all_filter_kwargs(params, base_kwargs=None):
         """
         Utility function to get user filter GET parameters and return as dict
         for kwarg inputs to QuerySet.filter(). Adds them to input dict
 
         INPUTS:
+        params [QueryDict or dict] --> search form GET parameters
         base_kwargs [dict] (OPTIONAL) --> base QuerySet to add to. Otherwise creates a new dictionary.
 
         OUTPUT:
@@ -127,14 +218,14 @@ class DestinationSearchView(LoginRequiredMixin, generic.ListView):
         else:
             out_dict = base_kwargs
 
-        for param in self.request.GET:
-            value = self.request.GET[param]
+        for param in params:
+            value = params[param]
             # only search on non-empty parameters from form request
             if value != "":
                 # apply applicable filters based on parameter
                 # print("filter param: {0}, value: {1}".format(param, value))
                 if param == "dest_name":
-                    out_dict["destination__name__icontains"] = value
+                    out_dict["destination_name__icontains"] = value
                 elif param == "min_length":
                     out_dict["total_distance__gte"] = float(value)
                 elif param == "max_length":
@@ -148,12 +239,12 @@ class DestinationSearchView(LoginRequiredMixin, generic.ListView):
                 elif param == "max_class":
                     out_dict["class_rating__lte"] = int(value)
                 elif param == "max_drive_distance":
-                    out_dict["trailhead__drive_data__drive_distance__lte"] = conversions.miles_to_m(float(value))
+                    out_dict["drive_distance__lte"] = conversions.miles_to_m(float(value))
                 elif param == "max_drive_time":
                     # Template filter truncates the minute level, so set cutoff of the database search at the next minute
-                    out_dict["trailhead__drive_data__drive_time__lte"] = conversions.min_to_sec(float(value)+1)
+                    out_dict["drive_time__lte"] = conversions.min_to_sec(float(value)+1)
                 elif param == "dest_type":
-                    out_dict["destination__dest_type__exact"] = value
+                    out_dict["dest_type__exact"] = value
                 elif param == "path_seq":
                     out_dict["path_seq__exact"] = value
 
@@ -173,15 +264,18 @@ class DestinationDetailView(LoginRequiredMixin, generic.DetailView):
         # Call the base implementation first to get a context
         context = super().get_context_data(**kwargs)
 
-        # call NOAA forecast API
+        # get NOAA forecast (cached)
         noaa_api_url = self.object.noaa_api_url
         context['noaa_api_url'] = noaa_api_url
-        weather_raw_data = accessAPI.NOAA_API(noaa_api_url)
-        weather_data_by_day = parseAPI.NOAA_by_day(weather_raw_data)
-        context['weather_by_day'] = weather_data_by_day
+        api_data = concurrentFetch.fetchAll({
+            'weather': (forecastCache.getForecast, self.object.latitude, self.object.longitude),
+        })
+
+        context['weather_by_day'] = api_data['weather'].get('by_day', [])
+        context.update(_weather_freshness(api_data['weather']))
 
         # get sunrise and sunset times
-        context['sun_data'] = quickAPI.sunTimeData(self.object.latitude, self.object.longitude)
+        context['sun_data'] = sunTimesTable.getSunData(self.object)
 
         # get links
         context['public_links'] = DestinationLink.objects.filter(owner_model=self.object, link_type=Link.PUBLIC)
@@ -256,10 +350,8 @@ def _destination_route_trailhead_create_combo(request, useDestForm, template):
                 new_th = trailhead_form.save()
                 # add new trailhead to route
                 new_route.trailhead = new_th
-                # trigger major city drive time table row create function
-                updateTable.createNewDriveTimeEntries()
-                # trigger calculation of new drive times into database
-                updateTable.updateDriveTimeEntries(origin_type="trailhead")
+                # queue calculation of new drive times into database
+                DriveTimeJob.enqueue(new_th)
 
             # if using existing trailhead, already in form object from request
             new_route.save()
@@ -330,15 +422,17 @@ class DestinationAutocomplete(BaseSelectAutocomplete):
 
 
 # ------- Route views ------------------------------
-class RouteListView(LoginRequiredMixin, generic.ListView):
+class RouteListView(LoginRequiredMixin, KeysetPaginationMixin,
+                    generic.ListView):
     model = Route
 
     def get_queryset(self):
         route_name = self.request.GET.get("route_name", "")
+        routes = Route.objects.select_related("destination")
         if route_name:
-            return Route.objects.filter(name__icontains=route_name)
+            return nameSearch.filterNames(routes, route_name)
         else:
-            return Route.objects.all()
+            return routes
 
 
 class RouteDetailView(LoginRequiredMixin, generic.DetailView):
@@ -348,8 +442,15 @@ class RouteDetailView(LoginRequiredMixin, generic.DetailView):
         # Call the base implementation first to get a context
         context = super().get_context_data(**kwargs)
 
+        # get NOAA forecast (cached)
+        noaa_api_url = self.object.destination.noaa_api_url
+        context['noaa_api_url'] = noaa_api_url
+        api_data = concurrentFetch.fetchAll({
+            'weather': (forecastCache.getForecast, self.object.destination.latitude, self.object.destination.longitude),
+        })
+
         # get sunrise and sunset times
-        context['sun_data'] = quickAPI.sunTimeData(self.object.destination.latitude, self.object.destination.longitude)
+        context['sun_data'] = sunTimesTable.getSunData(self.object.destination)
 
         # get Google Maps directions URL
         origin = self.request.user.profile.full_address
@@ -358,12 +459,9 @@ class RouteDetailView(LoginRequiredMixin, generic.DetailView):
 
         context['directions_external_url'] = constructURL.googleMapsDirectionsExternal(origin, destination)
 
-        # call NOAA forecast API
-        noaa_api_url = self.object.destination.noaa_api_url
-        context['noaa_api_url'] = noaa_api_url
-        weather_raw_data = accessAPI.NOAA_API(noaa_api_url)
-        weather_data_by_day = parseAPI.NOAA_by_day(weather_raw_data)
-        context['weather_by_day'] = weather_data_by_day
+        # NOAA forecast
+        context['weather_by_day'] = api_data['weather'].get('by_day', [])
+        context.update(_weather_freshness(api_data['weather']))
 
         # get generic drive time data
         if (self.request.user.is_authenticated
@@ -442,9 +540,6 @@ class TrailheadDetailView(LoginRequiredMixin, generic.DetailView):
         # Call the base implementation first to get a context
         context = super().get_context_data(**kwargs)
 
-        # get sunrise and sunset times
-        context['sun_data'] = quickAPI.sunTimeData(self.object.latitude, self.object.longitude)
-
         # get Google Maps directions URL
         origin = self.request.user.profile.full_address
         destination = str(self.object.latitude) + "," + str(self.object.longitude)
@@ -454,9 +549,19 @@ class TrailheadDetailView(LoginRequiredMixin, generic.DetailView):
         directions_api_url = constructURL.googleMapsDistanceAPI(origin, destination)
         context['directions_api_url'] = directions_api_url
 
-        # call Google Distance Matrix API and parse results
-        distRawData = accessAPI.googleMapsDistanceAPI(directions_api_url)
-        distData = parseAPI.unpackDriveProperties(distRawData)
+        # call Google Distance Matrix and NOAA forecast APIs concurrently
+        noaa_api_url = self.object.noaa_api_url
+        context['noaa_api_url'] = noaa_api_url
+        api_data = concurrentFetch.fetchAll({
+            'directions': (accessAPI.googleMapsDistanceAPI, directions_api_url),
+            'weather': (forecastCache.getForecast, self.object.latitude, self.object.longitude),
+        })
+
+        # get sunrise and sunset times
+        context['sun_data'] = sunTimesTable.getSunData(self.object)
+
+        # parse Google Distance Matrix API results
+        distData = parseAPI.unpackDriveProperties(api_data['directions'])
 
         context['directions_api_status'] = distData["APIStatus"]
         context['directions_api_message'] = distData["APIMessage"]
@@ -484,12 +589,12 @@ class TrailheadDetailView(LoginRequiredMixin, generic.DetailView):
         else:
             context['general_drive_flag'] = False
 
-        # call NOAA forecast API
-        noaa_api_url = self.object.noaa_api_url
-        context['noaa_api_url'] = noaa_api_url
-        weather_raw_data = accessAPI.NOAA_API(noaa_api_url)
-        weather_data_by_day = parseAPI.NOAA_by_day(weather_raw_data)
-        context['weather_by_day'] = weather_data_by_day
+        # drive times are still being calculated by the background worker
+        context['drive_data_pending'] = DriveTimeJob.is_pending(self.object)
+
+        # NOAA forecast
+        context['weather_by_day'] = api_data['weather'].get('by_day', [])
+        context.update(_weather_freshness(api_data['weather']))
 
         return context
 
@@ -506,10 +611,8 @@ class TrailheadCreate(LoginRequiredMixin, PermissionRequiredMixin, CreateView):
     def form_valid(self, form):
         # save TH to database
         th = form.save()
-        # trigger major city drive time table row create function
-        updateTable.createNewDriveTimeEntries()
-        # trigger calculation of new drive times into database
-        updateTable.updateDriveTimeEntries(origin_type="trailhead")
+        # queue calculation of new drive times into database
+        DriveTimeJob.enqueue(th)
         # redirect to newly-created trailhead detail page
         return redirect(reverse('trailhead-detail',
                                             args=[str(th.pk)]))
@@ -529,9 +632,11 @@ class TrailheadUpdate(LoginRequiredMixin, PermissionRequiredMixin, UpdateView):
         # check if lat or lon have changed from update
         if (th.latitude != lat_old or th.longitude != lon_old):
             # set all instances with this trailhead as a new entry
-            DriveTimeMajorCity.objects.filter(trailhead=self.get_object()).update(api_call_status=DriveTimeMajorCity.NEW_ITEM)
-            # trigger calculation of new drive times into database
-            updateTable.updateDriveTimeEntries()
+            DriveTimeMajorCity.objects.filter(trailhead=self.get_object()).update(api_call_status=DriveTimeMajorCity.NEW_ITEM, attempt_count=0, next_attempt_date=None)
+            # drop its search rows until the drive times are calculated
+            RouteSearch.refresh(trailheads=[th.pk])
+            # queue calculation of new drive times into database
+            DriveTimeJob.enqueue(th)
         # redirect to newly-created trailhead detail page
         return redirect(self.get_object().get_absolute_url())
 